@@ -2,22 +2,47 @@
 for different exchanges."""
 
 from __future__ import annotations
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Union, Iterator, TYPE_CHECKING
 import json
+import time
 from types import SimpleNamespace
 from . import utils
-import requests
+from ._store import FilingStore
+from ._shards import ShardRouter, ShardedFilingStore
+from ._coverage import CoverageIndex
+from ._validation import InvalidDocumentError, check_response, is_valid_pdf
+from ._breaker import CircuitOpenError
 import sqlite3
-import PyPDF2
-from bs4 import BeautifulSoup as bs
-import html
 import io
 from abc import ABC, abstractmethod
 import re, os
-import pandas as pd
-from itertools import chain
+from itertools import chain, count
+from collections import deque
+import heapq
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+    from ._extraction_cache import ExtractionCache
+    from ._dedup import DuplicateIndex
+
+# heavy dependencies are only imported on the code paths that use them
+requests = utils.LazyModule('requests')
+PyPDF2 = utils.LazyModule('PyPDF2')
+pd = utils.LazyModule('pandas')
+_transport = utils.LazyModule(f"{__package__}._transport")
+# and so are the parts of the package only some code paths need
+html = utils.LazyModule('html')
+_html_text = utils.LazyModule(f"{__package__}._html_text")
+_extraction_cache = utils.LazyModule(f"{__package__}._extraction_cache")
+_chinese = utils.LazyModule(f"{__package__}._chinese")
+_dedup = utils.LazyModule(f"{__package__}._dedup")
+_ranged = utils.LazyModule(f"{__package__}._ranged")
+
+# bump these whenever the text an extractor produces changes, so that
+# stale entries in the extraction cache are no longer hit
+extractor_versions = {'pdf': '2', 'html': '2'}
 
 class AbstractScraper(ABC):
+    exchange = None # name the scraper's filings are stored under
     def get_existing_tables(self) -> List[str]:
         """get existing tables in the connected database.
         We can skip downloading if the data is already in the database"""
@@ -41,8 +66,53 @@ class AbstractScraper(ABC):
                 - "max_retries": The maximum number of retries to make. 3 by 
                     default if not specified.
                 - "timeout": The timeout for the request. 10 seconds by default
+                - "extraction_cache_path": path to the extraction cache. 
+                    Extracted text is not cached if not specified
+                - "extraction_cache_max_bytes": size limit of the extraction
+                    cache. 2GB by default
+                - "shard_dir": keep filing content in shard files in this
+                    directory instead of the database. Not sharded if not
+                    specified
+                - "shard_scheme": 'exchange_year' (default) or 'ticker_hash'
+                - "shard_buckets": number of ticker hash buckets. 4 by default
+                - "pool_size": connections kept open per host. Set it to the
+                    number of threads sharing the session. 10 by default
+                - "http2": use an HTTP/2 client (needs httpx[http2])
+                - "circuit_breaker": adapt the timeout of each endpoint to
+                    its observed latency, and fail fast with
+                    CircuitOpenError while an endpoint that keeps failing
+                    is paused. HTTP/1.1 only (ValueError with "http2"),
+                    off by default
+                - "download_attempts": how many times a download that fails
+                    validation (throttling page, truncated transfer) is
+                    tried before the filing is quarantined. 3 by default
+                - "max_deferrals": times a download waits for a paused
+                    endpoint (see "circuit_breaker") before CircuitOpenError
+                    counts as the filing's error. 5 by default
+                - "dedup": link near-duplicate filings (dual listings,
+                    reissues) to the filing they duplicate and skip their
+                    conversion to text. Off by default
+                - "dedup_threshold": estimated Jaccard similarity from which
+                    filings are duplicates. 0.8 by default
+                - "dedup_pages": pages compared when looking for duplicates.
+                    3 by default
+                - "dedup_window": days apart within which filings are
+                    compared, if on the same exchange only those of the
+                    same ticker, issuer or title. 30 by default
+                - "dedup_confirm_pages": pages of both filings compared
+                    exactly before a match is linked, 0 for the whole
+                    documents. 20 by default
         :param kwargs: You can pass the following keyword args:
             - db_path: str which will then be used as the database connection
+            - session: a session to share with other scrapers, e.g. between
+                the threads of batch_download. It keeps the pool, client
+                and circuit breakers it was made with (see
+                _transport.make_session): the pool_size, http2 and
+                circuit_breaker config keys don't apply to it, and passing
+                circuit_breaker along with it raises ValueError
+            - pool_size, http2, circuit_breaker: override the config
+            - convert_pool: a process pool to convert filings to text on,
+                shared with other scrapers
         
         properties:
             - config: the config object (utils.config, which is inherited 
@@ -78,19 +148,54 @@ class AbstractScraper(ABC):
         
         max_retries =  self.config.get(name='max_retries', returntype='int',  default=3)
         assert isinstance(max_retries, int), "max_retries must be an integer"
-        self._adapter = requests.adapters.HTTPAdapter(max_retries=max_retries)
-        self.session = requests.Session()
-        
-        schema =  self.config.get(name='schema', returntype='str', default='https://')
-        self.session.mount(schema, self.adapter)
+        pool_size = kwargs.get('pool_size') or self.config.get(name='pool_size', returntype='int', default=10)
+        http2 = kwargs.get('http2', self.config.get(name='http2', returntype='bool', default=False))
+        circuit_breaker = kwargs.get('circuit_breaker', self.config.get(
+            name='circuit_breaker', returntype='bool', default=False))
+        if kwargs.get('session') is not None and kwargs.get('circuit_breaker') is not None:
+            raise ValueError("circuit_breaker can't be set on a shared session, "
+                "pass it to _transport.make_session instead")
+        if kwargs.get('session') is None and http2 and circuit_breaker:
+            raise ValueError("circuit breakers need an HTTP/1.1 session, turn http2 off")
+        if circuit_breaker:
+            self._adapter = _transport.BudgetedAdapter(
+                endpoints=_transport.Endpoints(),
+                pool_connections=max(pool_size, 10), pool_maxsize=pool_size,
+                pool_block=True, max_retries=max_retries)
+        else:
+            self._adapter = requests.adapters.HTTPAdapter(
+                pool_connections=max(pool_size, 10), pool_maxsize=pool_size,
+                pool_block=True, max_retries=max_retries)
+        if kwargs.get('session') is not None: # shared, already set up
+            self.session = kwargs['session']
+        else:
+            if http2:
+                self.session = _transport.make_session(pool_size=pool_size, 
+                    max_retries=max_retries, http2=True)
+            else:
+                self.session = requests.Session()
+            schema =  self.config.get(name='schema', returntype='str', default='https://')
+            self.session.mount(schema, self.adapter)
         self._timeout =  self.config.get(name='timeout', returntype='int', default=10)
         assert isinstance(self.timeout, int), "timeout mut be an integer"
+        self.convert_pool = kwargs.get('convert_pool')
+        self.download_attempts = self.config.get(name='download_attempts', returntype='int', default=3)
+        self.max_deferrals = self.config.get(name='max_deferrals', returntype='int', default=5)
+        self.dedup_pages = self.config.get(name='dedup_pages', returntype='int', default=3)
+        self.dedup_confirm_pages = self.config.get(name='dedup_confirm_pages', returntype='int', default=20)
+        self.skip_chinese_pages = self.config.get(name='skip_chinese_pages', returntype='bool', default=False)
         if 'db_path' not in kwargs.keys():
             db_path = self.config.get(name='db_path', returntype='str', default=None)
         else: db_path = kwargs.get('db_path', None)
         self.sql_conn = sqlite3.connect(db_path)
         self.cur = self.sql_conn.cursor()
         self.existing_tables = self.get_existing_tables()
+        cache_path = self.config.get(name='extraction_cache_path', returntype='str', default=None)
+        self.extraction_cache = None
+        if cache_path:
+            self.extraction_cache = _extraction_cache.ExtractionCache(cache_path, 
+                max_bytes=self.config.get(name='extraction_cache_max_bytes', 
+                    returntype='int', default=2 << 30))
         __all__ = ['update_headers', 'close_sql_conn', 'frame_to_sql', 'get_filing_list']
     
     @property
@@ -198,6 +303,43 @@ class AbstractScraper(ABC):
         else:
             del self._adapter
 
+    @property
+    def store(self) -> FilingStore:
+        """the unified filings store living in the connected database, with
+        the content in shards if "shard_dir" is configured"""
+        if not hasattr(self, '_store'):
+            shard_dir = self.config.get(name='shard_dir', returntype='str', default=None)
+            if shard_dir:
+                self._store = ShardedFilingStore(self.sql_conn, ShardRouter(shard_dir,
+                    scheme=self.config.get(name='shard_scheme', returntype='str',
+                        default='exchange_year'),
+                    n_buckets=self.config.get(name='shard_buckets', returntype='int',
+                        default=4)))
+            else:
+                self._store = FilingStore(self.sql_conn)
+        return self._store
+
+    @property
+    def dedup(self) -> Optional[DuplicateIndex]:
+        """the near-duplicate index in the connected database, None unless
+        "dedup" is configured"""
+        if not hasattr(self, '_dedup'):
+            self._dedup = None
+            if self.config.get(name='dedup', returntype='bool', default=False):
+                self._dedup = _dedup.DuplicateIndex(self.sql_conn,
+                    threshold=self.config.get(name='dedup_threshold',
+                        returntype='float', default=0.8),
+                    window_days=self.config.get(name='dedup_window',
+                        returntype='float', default=30))
+        return self._dedup
+
+    @property
+    def coverage(self) -> CoverageIndex:
+        """date ranges already fetched completely into the filings store"""
+        if not hasattr(self, '_coverage'):
+            self._coverage = CoverageIndex(self.sql_conn)
+        return self._coverage
+
     def update_headers(self, headers: Dict[str, str], inplace: bool=False) -> Union[AbstractScraper, Dict[str, str]]:
         """
         Update the headers for the request. Inplace by default
@@ -212,8 +354,15 @@ class AbstractScraper(ABC):
             oldheaders.update(headers)
             return oldheaders
 
+    def connection_stats(self) -> Dict[str, int]:
+        """requests made, connections opened and connections reused by 
+        this scraper's session"""
+        return _transport.connection_stats(self.session)
+
     def close_sql_conn(self):
         """close SQL connection"""
+        if isinstance(getattr(self, '_store', None), ShardedFilingStore):
+            self._store.close()
         self.sql_conn.close()
 
     def frame_to_sql(self, df: pd.DataFrame, table_name: str, 
@@ -226,36 +375,155 @@ class AbstractScraper(ABC):
             index=kwargs.get('index', True))
     
     @staticmethod
-    def pdf_to_text(pdf_file: bytes, keep_chinese: bool=False) -> str:
+    def pdf_to_text(pdf_file: bytes, keep_chinese: bool=False,
+        cache: Optional[ExtractionCache]=None, skip_chinese_pages: bool=False,
+        executor: Optional[Executor]=None, max_pages: Optional[int]=None) -> str:
         """pass in the byte stream of the pdf file by calling open()
         pdfs are already stored as byte streams in the dataframes and sqlite
+        :param keep_chinese: if False, Chinese characters are removed
+        :param cache: look the text up in this extraction cache before parsing
+        :param skip_chinese_pages: when not keeping Chinese, skip pages whose
+            fonts are all Chinese without extracting them. Halves the work on
+            bilingual HKEX filings, but the fonts are only a heuristic: an
+            English page set in a CJK font is dropped too, so it's opt in
+        :param executor: parse on this (process) pool instead of in the
+            calling thread. The cache is still consulted in the caller
+        :param max_pages: only extract the first max_pages pages
         """
-        pdf_file = io.BytesIO(pdf_file)
-        pdf_reader = PyPDF2.PdfFileReader(pdf_file)
+        if cache is not None:
+            # max_pages only goes in the key when set, keeping older keys valid
+            options = dict(max_pages=max_pages) if max_pages else dict()
+            key = cache.make_key(pdf_file, 'pdf',
+                f"{extractor_versions['pdf']}-PyPDF2-{PyPDF2.__version__}",
+                keep_chinese=keep_chinese, skip_chinese_pages=skip_chinese_pages,
+                **options)
+            text = cache.get(key)
+            if text is None:
+                text = AbstractScraper.pdf_to_text(pdf_file, keep_chinese,
+                    skip_chinese_pages=skip_chinese_pages, executor=executor,
+                    max_pages=max_pages)
+                cache.put(key, text)
+            return text
+        if executor is not None:
+            return executor.submit(AbstractScraper.pdf_to_text, pdf_file,
+                keep_chinese, None, skip_chinese_pages, None, max_pages).result()
+        # the header has to come first unless parsing leniently, which
+        # whitespace sent before it (see is_pdf) needs
+        pdf_reader = PyPDF2.PdfFileReader(io.BytesIO(pdf_file),
+            strict=not pdf_file[:1].isspace())
+        n_pages = pdf_reader.numPages
+        return AbstractScraper._pages_to_text((pdf_reader.getPage(page)
+            for page in range(n_pages if not max_pages else min(max_pages, n_pages))),
+            keep_chinese, skip_chinese_pages)
+
+    @staticmethod
+    def _pages_to_text(pages: Iterator[Any], keep_chinese: bool=False,
+        skip_chinese_pages: bool=False) -> str:
         text = ""
-        for page in range(pdf_reader.numPages):
-            text += pdf_reader.getPage(page).extract_text()
+        for page in pages:
+            if not keep_chinese and skip_chinese_pages and _chinese.is_chinese_page(page):
+                continue
+            text += page.extract_text()
         if not keep_chinese:
-            text = re.sub("(\\s\d\d\w)", "", text)
+            text = _chinese.strip_chinese(text)
         return text
+
+    @staticmethod
+    def get_pdf_pages_text(url: str, max_pages: int=3, keep_chinese: bool=False,
+        skip_chinese_pages: bool=False, session: requests.Session=None,
+        block_size: int=1 << 16, validate: bool=True, **kwargs) -> str:
+        """text of the first pages of a remote pdf, downloading only the
+        trailer, the xref and the objects of those pages with Range requests
+        (see _ranged). Falls back to a full download if the server doesn't
+        support ranges
+        :param max_pages: number of pages to extract
+        :param session: The session to use, the process wide pooled session
+            if not passed
+        :param block_size: bytes fetched at a time
+        :param validate: check the status, headers, magic bytes and %%EOF
+            trailer like get_pdf
+        :param kwargs: timeout and headers of the requests
+        :raise InvalidDocumentError: like get_pdf, when the server answers
+            with an error or something that isn't a pdf
+        """
+        assert isinstance(url, str), "url passed is not a string"
+        assert url.split('.')[-1].lower() == 'pdf', "url doesn't look like a pdf!"
+        session = session or _transport.default_session()
+        pdf_reader = PyPDF2.PdfFileReader(_ranged.RangeFile(session, url,
+            block_size=block_size, validate=validate, **kwargs))
+        return AbstractScraper._pages_to_text(_ranged.first_pages(pdf_reader, max_pages),
+            keep_chinese, skip_chinese_pages)
     
     @staticmethod
-    def get_pdf(url: str, session: requests.Session=None, **kwargs) -> bytes:
+    def get_pdf(url: str, session: requests.Session=None, validate: bool=True,
+        **kwargs) -> bytes:
         """
         :param url: The url to the pdf
         :param session: The session to use for the request. If no session is 
-            passed, a new session will be created
+            passed, a process wide pooled session is used, unless an adapter
+            is passed in kwargs, in which case a new session is created
+        :param validate: check the status, headers, magic bytes and %%EOF 
+            trailer, raising InvalidDocumentError if the payload isn't a 
+            complete pdf
         :return: The pdf as a byte stream
         """
         assert isinstance(url, str), "url passed is not a string"
         assert url.split('.')[-1].lower() == 'pdf', "url doesn't look like a pdf!"
-        default_adapter = requests.adapters.HTTPAdapter(max_retries=3)
+        schema = kwargs.pop('schema', 'http')
+        adapter = kwargs.pop('adapter', None)
         if not session:
-            session = requests.Session()
-            schema = kwargs.get('schema', 'http')
-            adapter = kwargs.get('adapter', default_adapter)
-            session.mount(schema, adapter)
-        return session.get(url, **kwargs).content
+            if adapter is not None:
+                session = requests.Session()
+                session.mount(schema, adapter)
+            else:
+                session = _transport.default_session()
+        res = session.get(url, **kwargs)
+        if validate:
+            return check_response(res)
+        return res.content
+
+    def _quarantine(self, filing_id: str, url: Optional[str],
+        error: InvalidDocumentError, attempts: int=1, verbose: bool=False) -> None:
+        if verbose: print(f"{filing_id}: quarantined, {error.reason}")
+        self.store.quarantine(self.exchange, filing_id, url, error.reason,
+            error.content, attempts)
+
+    def download_filing(self, filing_id: str, url: str,
+        session: Optional[requests.Session]=None, verbose: bool=False
+        ) -> Optional[bytes]:
+        """download a pdf, trying again with a growing pause while the 
+        payload fails validation in a way that may pass (throttling, 
+        truncated transfers). Filings that still fail are quarantined.
+        While the endpoint's breaker is open, the download waits for it to
+        take requests again, up to max_deferrals times.
+        :return: the content, None if the filing was quarantined
+        """
+        attempt, deferrals = 1, 0
+        while True:
+            try:
+                return self.get_pdf(url, session=session or self.session,
+                    timeout=self.timeout)
+            except CircuitOpenError as e:
+                if deferrals >= self.max_deferrals:
+                    raise
+                deferrals += 1
+                if verbose: print(f"{filing_id}: {e}, waiting")
+                time.sleep(e.retry_in)
+            except InvalidDocumentError as e:
+                if not e.retryable or attempt >= self.download_attempts:
+                    self._quarantine(filing_id, url, e, attempt, verbose)
+                    return None
+                if verbose: print(f"{filing_id}: {e.reason}, retrying")
+                time.sleep(self.retry_delay(attempt))
+                attempt += 1
+
+    @staticmethod
+    def retry_delay(attempt: int) -> float:
+        """
+        :param attempt: how many times the download has failed so far
+        :return: how long to wait before trying it again, in seconds
+        """
+        return min(2 ** attempt, 30)
     
     @staticmethod
     def html_entities_to_unicode(text: str) -> str:
@@ -266,13 +534,191 @@ class AbstractScraper(ABC):
         return html.unescape(text)
     
     @staticmethod
-    def html_to_text(html: str) -> str:
+    def html_to_text(html: Union[str, bytes],
+        cache: Optional[ExtractionCache]=None,
+        executor: Optional[Executor]=None) -> str:
         """
-        :param html: The html to convert
+        :param html: The html to convert. EDGAR primary documents (including
+            iXBRL) can be passed as they are; they are parsed as a stream
+        :param cache: look the text up in this extraction cache before parsing
+        :param executor: parse on this (process) pool instead of in the
+            calling thread
         :return: The text converted from the html
         """
-        pass
+        if cache is not None:
+            key = cache.make_key(html, 'html', extractor_versions['html'])
+            text = cache.get(key)
+            if text is None:
+                text = AbstractScraper.html_to_text(html, executor=executor)
+                cache.put(key, text)
+            return text
+        if executor is not None:
+            return executor.submit(_html_text.html_to_text, html).result()
+        return _html_text.html_to_text(html)
+
+    @staticmethod
+    def is_pdf(content: Union[str, bytes]) -> bool:
+        """whether stored content is a pdf. Some servers send whitespace
+        before the header"""
+        return isinstance(content, (bytes, bytearray)) \
+            and content[:1024].lstrip().startswith(b'%PDF')
+
+    @staticmethod
+    def to_text(content: Union[str, bytes], keep_chinese: bool=False,
+        cache: Optional[ExtractionCache]=None,
+        executor: Optional[Executor]=None, skip_chinese_pages: bool=False) -> str:
+        """convert a filing to text, dispatching on what the content is.
+        PDFs go to pdf_to_text, everything else is treated as html
+        :param content: the filing content as stored in the dataframes
+        :param keep_chinese: passed on to pdf_to_text
+        :param cache: the extraction cache to consult, if any
+        :param executor: the pool to parse on, if any
+        :param skip_chinese_pages: passed on to pdf_to_text
+        """
+        if AbstractScraper.is_pdf(content):
+            return AbstractScraper.pdf_to_text(bytes(content), 
+                keep_chinese=keep_chinese, cache=cache, executor=executor,
+                skip_chinese_pages=skip_chinese_pages)
+        return AbstractScraper.html_to_text(content, cache=cache, executor=executor)
+
+    def convert(self, content: Union[str, bytes]) -> str:
+        """to_text through the scraper's extraction cache, parsing on the
+        shared conversion pool if the scraper was given one. Chinese pages
+        are only skipped if the "skip_chinese_pages" config key is set"""
+        return self.to_text(content, cache=self.extraction_cache,
+            executor=self.convert_pool, skip_chinese_pages=self.skip_chinese_pages)
     
+    def _dedup_text(self, content: Union[str, bytes], max_pages: Optional[int]) -> str:
+        """the text filings are compared on: the first max_pages pages of a
+        pdf, with the Chinese kept so the Chinese versions of dual listed
+        filings match their CNInfo counterparts"""
+        if self.is_pdf(content):
+            return self.pdf_to_text(content, keep_chinese=True,
+                cache=self.extraction_cache, skip_chinese_pages=False,
+                executor=self.convert_pool, max_pages=max_pages or None)
+        return self.convert(content)
+
+    def find_duplicate(self, filing_id: str, content: Union[str, bytes]
+        ) -> Optional[tuple]:
+        """look a filing up in the near-duplicate index before converting it.
+        Only the first dedup_pages pages are extracted to look for a match;
+        a match is confirmed on the exact similarity of the first
+        dedup_confirm_pages pages of both filings before the filing is
+        linked to it
+        :return: (exchange, filing_id) of the filing it duplicates, None if
+            it's an original or dedup isn't configured
+        """
+        if self.dedup is None:
+            return None
+        duplicate = self.dedup.duplicate_of(self.exchange, filing_id)
+        if duplicate is not None:
+            return tuple(duplicate)
+        def confirm(exchange: str, original_id: str) -> bool:
+            original = self.store.get_content(exchange, original_id)
+            if original is None or original[0] is None: # nothing to compare with
+                return False
+            return _dedup.jaccard(self._dedup_text(content, self.dedup_confirm_pages),
+                self._dedup_text(original[0], self.dedup_confirm_pages)) \
+                >= self.dedup.threshold
+        return self.dedup.check(self.exchange, filing_id,
+            self._dedup_text(content, self.dedup_pages), confirm=confirm)
+
+    def _iter_content(self, df: pd.DataFrame, id_col: str,
+        convert_to_text: bool=False, save_to_sql: bool=True,
+        ignore_errors: bool=False, batch_size: int=1,
+        session: Optional[requests.Session]=None, can_defer: bool=False,
+        verbose: bool=False
+        ) -> Iterator[Union[Dict[str, Any], List[Dict[str, Any]]]]:
+        """download, convert and persist filings one at a time. Only the
+        filing being worked on (or the current batch) is held in memory.
+        :param df: the filing list, must have a 'url' column
+        :param id_col: the column holding the filing id in the filings store
+        :param convert_to_text: replace filing_content with its text
+        :param save_to_sql: save each filing to the filings store as soon as
+            it's downloaded
+        :param ignore_errors: skip filings that fail instead of raising
+        :param batch_size: yield lists of this many records if > 1
+        :param session: the session to download with, self.session by default
+        :param can_defer: raise CircuitOpenError, even with ignore_errors, so
+            that the caller's scheduler comes back to the rest once the
+            endpoint reopens. Otherwise a filing whose endpoint is paused
+            waits for it like a retry, up to max_deferrals times, before
+            it counts as failed
+        :return: generator of records (dicts of the filing list columns plus
+            filing_content). With "dedup" configured, near-duplicates aren't
+            converted: their filing_content is None and duplicate_of holds
+            the (exchange, filing_id) of the original
+        """
+        batch = []
+        # filings whose download looks like it may pass on another go wait
+        # in retries until their backoff is over, the others are downloaded
+        # meanwhile. With nothing else left, we sleep out the backoff
+        todo = deque(df.to_dict('records'))
+        retries, order = [], count()
+        while todo or retries:
+            if retries and (not todo or retries[0][0] <= time.monotonic()):
+                not_before, _, attempt, deferrals, record = heapq.heappop(retries)
+                time.sleep(max(not_before - time.monotonic(), 0))
+            else:
+                attempt, deferrals, record = 1, 0, todo.popleft()
+            filing_id = str(record[id_col])
+            try:
+                content, text = self.store.get_content(self.exchange, filing_id) or (None, None)
+                # bad payloads saved before validation existed are fetched again
+                is_new = content is None or not is_valid_pdf(content)
+                if is_new:
+                    try:
+                        content = self.get_pdf(record['url'],
+                            session=session or self.session, timeout=self.timeout)
+                    except InvalidDocumentError as e:
+                        if e.retryable and attempt < self.download_attempts:
+                            if verbose: print(f"{filing_id}: {e.reason}, requeued")
+                            heapq.heappush(retries, (time.monotonic()
+                                + self.retry_delay(attempt), next(order),
+                                attempt + 1, deferrals, record))
+                        else:
+                            self._quarantine(filing_id, record['url'], e,
+                                attempt, verbose)
+                        continue
+                    text = None
+                    self.store.release(self.exchange, filing_id)
+                if convert_to_text and text is None:
+                    duplicate = self.find_duplicate(filing_id, content)
+                    if duplicate is not None:
+                        record['duplicate_of'] = duplicate
+                    else:
+                        text = self.convert(content)
+                        is_new = True
+                if save_to_sql and is_new:
+                    self.store.insert_content(self.exchange, filing_id, content, text)
+            except CircuitOpenError as e:
+                # not the filing's fault: it waits until the endpoint takes
+                # requests again, or the caller's scheduler defers it
+                if can_defer:
+                    raise
+                if deferrals < self.max_deferrals:
+                    if verbose: print(f"{filing_id}: {e}, deferred")
+                    heapq.heappush(retries, (e.retry_at, next(order), attempt,
+                        deferrals + 1, record))
+                    continue
+                if verbose: print(f"{filing_id}: {e}")
+                if ignore_errors: continue
+                raise e
+            except Exception as e:
+                if verbose: print(f"{filing_id}: {e}")
+                if ignore_errors: continue
+                raise e
+            record['filing_content'] = text if convert_to_text else content
+            if batch_size <= 1:
+                yield record
+                continue
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
     @abstractmethod
     def get_filing_list(self, **kwargs) -> pd.DataFrame:
         """
@@ -0,0 +1,214 @@
+"""Per-endpoint timeouts and circuit breakers. A fixed timeout is too long
+for a small json lookup and the same for every host, so when an exchange
+degrades every thread sits out the full timeout on each request. Here each
+endpoint (host and path, with file downloads of a host grouped by
+extension, e.g. www1.hkexnews.hk/*.pdf) keeps a window of recent latencies
+and gets a timeout of a few times their 95th percentile. That timeout is
+for the headers; bodies whose size is known (Content-Length) also get a
+total deadline of a few times what they'd take at the slow end of the
+endpoint's recent transfer rates, so a 80MB pdf isn't held to the timeout
+of a json lookup and a stalled one doesn't trickle on. After repeated
+failures its breaker opens: requests fail at once with CircuitOpenError
+until a cooldown has passed, then a single trial request decides whether
+it closes again or stays open for longer. Kept free of requests so the
+scheduler can catch CircuitOpenError without importing it."""
+
+from __future__ import annotations
+from typing import Any, Dict, Optional, Union
+from collections import deque
+from urllib.parse import urlsplit
+import threading
+import time
+
+__all__ = ['CircuitOpenError', 'Endpoint', 'Endpoints', 'failure_statuses']
+
+# responses counting against an endpoint: throttling and server errors
+failure_statuses = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(ConnectionError):
+    def __init__(self, endpoint: str, retry_at: float):
+        """
+        :param endpoint: the endpoint whose breaker is open
+        :param retry_at: time.monotonic() from which it takes a request again
+        """
+        self.endpoint = endpoint
+        self.retry_at = retry_at
+        super().__init__(f"{endpoint} paused for {self.retry_in:.0f}s after repeated errors")
+
+    @property
+    def retry_in(self) -> float:
+        """seconds until the endpoint takes a request again"""
+        return max(self.retry_at - time.monotonic(), 0.)
+
+
+class Endpoint:
+    def __init__(self, name: str, window: int=100, min_samples: int=20,
+        multiplier: float=4, min_timeout: float=1, max_timeout: float=60,
+        failure_threshold: int=5, cooldown: float=30, max_cooldown: float=600,
+        min_transfer_size: int=1 << 16, max_transfer_time: float=1800):
+        """
+        :param name: what the endpoint is called in errors and stats
+        :param window: number of recent latencies kept
+        :param min_samples: latencies needed before the timeout adapts, the
+            caller's timeout is used until then
+        :param multiplier: the timeout is this many times the 95th
+            percentile latency
+        :param min_timeout: floor of the adaptive timeout, seconds
+        :param max_timeout: ceiling of the adaptive timeout, seconds
+        :param failure_threshold: consecutive failures that open the breaker
+        :param cooldown: seconds the breaker stays open the first time. It
+            doubles every time a trial request fails
+        :param max_cooldown: longest pause, seconds
+        :param min_transfer_size: bodies from this many bytes have their
+            transfer rate recorded and get a deadline. Smaller ones are over
+            in a few reads, the timeout covers them
+        :param max_transfer_time: ceiling of a body's deadline, seconds
+        """
+        self.name = name
+        self.min_samples = min_samples
+        self.multiplier = multiplier
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.min_transfer_size = min_transfer_size
+        self.max_transfer_time = max_transfer_time
+        self.latencies = deque(maxlen=window)
+        self.rates = deque(maxlen=window) # bytes per second of bodies
+        self.failures = 0 # consecutive
+        self.trips = 0
+        self.cooldown = cooldown
+        self.open_until = None
+        self._trial_since = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """'closed', 'open' or 'half-open' (the cooldown is over, the next
+        request is a trial)"""
+        if self.open_until is None:
+            return 'closed'
+        return 'open' if time.monotonic() < self.open_until else 'half-open'
+
+    def percentile(self, q: float, samples: Optional[deque]=None) -> Optional[float]:
+        """
+        :param samples: the latencies by default, or the rates
+        """
+        with self._lock:
+            values = sorted(self.latencies if samples is None else samples)
+        if not values:
+            return None
+        return values[min(int(q * len(values)), len(values) - 1)]
+
+    def timeout(self, default: Union[float, tuple, None]=None) -> Union[float, tuple, None]:
+        """the timeout for the next request, the caller's until enough
+        latencies are known"""
+        if len(self.latencies) < self.min_samples:
+            return default
+        return min(max(self.multiplier * self.percentile(0.95), self.min_timeout),
+            self.max_timeout)
+
+    def deadline(self, size: Optional[int]) -> Optional[float]:
+        """seconds allowed to read a body of size bytes: multiplier times
+        what it takes at the 5th percentile transfer rate. None (no deadline)
+        for bodies of unknown or small size, or until enough rates are known
+        """
+        if not size or size < self.min_transfer_size or len(self.rates) < self.min_samples:
+            return None
+        return min(max(self.multiplier * size / self.percentile(0.05, self.rates),
+            self.min_timeout), self.max_transfer_time)
+
+    def record_transfer(self, read: int, seconds: float, size: Optional[int]=None) -> None:
+        """read bytes of a body of size bytes (read by default) took seconds,
+        read in full or until its deadline passed. Counting cut transfers
+        too keeps an endpoint that got slower from missing its deadlines
+        forever"""
+        if (size or read) >= self.min_transfer_size and seconds > 0:
+            with self._lock:
+                self.rates.append(read / seconds)
+
+    def acquire(self) -> None:
+        """call before a request
+        :raise CircuitOpenError: while the breaker is open, or while another
+            thread's trial request is out
+        """
+        with self._lock:
+            if self.open_until is None:
+                return
+            now = time.monotonic()
+            if now < self.open_until:
+                raise CircuitOpenError(self.name, self.open_until)
+            # a trial that never reported back (e.g. a bad url) expires
+            if self._trial_since is not None and now - self._trial_since < self.max_timeout:
+                raise CircuitOpenError(self.name, self._trial_since + self.max_timeout)
+            self._trial_since = now
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            self.latencies.append(latency)
+            self.failures = 0
+            self.open_until = None
+            self._trial_since = None
+            self.cooldown = self.base_cooldown
+
+    def record_failure(self, latency: Optional[float]=None) -> None:
+        """
+        :param latency: for timeouts, the time waited. Counting it keeps a
+            slow but live endpoint from timing out forever
+        """
+        with self._lock:
+            if latency is not None:
+                self.latencies.append(latency)
+            self.failures += 1
+            if self._trial_since is not None: # the trial failed, pause longer
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            elif self.open_until is not None and time.monotonic() < self.open_until:
+                return # sent before the breaker opened
+            elif self.failures < self.failure_threshold:
+                return
+            self._trial_since = None
+            self.open_until = time.monotonic() + self.cooldown
+            self.trips += 1
+
+    def stats(self) -> Dict[str, Any]:
+        timeout = self.timeout()
+        return dict(state=self.state, failures=self.failures, trips=self.trips,
+            samples=len(self.latencies), p50=self.percentile(0.5),
+            p95=self.percentile(0.95), timeout=timeout,
+            rate_p05=self.percentile(0.05, self.rates))
+
+
+class Endpoints:
+    def __init__(self, **settings: Any):
+        """the endpoints seen by a session, created as requests go out
+        :param settings: passed to each Endpoint, see Endpoint
+        """
+        self.settings = settings
+        self._endpoints: Dict[str, Endpoint] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url: str) -> str:
+        """host and path, with the file name of downloads replaced by a
+        wildcard so that e.g. all the pdfs of a host share an endpoint"""
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        last = path.rpartition('/')[2]
+        if '.' in last and not last.endswith(('.do', '.php', '.asp', '.aspx', '.jsp')):
+            # one endpoint per host and extension, not per directory
+            path = f"/*.{last.rsplit('.', 1)[1].lower()}"
+        return f"{parts.netloc}{path}"
+
+    def get(self, url: str) -> Endpoint:
+        key = self.key(url)
+        endpoint = self._endpoints.get(key)
+        if endpoint is None:
+            with self._lock:
+                endpoint = self._endpoints.setdefault(key, Endpoint(key, **self.settings))
+        return endpoint
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """dict of endpoint: its state, failures, trips, latencies and timeout"""
+        return {name: endpoint.stats() for name, endpoint in list(self._endpoints.items())}
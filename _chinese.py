@@ -0,0 +1,88 @@
+"""Helpers for bilingual (English/Chinese) filings. HKEX filings often carry a
+full Chinese version alongside the English one; when Chinese isn't wanted
+those pages can be recognised from their fonts and skipped before any text
+is extracted, and what Chinese is left is removed by unicode range."""
+
+from __future__ import annotations
+from typing import Any, Iterator
+import re
+
+__all__ = ['strip_chinese', 'is_chinese_page']
+
+_cjk_ranges = (
+    "\u2e80-\u2fdf" # radicals
+    "\u3000-\u303f" # CJK symbols and punctuation
+    "\u3100-\u312f" # bopomofo
+    "\u31a0-\u31ef" # bopomofo extended, strokes
+    "\u3200-\u33ff" # enclosed letters, compatibility
+    "\u3400-\u4dbf" # extension A
+    "\u4e00-\u9fff" # unified ideographs
+    "\uf900-\ufaff" # compatibility ideographs
+    "\ufe30-\ufe4f" # compatibility forms
+    "\uff01-\uff0f\uff1a-\uff20\uff3b-\uff40\uff5b-\uff65" # fullwidth punctuation
+    "\U00020000-\U0002fa1f" # extensions B and up
+    )
+chinese_chars = re.compile(f"[{_cjk_ranges}]+")
+_blank_lines = re.compile("\\n[ \\t]*(?:\\n[ \\t]*){2,}")
+
+# CMaps and CID orderings only used by Chinese fonts
+_chinese_encodings = re.compile("GB|CNS|B5|ETen|HKscs|HKm")
+_chinese_orderings = ('GB1', 'CNS1')
+# base font names of the usual Chinese typefaces, matched as whole names
+# after the subset tag (e.g. /ABCDEF+SimSun,Bold) so that Latin fonts that
+# merely contain "Sun" or "Ming" don't count. Font names are sometimes
+# GBK/Big5 encoded, which shows up as runs of #XX escapes
+_chinese_font_names = re.compile("(?:^/?|\\+)(?:MSung|MHei|STSong|STKaiti|STHeiti"
+    "|STFangsong|STZhongsong|DFKai|DFHei|DFMing|P?MingLiU|N?SimSun|SimHei|SimKai"
+    "|SimFang|KaiTi|FangSong|Songti|Heiti|(?:Microsoft(?: |#20)?)?(?:YaHei|JhengHei)"
+    "|AdobeSong|AdobeMing|AdobeHeiti|AdobeKaiti|AdobeFangsong)"
+    "|(?:#[A-F89][0-9A-F]){2,}", re.I)
+
+
+def strip_chinese(text: str) -> str:
+    """remove Chinese characters and the blank lines they leave behind"""
+    return _blank_lines.sub("\n\n", chinese_chars.sub("", text))
+
+
+def _fonts(resources: Any, depth: int=0) -> Iterator[Any]:
+    """the fonts in a resources dictionary, including those used by form
+    xobjects one level down"""
+    if resources is None:
+        return
+    resources = resources.getObject()
+    fonts = resources.get('/Font')
+    if fonts is not None:
+        for font in fonts.getObject().values():
+            yield font.getObject()
+    xobjects = resources.get('/XObject')
+    if xobjects is not None and depth < 1:
+        for xobject in xobjects.getObject().values():
+            xobject = xobject.getObject()
+            if xobject.get('/Subtype') == '/Form':
+                yield from _fonts(xobject.get('/Resources'), depth + 1)
+
+
+def _is_chinese_font(font: Any) -> bool:
+    encoding = font.get('/Encoding')
+    if encoding is not None and isinstance(encoding.getObject(), str) \
+        and _chinese_encodings.search(str(encoding)):
+        return True
+    for descendant in (font.get('/DescendantFonts') or []):
+        info = descendant.getObject().get('/CIDSystemInfo')
+        if info is not None and str(info.getObject().get('/Ordering')) in _chinese_orderings:
+            return True
+    return bool(_chinese_font_names.search(str(font.get('/BaseFont', ''))))
+
+
+def is_chinese_page(page: Any) -> bool:
+    """cheap pre-screen of a PyPDF2 page from its font resources, without
+    parsing the content stream. A page only counts as Chinese if it uses
+    fonts and every one of them is a Chinese font; pages mixing in Latin
+    fonts are left for the full extraction.
+    :param page: a PyPDF2 PageObject
+    """
+    try:
+        fonts = list(_fonts(page.get('/Resources')))
+    except Exception: # malformed resources, let the extractor deal with it
+        return False
+    return bool(fonts) and all(_is_chinese_font(font) for font in fonts)
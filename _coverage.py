@@ -0,0 +1,107 @@
+"""Coverage index. Records which (exchange, ticker, doctype) date ranges have
+already been fetched completely, so that a new query only goes to the
+network for the parts of its range that aren't covered yet."""
+
+from __future__ import annotations
+from typing import List, Tuple, Sequence
+import datetime as dt
+import sqlite3
+
+__all__ = ['CoverageIndex']
+
+Interval = Tuple[dt.date, dt.date]
+_one_day = dt.timedelta(days=1)
+
+
+def merge_intervals(intervals: Sequence[Interval]) -> List[Interval]:
+    """merge overlapping and adjacent date intervals (both ends inclusive)"""
+    merged: List[Interval] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + _one_day:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_intervals(start: dt.date, end: dt.date,
+    covered: Sequence[Interval]) -> List[Interval]:
+    """the parts of [start, end] not in any of the covered intervals"""
+    missing, cursor = [], start
+    for cstart, cend in merge_intervals(covered):
+        if cend < cursor:
+            continue
+        if cstart > end:
+            break
+        if cstart > cursor:
+            missing.append((cursor, cstart - _one_day))
+        cursor = max(cursor, cend + _one_day)
+        if cursor > end:
+            break
+    if cursor <= end:
+        missing.append((cursor, end))
+    return missing
+
+
+class CoverageIndex:
+    def __init__(self, sql_conn: sqlite3.Connection):
+        """
+        :param sql_conn: connection to the database holding the filings store
+        """
+        self.sql_conn = sql_conn
+        with self.sql_conn:
+            self.sql_conn.execute("""CREATE TABLE IF NOT EXISTS coverage (
+                exchange TEXT NOT NULL,
+                ticker TEXT NOT NULL,
+                doctype TEXT NOT NULL,
+                start_date TEXT NOT NULL,
+                end_date TEXT NOT NULL)""")
+            self.sql_conn.execute("""CREATE INDEX IF NOT EXISTS
+                coverage_key ON coverage (exchange, ticker, doctype)""")
+
+    def intervals(self, exchange: str, ticker: str, doctype: str) -> List[Interval]:
+        """covered intervals for a key, merged and sorted"""
+        rows = self.sql_conn.execute("""SELECT start_date, end_date FROM coverage
+            WHERE exchange = ? AND ticker = ? AND doctype = ?""",
+            (exchange, str(ticker), doctype)).fetchall()
+        return merge_intervals([(dt.date.fromisoformat(s), dt.date.fromisoformat(e))
+            for s, e in rows])
+
+    def add(self, exchange: str, ticker: str, doctype: str,
+        start_date: dt.date, end_date: dt.date) -> None:
+        """mark a range as completely fetched. Today is never marked, since
+        more filings can still come in before the day is over"""
+        end_date = min(end_date, dt.date.today() - _one_day)
+        if end_date < start_date:
+            return
+        merged = merge_intervals(self.intervals(exchange, ticker, doctype)
+            + [(start_date, end_date)])
+        with self.sql_conn:
+            self.sql_conn.execute("""DELETE FROM coverage
+                WHERE exchange = ? AND ticker = ? AND doctype = ?""",
+                (exchange, str(ticker), doctype))
+            self.sql_conn.executemany("""INSERT INTO coverage
+                (exchange, ticker, doctype, start_date, end_date)
+                VALUES (?, ?, ?, ?, ?)""",
+                [(exchange, str(ticker), doctype, s.isoformat(), e.isoformat())
+                    for s, e in merged])
+
+    def missing(self, exchange: str, ticker: str, doctype: str,
+        start_date: dt.date, end_date: dt.date,
+        covered_by: Sequence[str]=()) -> List[Interval]:
+        """
+        :param covered_by: other doctypes whose coverage also counts, e.g.
+            'all' when every doctype can be told apart locally
+        :return: the sub-ranges of [start_date, end_date] still to be fetched
+        """
+        covered = self.intervals(exchange, ticker, doctype)
+        for other in covered_by:
+            covered += self.intervals(exchange, ticker, other)
+        return subtract_intervals(start_date, end_date, covered)
+
+    def is_covered(self, exchange: str, ticker: str, doctype: str,
+        start_date: dt.date, end_date: dt.date,
+        covered_by: Sequence[str]=()) -> bool:
+        """True if the whole range can be served from the local store"""
+        return not self.missing(exchange, ticker, doctype, start_date,
+            end_date, covered_by)
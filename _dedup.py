@@ -0,0 +1,230 @@
+"""Near-duplicate filings. Dual listed issuers publish the same report on
+hkexnews and CNInfo, and revised versions get reissued; converting and
+keeping all of them wastes compute and skews datasets built from the store.
+Each filing gets a MinHash signature of its text's shingles (usually of its
+first pages only, which is cheap to extract), and signatures are indexed
+with locality sensitive hashing in the store: the signature is cut into
+bands, and filings sharing a band bucket are candidates whose estimated
+Jaccard similarity is then checked against the threshold. Only filings
+filed close to each other are candidates: on the same exchange they must
+also share the ticker, issuer or title, while across exchanges, where names
+are in different languages (an H share's English listing against its A
+share's Chinese one), the date is all there is to go on. A match can be
+confirmed on a longer comparison of the texts before the filing is linked."""
+
+from __future__ import annotations
+from typing import Callable, List, Optional, Tuple
+import hashlib
+import re
+import sqlite3
+import time
+from .utils import LazyModule
+
+np = LazyModule('numpy')
+
+__all__ = ['DuplicateIndex', 'shingles', 'jaccard']
+
+# a CJK character is a token on its own, other tokens are runs of letters
+# and digits
+_tokens = re.compile("[㐀-䶿一-鿿豈-﫿]|[^\\W_]+")
+# a*h + b stays below 2**63 for a, b < 2**31 and 32 bit h, so the
+# permutations don't overflow uint64
+_mersenne_prime = (1 << 31) - 1
+
+
+def shingles(text: str, k: int=5) -> List[bytes]:
+    """the distinct k-token shingles of a text, lowercased"""
+    tokens = _tokens.findall(text.lower())
+    if len(tokens) < k:
+        return [" ".join(tokens).encode('utf-8')] if tokens else []
+    return list({" ".join(tokens[i:i + k]).encode('utf-8')
+        for i in range(len(tokens) - k + 1)})
+
+
+def jaccard(text: str, other: str, k: int=5) -> float:
+    """exact Jaccard similarity of the shingles of two texts"""
+    values, others = set(shingles(text, k)), set(shingles(other, k))
+    if not values or not others:
+        return 0.
+    return len(values & others) / len(values | others)
+
+
+class DuplicateIndex:
+    def __init__(self, sql_conn: sqlite3.Connection, num_perm: int=128,
+        bands: int=16, threshold: float=0.8, seed: int=1, window_days: float=30):
+        """
+        :param sql_conn: the connection of the filings store
+        :param num_perm: length of the signatures
+        :param bands: number of LSH bands, num_perm must be a multiple.
+            16 bands of 8 rows catch pairs above ~0.7 similarity
+        :param threshold: estimated Jaccard similarity from which two
+            filings count as duplicates
+        :param seed: seed of the hash permutations. Signatures made with
+            different seeds or lengths can't be compared
+        :param window_days: filings are only compared to those filed at
+            most this many days apart, of the same ticker, issuer or title
+            if they're on the same exchange
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.sql_conn = sql_conn
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.seed = seed
+        self.window_days = window_days
+        self._permutations = None
+        with self.sql_conn:
+            self.sql_conn.execute("""CREATE TABLE IF NOT EXISTS minhash_signatures (
+                exchange TEXT NOT NULL,
+                filing_id TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                PRIMARY KEY (exchange, filing_id))""")
+            self.sql_conn.execute("""CREATE TABLE IF NOT EXISTS minhash_bands (
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                exchange TEXT NOT NULL,
+                filing_id TEXT NOT NULL)""")
+            self.sql_conn.execute("""CREATE INDEX IF NOT EXISTS
+                minhash_bands_bucket ON minhash_bands (band, bucket)""")
+            self.sql_conn.execute("""CREATE TABLE IF NOT EXISTS filing_duplicates (
+                exchange TEXT NOT NULL,
+                filing_id TEXT NOT NULL,
+                duplicate_of_exchange TEXT NOT NULL,
+                duplicate_of_id TEXT NOT NULL,
+                similarity REAL,
+                linked_at REAL,
+                PRIMARY KEY (exchange, filing_id))""")
+
+    @property
+    def permutations(self):
+        if self._permutations is None:
+            generator = np.random.RandomState(self.seed)
+            self._permutations = (
+                generator.randint(1, _mersenne_prime, self.num_perm).astype(np.uint64),
+                generator.randint(0, _mersenne_prime, self.num_perm).astype(np.uint64))
+        return self._permutations
+
+    def signature(self, text: str, k: int=5, chunk_size: int=8192):
+        """MinHash signature of a text, None if it has no tokens
+        :return: uint64 numpy array of num_perm values
+        """
+        values = shingles(text, k)
+        if not values:
+            return None
+        a, b = self.permutations
+        signature = np.full(self.num_perm, _mersenne_prime, dtype=np.uint64)
+        for start in range(0, len(values), chunk_size):
+            hashes = np.array([int.from_bytes(hashlib.blake2b(value,
+                digest_size=4).digest(), 'little')
+                for value in values[start:start + chunk_size]], dtype=np.uint64)
+            permuted = (np.outer(hashes, a) + b) % np.uint64(_mersenne_prime)
+            signature = np.minimum(signature, permuted.min(axis=0))
+        return signature
+
+    def similarity(self, signature, other) -> float:
+        """estimated Jaccard similarity of two signatures"""
+        return float(np.mean(signature == other))
+
+    def _buckets(self, signature) -> List[Tuple[int, int]]:
+        return [(band, int.from_bytes(hashlib.blake2b(
+            signature[band * self.rows:(band + 1) * self.rows].tobytes(),
+            digest_size=7).digest(), 'little'))
+            for band in range(self.bands)]
+
+    def find(self, signature, exchange: str, filing_id: str
+        ) -> Optional[Tuple[str, str, float]]:
+        """the most similar indexed filing above the threshold, among those
+        filed within window_days of the filing: on other exchanges, or on
+        the same one with the same ticker, issuer or title
+        :param exchange, filing_id: the filing the signature is of, whose
+            metadata in the filings table picks the candidates
+        :return: (exchange, filing_id, similarity), None if there is none
+        """
+        filing_id = str(filing_id)
+        metadata = self.sql_conn.execute("""SELECT ticker, issuer, title, filing_date
+            FROM filings WHERE exchange = ? AND filing_id = ?""",
+            (exchange, filing_id)).fetchone()
+        if metadata is None: # nothing to tell related filings by
+            return None
+        ticker, issuer, title, filing_date = metadata
+        candidates = set()
+        for band, bucket in self._buckets(signature):
+            candidates.update(self.sql_conn.execute("""SELECT b.exchange, b.filing_id
+                FROM minhash_bands b JOIN filings f
+                ON f.exchange = b.exchange AND f.filing_id = b.filing_id
+                WHERE b.band = ? AND b.bucket = ?
+                AND abs(julianday(f.filing_date) - julianday(?)) <= ?
+                AND (f.exchange != ? OR f.ticker = ? OR f.issuer = ? COLLATE NOCASE
+                    OR f.title = ? COLLATE NOCASE)""",
+                (band, bucket, filing_date, self.window_days, exchange, ticker,
+                    issuer, title)).fetchall())
+        candidates.discard((exchange, filing_id))
+        best = None
+        for candidate_exchange, candidate_id in candidates:
+            row = self.sql_conn.execute("""SELECT signature FROM minhash_signatures
+                WHERE exchange = ? AND filing_id = ?""",
+                (candidate_exchange, candidate_id)).fetchone()
+            if row is None:
+                continue
+            similarity = self.similarity(signature,
+                np.frombuffer(row[0], dtype=np.uint64))
+            if similarity >= self.threshold and (best is None or similarity > best[2]):
+                best = (candidate_exchange, candidate_id, similarity)
+        return best
+
+    def add(self, exchange: str, filing_id: str, signature) -> None:
+        """index a filing's signature"""
+        filing_id = str(filing_id)
+        with self.sql_conn:
+            self.sql_conn.execute("""INSERT OR REPLACE INTO minhash_signatures
+                (exchange, filing_id, signature) VALUES (?, ?, ?)""",
+                (exchange, filing_id, signature.astype(np.uint64).tobytes()))
+            self.sql_conn.execute("""DELETE FROM minhash_bands
+                WHERE exchange = ? AND filing_id = ?""", (exchange, filing_id))
+            self.sql_conn.executemany("""INSERT INTO minhash_bands
+                (band, bucket, exchange, filing_id) VALUES (?, ?, ?, ?)""",
+                [(band, bucket, exchange, filing_id)
+                    for band, bucket in self._buckets(signature)])
+
+    def link(self, exchange: str, filing_id: str, duplicate_of_exchange: str,
+        duplicate_of_id: str, similarity: Optional[float]=None) -> None:
+        """record that a filing duplicates another one"""
+        with self.sql_conn:
+            self.sql_conn.execute("""INSERT OR REPLACE INTO filing_duplicates
+                (exchange, filing_id, duplicate_of_exchange, duplicate_of_id,
+                similarity, linked_at) VALUES (?, ?, ?, ?, ?, ?)""",
+                (exchange, str(filing_id), duplicate_of_exchange,
+                    str(duplicate_of_id), similarity, time.time()))
+
+    def duplicate_of(self, exchange: str, filing_id: str) -> Optional[Tuple[str, str]]:
+        """the (exchange, filing_id) a filing was linked to as a duplicate"""
+        return self.sql_conn.execute("""SELECT duplicate_of_exchange, duplicate_of_id
+            FROM filing_duplicates WHERE exchange = ? AND filing_id = ?""",
+            (exchange, str(filing_id))).fetchone()
+
+    def check(self, exchange: str, filing_id: str, text: str,
+        confirm: Optional[Callable[[str, str], bool]]=None
+        ) -> Optional[Tuple[str, str]]:
+        """link a filing to the filing it duplicates, or index it as an
+        original if it duplicates nothing
+        :param text: the text to compare on, e.g. the first pages
+        :param confirm: called with the (exchange, filing_id) of the match,
+            e.g. to compare more of both texts. The filing is only linked
+            if it returns True
+        :return: (exchange, filing_id) of the original, None if the filing
+            isn't a duplicate
+        """
+        linked = self.duplicate_of(exchange, filing_id)
+        if linked is not None:
+            return tuple(linked)
+        signature = self.signature(text)
+        if signature is None: # no text to go on, e.g. a scanned pdf
+            return None
+        match = self.find(signature, exchange, filing_id)
+        if match is not None and (confirm is None or confirm(*match[:2])):
+            self.link(exchange, filing_id, *match)
+            return match[:2]
+        self.add(exchange, filing_id, signature)
+        return None
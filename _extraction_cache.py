@@ -0,0 +1,118 @@
+"""Persistent cache of extracted text. Entries are keyed by the SHA-256 of the
+document, the extractor name and version, and the extraction options, so a
+document is only parsed again when the extractor or its options change.
+The cache lives in its own sqlite file and is size bounded: the least
+recently used entries are evicted once it grows past max_bytes. The size is
+kept as a running total, so a put doesn't have to sum the whole cache."""
+
+from __future__ import annotations
+from typing import Optional, Union, Any
+import hashlib
+import sqlite3
+import threading
+import json
+import time
+import zlib
+
+__all__ = ['ExtractionCache']
+
+# puts between exact size checks. Other processes sharing the file grow it
+# too, which the running total only sees on these checks
+_resync_every = 256
+
+
+class ExtractionCache:
+    def __init__(self, path: str='extraction_cache.db', max_bytes: int=2 << 30):
+        """
+        :param path: path to the sqlite file holding the cache. Can be shared
+            by several processes
+        :param max_bytes: the cache is trimmed back under this size (of the
+            compressed text) whenever it goes over
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.sql_conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        with self.sql_conn:
+            self.sql_conn.execute("""CREATE TABLE IF NOT EXISTS extraction_cache (
+                key TEXT PRIMARY KEY,
+                text BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL)""")
+            self.sql_conn.execute("""CREATE INDEX IF NOT EXISTS
+                extraction_cache_lru ON extraction_cache (last_access)""")
+        self.hits = 0
+        self.misses = 0
+        self._total = None # running size of the cache, summed on first put
+        self._puts = 0
+
+    @staticmethod
+    def make_key(document: Union[bytes, str], extractor: str, version: str,
+        **options: Any) -> str:
+        """
+        :param document: the raw document
+        :param extractor: name of the extractor, e.g. 'pdf'
+        :param version: version of the extractor. Bump it whenever the
+            extractor's output changes
+        :param options: the options the text depends on, e.g. keep_chinese
+        """
+        if isinstance(document, str):
+            document = document.encode('utf-8')
+        digest = hashlib.sha256(document).hexdigest()
+        return f"{digest}:{extractor}:{version}:{json.dumps(options, sort_keys=True)}"
+
+    def get(self, key: str) -> Optional[str]:
+        """the cached text for a key, None if it isn't cached"""
+        with self._lock:
+            row = self.sql_conn.execute(
+                "SELECT text FROM extraction_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            with self.sql_conn:
+                self.sql_conn.execute(
+                    "UPDATE extraction_cache SET last_access = ? WHERE key = ?",
+                    (time.time(), key))
+            self.hits += 1
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def put(self, key: str, text: str) -> None:
+        """cache the text for a key and evict old entries if over budget"""
+        blob = zlib.compress(text.encode('utf-8'), 1)
+        with self._lock:
+            with self.sql_conn:
+                self.sql_conn.execute("""INSERT OR REPLACE INTO extraction_cache
+                    (key, text, size, last_access) VALUES (?, ?, ?, ?)""",
+                    (key, blob, len(blob), time.time()))
+            self._puts += 1
+            if self._total is None or self._puts % _resync_every == 0:
+                self._total = self._size()
+            else: # a replaced entry is counted twice until the next check
+                self._total += len(blob)
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _size(self) -> int:
+        return self.sql_conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM extraction_cache").fetchone()[0]
+
+    def _evict(self) -> None:
+        total = self._size()
+        self._total = total
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed, stale = 0, []
+        for key, size in self.sql_conn.execute(
+            "SELECT key, size FROM extraction_cache ORDER BY last_access"):
+            stale.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        with self.sql_conn:
+            self.sql_conn.executemany(
+                "DELETE FROM extraction_cache WHERE key = ?", stale)
+        self._total = total - freed
+
+    def close(self) -> None:
+        self.sql_conn.close()
@@ -0,0 +1,123 @@
+"""Streaming HTML/iXBRL to text. The document is fed to the parser in chunks
+and text is emitted as tags are seen, so no tree is ever built. Hidden
+blocks (the iXBRL header, script/style and display:none elements) are
+dropped, and table cells are kept in reading order, tab seperated."""
+
+from __future__ import annotations
+from typing import Union, Optional, List, IO
+from html.parser import HTMLParser
+import codecs
+import re
+
+__all__ = ['HTMLTextExtractor', 'html_to_text']
+
+CHUNK_SIZE = 1 << 16
+
+skip_tags = {'script', 'style', 'head', 'title', 'noscript', 'template',
+    'ix:header', 'xbrli:context', 'xbrli:unit'}
+block_tags = {'p', 'div', 'br', 'li', 'ul', 'ol', 'table', 'section',
+    'article', 'header', 'footer', 'blockquote', 'pre', 'hr', 'dt', 'dd',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+cell_tags = {'td', 'th'}
+void_tags = {'br', 'hr', 'img', 'input', 'meta', 'link', 'area', 'base',
+    'col', 'embed', 'source', 'track', 'wbr'}
+
+_hidden_style = re.compile("display\\s*:\\s*none", re.I)
+_spaces = re.compile("[ \\t\\r\\f\\v\\n\\u00a0]+")
+_trailing_spaces = re.compile("[ \\t]+\\n")
+_repeated_spaces = re.compile(" {2,}")
+_spaces_around_breaks = re.compile(" *([\\n\\t]) *")
+_blank_lines = re.compile("\\n{3,}")
+
+
+class HTMLTextExtractor(HTMLParser):
+    def __init__(self):
+        super(HTMLTextExtractor, self).__init__(convert_charrefs=True)
+        self._pieces: List[str] = []
+        self._skip_tag: Optional[str] = None
+        self._skip_depth = 0
+        self._in_cell = False
+
+    def _newline(self):
+        if self._pieces and not self._pieces[-1].endswith("\n"):
+            self._pieces.append("\n")
+
+    def handle_starttag(self, tag, attrs):
+        if self._skip_tag is not None:
+            if tag == self._skip_tag and tag not in void_tags:
+                self._skip_depth += 1
+            return
+        style = dict(attrs).get('style') or ''
+        if tag in skip_tags or _hidden_style.search(style):
+            if tag not in void_tags:
+                self._skip_tag, self._skip_depth = tag, 1
+            return
+        if tag in cell_tags:
+            if self._in_cell: # unclosed cell
+                self._pieces.append("\t")
+            self._in_cell = True
+        elif tag == 'tr':
+            self._in_cell = False
+            self._newline()
+        elif tag in block_tags:
+            self._newline()
+
+    def handle_startendtag(self, tag, attrs):
+        if self._skip_tag is None and tag in block_tags:
+            self._newline()
+
+    def handle_endtag(self, tag):
+        if self._skip_tag is not None:
+            if tag == self._skip_tag:
+                self._skip_depth -= 1
+                if self._skip_depth <= 0:
+                    self._skip_tag, self._skip_depth = None, 0
+            return
+        if tag in cell_tags:
+            self._in_cell = False
+            self._pieces.append("\t")
+        elif tag in ('tr', 'table') or tag in block_tags:
+            self._in_cell = False
+            self._newline()
+
+    def handle_data(self, data):
+        if self._skip_tag is not None:
+            return
+        data = _spaces.sub(" ", data)
+        if not data.strip(): # only between inline elements
+            if not self._pieces or self._pieces[-1][-1:] in ("\n", "\t", " "):
+                return
+        # whitespace between inline elements still separates words (and
+        # adjacent iXBRL figures), it's collapsed in get_text
+        self._pieces.append(data)
+
+    def get_text(self) -> str:
+        text = "".join(self._pieces)
+        text = _spaces_around_breaks.sub("\\1", _repeated_spaces.sub(" ", text))
+        text = _trailing_spaces.sub("\n", text.replace("\t\n", "\n"))
+        return _blank_lines.sub("\n\n", text).strip()
+
+
+def html_to_text(html: Union[str, bytes, IO], encoding: str='utf-8',
+    chunk_size: int=CHUNK_SIZE) -> str:
+    """
+    :param html: the html as a string, bytes or an open file
+    :param encoding: the encoding used to decode bytes input
+    :param chunk_size: size of the chunks fed to the parser
+    :return: the visible text of the document
+    """
+    parser = HTMLTextExtractor()
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    if isinstance(html, (str, bytes, bytearray)):
+        for start in range(0, len(html), chunk_size):
+            chunk = html[start:start + chunk_size]
+            parser.feed(chunk if isinstance(chunk, str) else decoder.decode(chunk))
+    else:
+        while True:
+            chunk = html.read(chunk_size)
+            if not chunk:
+                break
+            parser.feed(chunk if isinstance(chunk, str) else decoder.decode(chunk))
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    return parser.get_text()
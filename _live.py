@@ -0,0 +1,127 @@
+"""Helpers for watching an exchange's latest-filings listing. The listing is
+polled with conditional requests (ETag / If-Modified-Since), so an unchanged
+listing costs a 304 and nothing else. Filing ids are diffed against a set of
+ids already seen, kept in memory and in a `seen_filings` table so restarts
+don't replay the day. The poll interval shrinks while filings keep coming
+and backs off while the listing is quiet."""
+
+from __future__ import annotations
+from typing import Iterable, List, Optional, Dict, Any
+import sqlite3
+import time
+from .utils import iter_by_chunk
+
+__all__ = ['SeenFilings', 'AdaptiveInterval', 'ConditionalGet']
+
+
+class SeenFilings:
+    def __init__(self, sql_conn: sqlite3.Connection, exchange: str,
+        memory_size: int=100000):
+        """
+        :param sql_conn: where the seen ids are persisted
+        :param exchange: the exchange the ids belong to
+        :param memory_size: ids kept in memory before falling back to the
+            table for older ones
+        """
+        self.sql_conn = sql_conn
+        self.exchange = exchange
+        self.memory_size = memory_size
+        with self.sql_conn:
+            self.sql_conn.execute("""CREATE TABLE IF NOT EXISTS seen_filings (
+                exchange TEXT NOT NULL,
+                filing_id TEXT NOT NULL,
+                seen_at REAL NOT NULL,
+                PRIMARY KEY (exchange, filing_id))""")
+        self._seen = set()
+
+    def new(self, filing_ids: Iterable[str]) -> List[str]:
+        """the ids that haven't been seen, in the order given. The common
+        case, a listing with nothing new, is answered from memory"""
+        candidates = [str(i) for i in dict.fromkeys(filing_ids) if str(i) not in self._seen]
+        if not candidates:
+            return []
+        known = set()
+        for chunk in iter_by_chunk(candidates, 500):
+            known.update(row[0] for row in self.sql_conn.execute(f"""SELECT filing_id
+                FROM seen_filings WHERE exchange = ?
+                AND filing_id IN ({', '.join('?' * len(chunk))})""",
+                [self.exchange] + list(chunk)))
+        self._remember(known)
+        return [i for i in candidates if i not in known]
+
+    def add(self, filing_ids: Iterable[str]) -> None:
+        filing_ids = [str(i) for i in filing_ids]
+        now = time.time()
+        with self.sql_conn:
+            self.sql_conn.executemany("""INSERT OR IGNORE INTO seen_filings
+                (exchange, filing_id, seen_at) VALUES (?, ?, ?)""",
+                [(self.exchange, i, now) for i in filing_ids])
+        self._remember(filing_ids)
+
+    def _remember(self, filing_ids: Iterable[str]) -> None:
+        if len(self._seen) > self.memory_size:
+            self._seen.clear() # older ids are still in the table
+        self._seen.update(filing_ids)
+
+
+class AdaptiveInterval:
+    def __init__(self, min_interval: float=2, max_interval: float=60,
+        backoff: float=1.5):
+        """
+        :param min_interval: seconds between polls while filings come in
+        :param max_interval: longest pause while the listing is quiet
+        :param backoff: factor the pause grows by after each quiet poll
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+
+    def update(self, found_new: bool) -> float:
+        """the pause before the next poll"""
+        if found_new:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+        return self.interval
+
+
+class ConditionalGet:
+    def __init__(self, session: Any, url: str, timeout: float=10,
+        headers: Optional[Dict[str, str]]=None):
+        """GET a url, sending back the validators of the last response so
+        the server can answer 304 when nothing changed. The validators of a
+        response only count once commit() says it was processed, so a poll
+        that fails halfway gets the listing again instead of a 304
+        :param session: a requests session (or anything with the same get)
+        """
+        self.session = session
+        self.url = url
+        self.timeout = timeout
+        self.headers = dict(headers or {})
+        self.etag = None
+        self.last_modified = None
+        self._pending = None
+
+    def get(self) -> Optional[Any]:
+        """the response, None if the resource hasn't changed"""
+        headers = dict(self.headers)
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        res = self.session.get(self.url, headers=headers, timeout=self.timeout)
+        if res.status_code == 304:
+            return None
+        res.raise_for_status()
+        self._pending = (res.headers.get('ETag'), res.headers.get('Last-Modified'))
+        return res
+
+    def commit(self) -> None:
+        """keep the validators of the last response, once it's processed"""
+        if self._pending is None:
+            return
+        etag, last_modified = self._pending
+        self.etag = etag or self.etag
+        self.last_modified = last_modified or self.last_modified
+        self._pending = None
@@ -0,0 +1,186 @@
+"""Partial pdf downloads. Most of a 20-80MB report is never looked at when
+only its first pages are wanted. PyPDF2 reads a pdf lazily through seek and
+read: the trailer and cross-reference table at the end of the file first,
+then each object at the offset the xref gives. RangeFile serves those reads
+from HTTP Range requests, block by block, so only the tail of the file and
+the objects of the pages walked (and their fonts and content streams) are
+downloaded. Servers that ignore Range answer the first request with the
+whole file, which then works like a full download."""
+
+from __future__ import annotations
+from typing import Any, Dict, Iterator, Optional
+import io
+import re
+from .utils import LazyModule
+from ._validation import InvalidDocumentError, check_response, _check_head, \
+    _head_size, _tail_size, _pdf_types, _retry_statuses
+
+PyPDF2 = LazyModule('PyPDF2')
+_pdf = LazyModule('PyPDF2.pdf')
+
+__all__ = ['RangeFile', 'first_pages']
+
+_content_range = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+_inheritable = ('/Resources', '/MediaBox', '/CropBox', '/Rotate')
+
+
+class RangeFile(io.RawIOBase):
+    def __init__(self, session: Any, url: str, block_size: int=1 << 16,
+        timeout: float=10, headers: Optional[Dict[str, str]]=None,
+        validate: bool=True):
+        """a read-only, seekable file over a remote pdf, fetched in blocks
+        with Range requests as it's read. The tail of the file is fetched
+        right away, which also tells its size
+        :param session: a requests session (or anything with the same get)
+        :param block_size: bytes per block. Adjacent missing blocks are
+            fetched in one request
+        :param validate: check the status, content type, magic bytes and
+            %%EOF trailer like get_pdf does. Costs a request for the first
+            block
+        :raise InvalidDocumentError: if the server answers with an error,
+            or with validate, if the file isn't a complete pdf
+        """
+        super().__init__()
+        self.session = session
+        self.url = url
+        self.block_size = block_size
+        self.timeout = timeout
+        self.validate = validate
+        # offsets are into the encoded bytes otherwise
+        self.headers = dict(headers or {}, **{'Accept-Encoding': 'identity'})
+        self.requests = 0
+        self.bytes_fetched = 0
+        self.ranged = True
+        self._blocks: Dict[int, bytes] = {}
+        self._pos = 0
+        self.size = None
+        tail = self._get(f"bytes=-{block_size}")
+        if not validate:
+            return
+        if b"%%EOF" not in tail[-_tail_size:]:
+            raise InvalidDocumentError("no %%EOF trailer, truncated transfer",
+                retryable=True)
+        self._fill(0, min(_head_size, self.size))
+        _check_head(self._blocks[0][:_head_size])
+
+    def _get(self, byte_range: str) -> bytes:
+        """fetch a range and cache the blocks it covers completely"""
+        res = self.session.get(self.url, headers=dict(self.headers, Range=byte_range),
+            timeout=self.timeout)
+        self.requests += 1
+        if res.status_code == 200: # ranges not supported, this is the whole file
+            content = check_response(res) if self.validate else res.content
+            self.bytes_fetched += len(content)
+            self.ranged = False
+            self.size = len(content)
+            self._blocks = {i: content[i * self.block_size:(i + 1) * self.block_size]
+                for i in range(self._block_of(self.size - 1) + 1)}
+            return content
+        if res.status_code != 206:
+            raise InvalidDocumentError(f"http status {res.status_code}",
+                retryable=res.status_code in _retry_statuses)
+        content_type = (res.headers.get('Content-Type') or '').split(';')[0].strip().lower()
+        if self.validate and content_type and content_type not in _pdf_types:
+            raise InvalidDocumentError(f"content type {content_type}",
+                retryable=content_type.startswith('text/'))
+        match = _content_range.match(res.headers.get('Content-Range') or '')
+        if match is None:
+            raise InvalidDocumentError("206 without a Content-Range")
+        start, end = int(match.group(1)), int(match.group(2))
+        if match.group(3) != '*':
+            self.size = int(match.group(3))
+        content = res.content
+        self.bytes_fetched += len(content)
+        if len(content) != end - start + 1:
+            raise InvalidDocumentError(f"got {len(content)} of {end - start + 1} bytes, "
+                "truncated transfer", retryable=True)
+        for block in range(self._block_of(start), self._block_of(end) + 1):
+            block_start = block * self.block_size
+            block_end = min(block_start + self.block_size, self.size)
+            if block_start >= start and block_end - 1 <= end:
+                self._blocks[block] = content[block_start - start:block_end - start]
+        return content
+
+    def _block_of(self, offset: int) -> int:
+        return offset // self.block_size
+
+    def _fill(self, start: int, end: int) -> None:
+        """make sure the bytes start to end (exclusive) are cached, one
+        request per run of missing blocks"""
+        run = None
+        for block in range(self._block_of(start), self._block_of(end - 1) + 1):
+            if block not in self._blocks:
+                run = (run[0], block) if run else (block, block)
+                continue
+            if run:
+                self._fetch_blocks(*run)
+                run = None
+        if run:
+            self._fetch_blocks(*run)
+
+    def _fetch_blocks(self, first: int, last: int) -> None:
+        end = min((last + 1) * self.block_size, self.size) - 1
+        self._get(f"bytes={first * self.block_size}-{end}")
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int=io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._pos = offset
+        return self._pos
+
+    def readinto(self, buffer: Any) -> int:
+        end = min(self._pos + len(buffer), self.size)
+        if end <= self._pos:
+            return 0
+        self._fill(self._pos, end)
+        n = 0
+        while self._pos < end:
+            block, skip = divmod(self._pos, self.block_size)
+            chunk = self._blocks[block][skip:skip + end - self._pos]
+            buffer[n:n + len(chunk)] = chunk
+            n += len(chunk)
+            self._pos += len(chunk)
+        return n
+
+
+def first_pages(reader: Any, max_pages: int) -> Iterator[Any]:
+    """the first pages of a pdf in order, walking the page tree only as far
+    as needed. reader.pages would load every page object of the document
+    :param reader: a PyPDF2.PdfFileReader
+    """
+    def walk(node: Any, inherited: Dict[str, Any], ref: Any) -> Iterator[Any]:
+        # intermediate nodes have kids, pages don't. /Type is sometimes
+        # missing or wrong
+        if '/Kids' in node:
+            inherited = dict(inherited, **{attr: node[attr]
+                for attr in _inheritable if attr in node})
+            for kid in node['/Kids']:
+                is_ref = isinstance(kid, PyPDF2.generic.IndirectObject)
+                yield from walk(kid.getObject(), inherited, kid if is_ref else None)
+            return
+        for attr, value in inherited.items():
+            if attr not in node: # a page's own value wins over its parents'
+                node[PyPDF2.generic.NameObject(attr)] = value
+        page = _pdf.PageObject(reader, ref)
+        page.update(node)
+        yield page
+    if max_pages <= 0:
+        return
+    root = reader.trailer['/Root'].getObject()
+    for n, page in enumerate(walk(root['/Pages'].getObject(), {}, None), 1):
+        yield page
+        if n >= max_pages:
+            return
@@ -0,0 +1,170 @@
+"""Largest-first scheduling for batch downloads. Going through a stock list in
+order, a heavy issuer that comes up last keeps one thread busy long after the
+others are done. Here every piece of work carries an estimated cost (bytes to
+download), the most expensive is handed out first (longest processing time
+first), and a stock's filings go back on the shared queue once its list is
+known, so idle workers pick up the pieces of a heavy stock instead of waiting
+for the one worker that listed it. Tasks that hit an endpoint paused by its
+circuit breaker go back on the queue behind the rest, until it reopens."""
+
+from __future__ import annotations
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
+import datetime as dt
+import itertools
+import queue
+import threading
+import time
+from .utils import iter_by_chunk
+from ._breaker import CircuitOpenError
+
+__all__ = ['Task', 'estimate_costs', 'filing_cost', 'run_largest_first',
+    'request_cost', 'default_filing_size', 'default_filing_count']
+
+# a request costs about as much as downloading this many bytes
+request_cost = 256 << 10
+# assumed size of filings whose size isn't known
+default_filing_size = 1 << 20
+# assumed number of filings left to fetch for a stock that was never listed
+default_filing_count = 10
+
+
+class Task(NamedTuple):
+    cost: float
+    key: str
+    payload: Any = None
+
+
+def filing_cost(size: Optional[float], typical_size: float=default_filing_size) -> float:
+    """estimated cost of downloading one filing of a given size (bytes)"""
+    if size is None or size != size or size <= 0: # None, NaN or unknown
+        size = typical_size
+    return float(size) + request_cost
+
+
+def estimate_costs(store: Any, exchange: str, tickers: Iterable[str],
+    start_date: dt.date, end_date: dt.date, doctype: str='all'
+    ) -> Dict[str, float]:
+    """estimate the cost of each ticker from the filings store: the sizes of
+    its listed filings in the date range (FILE_INFO for hkexnews, F005N for
+    cninfo, recorded by earlier runs) that have no content yet, plus a
+    request each. Tickers that were never listed get the cost of
+    default_filing_count filings of the typical size
+    :param store: a FilingStore
+    :param doctype: only count filings labelled with this doctype
+    :return: dict of ticker: estimated cost, for every ticker
+    """
+    tickers = list(dict.fromkeys(str(ticker) for ticker in tickers))
+    typical_size = store.sql_conn.execute("""SELECT AVG(size) FROM filings
+        WHERE exchange = ? AND size > 0""", (exchange,)).fetchone()[0] \
+        or default_filing_size
+    costs = {}
+    content = store.content_relation()
+    for chunk in iter_by_chunk(tickers, 500):
+        params = [typical_size, request_cost, exchange,
+            start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d 23:59:59')]
+        params.extend(chunk)
+        sql = f"""SELECT f.ticker, COALESCE(SUM(CASE WHEN COALESCE(c.has_content, 0) = 0
+            THEN COALESCE(NULLIF(f.size, 0), ?) + ? ELSE 0 END), 0)
+            FROM filings f LEFT JOIN {content} c
+            ON c.exchange = f.exchange AND c.filing_id = f.filing_id
+            WHERE f.exchange = ? AND f.filing_date BETWEEN ? AND ?
+            AND f.ticker IN ({', '.join('?' * len(chunk))})"""
+        if doctype != 'all':
+            sql += """ AND f.filing_id IN (SELECT filing_id FROM filing_labels
+                WHERE exchange = f.exchange AND doctype = ?)"""
+            params.append(doctype)
+        sql += " GROUP BY f.ticker"
+        costs.update(store.sql_conn.execute(sql, params).fetchall())
+    unlisted = default_filing_count * filing_cost(typical_size)
+    return {ticker: costs.get(ticker, unlisted) for ticker in tickers}
+
+
+def run_largest_first(tasks: Iterable[Task], handle: Callable[[Task], Optional[Iterable[Task]]],
+    max_workers: int=1, ignore_errors: bool=False, verbose: bool=False,
+    on_worker_exit: Optional[Callable[[], None]]=None, max_deferrals: int=5
+    ) -> Dict[str, Any]:
+    """run tasks on a pool of threads, most expensive first
+    :param tasks: the initial tasks
+    :param handle: called with each task in a worker thread. It can return
+        more tasks, which join the same queue
+    :param max_workers: number of worker threads
+    :param ignore_errors: carry on past failed tasks. Otherwise the
+        remaining tasks are dropped and the first error is raised
+    :param on_worker_exit: called in each worker thread before it exits,
+        e.g. to close a thread's sqlite connection
+    :param max_deferrals: times a task raising CircuitOpenError is put back
+        to wait for its endpoint before it counts as failed
+    :return: dict with the number of tasks done, failed and deferred, the
+        elapsed seconds and the busy seconds of each worker
+    """
+    work = queue.PriorityQueue()
+    order = itertools.count()
+    def push(task: Task, not_before: float=0.):
+        # deferred tasks sort after every task that can run now
+        work.put((not_before, -task.cost, next(order), task))
+    for task in tasks:
+        push(task)
+    lock = threading.Lock()
+    stats = dict(done=0, failed=0, deferred=0, busy=[])
+    deferrals: Dict[str, int] = {}
+    errors: List[Exception] = []
+
+    def worker():
+        busy = 0.
+        try:
+            while True:
+                not_before, _, _, task = work.get()
+                if task is None:
+                    work.task_done()
+                    return
+                wait = not_before - time.monotonic()
+                if wait > 0: # only tasks waiting on a paused endpoint are left
+                    time.sleep(wait)
+                start = time.perf_counter()
+                try:
+                    if not errors: # drop the rest after a fatal error
+                        for follow_up in handle(task) or ():
+                            push(follow_up)
+                        with lock: stats['done'] += 1
+                except CircuitOpenError as e:
+                    with lock:
+                        deferrals[task.key] = deferrals.get(task.key, 0) + 1
+                        deferred = deferrals[task.key] <= max_deferrals
+                        stats['deferred' if deferred else 'failed'] += 1
+                        if not deferred and not ignore_errors:
+                            errors.append(e)
+                    if verbose: print(f"{task.key}: {e}{', deferred' if deferred else ''}")
+                    if deferred:
+                        push(task, time.monotonic() + e.retry_in)
+                except Exception as e:
+                    if verbose: print(f"{task.key}: {e}")
+                    with lock:
+                        stats['failed'] += 1
+                        if not ignore_errors:
+                            errors.append(e)
+                finally:
+                    busy += time.perf_counter() - start
+                    work.task_done()
+        finally:
+            with lock: stats['busy'].append(busy)
+            if on_worker_exit is not None:
+                on_worker_exit()
+
+    start = time.perf_counter()
+    n_workers = max(max_workers, 1)
+    threads = [threading.Thread(target=worker, daemon=True)
+        for _ in range(n_workers)]
+    for thread in threads:
+        thread.start()
+    work.join() # follow-ups are pushed before their parent is marked done
+    for _ in threads:
+        work.put((float('inf'), 0., next(order), None))
+    for thread in threads:
+        thread.join()
+    stats['elapsed'] = time.perf_counter() - start
+    if verbose:
+        print(f"{stats['done']} tasks in {stats['elapsed']:.1f}s, worker busy "
+            f"time {min(stats['busy']):.1f}s - {max(stats['busy']):.1f}s")
+    if errors:
+        raise errors[0]
+    return stats
@@ -0,0 +1,242 @@
+"""Sharded filing content. The blobs are what make a store file grow to
+hundreds of GB, so the content (and extracted text) of filings is spread
+over several sqlite files, one per exchange and year or per bucket of
+ticker hashes, while the filing metadata stays in the scraper's own
+database as the catalog. Writes are routed to their shard by looking the
+filing up in the catalog; writers on different shards never wait on each
+other's locks, and each shard can be vacuumed or backed up on its own.
+Reads across shards go through ATTACH, or through parallel per-shard
+queries when there are more shards than sqlite can attach."""
+
+from __future__ import annotations
+from typing import Optional, Tuple, List, Dict, Any, Sequence
+import glob
+import os
+import pathlib
+import re
+import sqlite3
+import zlib
+from ._store import FilingStore, connect
+
+__all__ = ['ShardRouter', 'ShardedFilingStore']
+
+# sqlite's default limit is 10 attached databases, keep some for the caller
+max_attached = 8
+
+
+def _exists(conn: sqlite3.Connection, exchange: str, filing_id: str) -> bool:
+    """whether a filing has a content row, from the primary key alone"""
+    return conn.execute("""SELECT 1 FROM main.filing_content
+        WHERE exchange = ? AND filing_id = ?""", (exchange, str(filing_id))).fetchone() is not None
+
+
+class ShardRouter:
+    schemes = ('exchange_year', 'ticker_hash')
+
+    def __init__(self, directory: str, scheme: str='exchange_year',
+        n_buckets: int=4, prefix: str='content'):
+        """
+        :param directory: where the shard files live
+        :param scheme: 'exchange_year' for a shard per exchange and filing
+            year, 'ticker_hash' for n_buckets shards per exchange
+        :param n_buckets: number of ticker hash buckets. Reads attach every
+            shard while there are at most max_attached, so the default keeps
+            two exchanges within that
+        :param prefix: shard files are named {prefix}_{shard}.db
+        """
+        if scheme not in self.schemes:
+            raise ValueError(f"unknown sharding scheme {scheme}, pick from {self.schemes}")
+        self.directory = directory
+        self.scheme = scheme
+        self.n_buckets = n_buckets
+        self.prefix = prefix
+        os.makedirs(directory, exist_ok=True)
+
+    def shard(self, exchange: str, ticker: Optional[str], filing_date: Optional[str]) -> str:
+        """name of the shard a filing belongs to"""
+        if self.scheme == 'exchange_year':
+            year = str(filing_date or '')[:4]
+            return f"{exchange}_{year if year.isdigit() else 'unknown'}"
+        if ticker is None:
+            return f"{exchange}_unknown"
+        # crc32 rather than hash(), which changes between processes
+        return f"{exchange}_{zlib.crc32(str(ticker).encode('utf-8')) % self.n_buckets:02d}"
+
+    def path(self, shard: str) -> str:
+        return os.path.join(self.directory, f"{self.prefix}_{shard}.db")
+
+    def shards(self) -> List[str]:
+        """names of the shards that exist on disk"""
+        pattern = re.compile(f"^{re.escape(self.prefix)}_(.+)\\.db$")
+        names = [pattern.match(os.path.basename(path))
+            for path in glob.glob(os.path.join(self.directory, f"{self.prefix}_*.db"))]
+        return sorted(match.group(1) for match in names if match)
+
+    def fan_out(self, sql: str, params: Sequence[Any]=(),
+        shards: Optional[List[str]]=None, max_workers: int=8,
+        with_shard: bool=False) -> List[tuple]:
+        """run the same query on every shard in parallel, each on its own
+        connection, and concatenate the rows
+        :param with_shard: put the name of its shard ahead of each row"""
+        def query(shard: str) -> List[tuple]:
+            conn = sqlite3.connect(self.path(shard))
+            try:
+                rows = conn.execute(sql, params).fetchall()
+            finally:
+                conn.close()
+            return [(shard,) + row for row in rows] if with_shard else rows
+        shards = self.shards() if shards is None else shards
+        if not shards:
+            return []
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(shards))) as executor:
+            return [row for rows in executor.map(query, shards) for row in rows]
+
+
+class ShardedFilingStore(FilingStore):
+    def __init__(self, sql_conn: sqlite3.Connection, router: ShardRouter,
+        read_only: bool=False):
+        """a FilingStore whose content lives in shards
+        :param sql_conn: the catalog, holding filings, labels and quarantine
+        :param router: decides which shard a filing's content goes to
+        :param read_only: see FilingStore. The shards are opened read-only
+            too, and a shard that doesn't exist reads as empty. sql_conn has
+            to take URI filenames, which connect(path, read_only=True) does
+        """
+        self.router = router
+        self._shards: Dict[str, FilingStore] = {}
+        self._attached: List[str] = []
+        # data_version of each shard (and of the catalog, '') when its rows
+        # of filing_content_flags were collected, None until then
+        self._flag_versions: Optional[Dict[str, int]] = None
+        super().__init__(sql_conn, read_only)
+        # content saved before sharding, looked for only if there is any
+        self._legacy = self.sql_conn.execute(
+            "SELECT 1 FROM main.filing_content LIMIT 1").fetchone() is not None
+
+    def _shard_store(self, shard: str) -> FilingStore:
+        if shard not in self._shards:
+            path = self.router.path(shard)
+            if self.read_only and not os.path.exists(path):
+                self._shards[shard] = FilingStore(sqlite3.connect(':memory:'))
+            else:
+                self._shards[shard] = FilingStore(connect(path, self.read_only,
+                    timeout=60), self.read_only)
+        return self._shards[shard]
+
+    def _locate(self, exchange: str, filing_id: str) -> str:
+        row = self.sql_conn.execute("""SELECT ticker, filing_date FROM filings
+            WHERE exchange = ? AND filing_id = ?""", (exchange, str(filing_id))).fetchone()
+        return self.router.shard(exchange, *(row or (None, None)))
+
+    def content_conn(self, exchange: str, filing_id: str) -> sqlite3.Connection:
+        store = self._shard_store(self._locate(exchange, filing_id))
+        if self._legacy and not _exists(store.sql_conn, exchange, filing_id) \
+            and _exists(self.sql_conn, exchange, filing_id):
+            return self.sql_conn # saved before sharding
+        return store.sql_conn
+
+    def get_content(self, exchange: str, filing_id: str
+        ) -> Optional[Tuple[Optional[bytes], Optional[str]]]:
+        """the content from the filing's shard, or from the catalog for
+        filings saved before the store was sharded"""
+        stored = self._shard_store(self._locate(exchange, filing_id)).get_content(
+            exchange, filing_id)
+        if stored is None and self._legacy:
+            return super().get_content(exchange, filing_id)
+        return stored
+
+    def insert_content(self, exchange: str, filing_id: str,
+        content: Optional[bytes]=None, text: Optional[str]=None) -> None:
+        shard = self._locate(exchange, filing_id)
+        self._shard_store(shard).insert_content(exchange, filing_id, content, text)
+        if self._legacy and _exists(self.sql_conn, exchange, filing_id):
+            with self.sql_conn: # moves filings saved before sharding
+                self.sql_conn.execute("""DELETE FROM main.filing_content
+                    WHERE exchange = ? AND filing_id = ?""", (exchange, str(filing_id)))
+        if self._flag_versions is not None: # our own writes don't move data_version
+            with self.sql_conn:
+                self.sql_conn.execute("""INSERT OR REPLACE INTO filing_content_flags
+                    VALUES (?, ?, ?, ?, ?)""", (shard, exchange, str(filing_id),
+                    content is not None, text is not None))
+
+    def content_relation(self) -> str:
+        """attach the shards to the catalog connection and return a temp
+        view over their content flags. With more shards than can be
+        attached, the flags are collected by parallel per-shard queries
+        into a temp table instead (see _collect_flags)"""
+        shards = self.router.shards()
+        if len(shards) > max_attached:
+            self._collect_flags(shards)
+            return "filing_content_flags"
+        for shard in shards:
+            if shard not in self._attached:
+                self._shard_store(shard) # make sure the tables exist
+                path = self.router.path(shard)
+                if self.read_only: # attached with the catalog's uri flag
+                    path = f"{pathlib.Path(path).absolute().as_uri()}?mode=ro"
+                self.sql_conn.execute("ATTACH DATABASE ? AS ?",
+                    (path, f"shard_{len(self._attached)}"))
+                self._attached.append(shard)
+        branches = [f"""SELECT exchange, filing_id, has_content, has_text
+            FROM {schema}.filing_content INDEXED BY filing_content_present"""
+            for schema in ['main'] + [f"shard_{i}" for i in range(len(self._attached))]]
+        self.sql_conn.execute("DROP VIEW IF EXISTS filing_content_shards")
+        self.sql_conn.execute("CREATE TEMP VIEW filing_content_shards AS "
+            + " UNION ALL ".join(branches))
+        return "filing_content_shards"
+
+    def _collect_flags(self, shards: List[str]) -> None:
+        """fill the filing_content_flags temp table with the content flags of
+        the catalog and of every shard. The table is kept for the life of the
+        connection: a shard is only queried again once another connection
+        wrote to it (its data_version moved), and insert_content updates it
+        in place, so costing stocks one by one doesn't redo the fan-out"""
+        versions = {shard: self._shard_store(shard).sql_conn.execute(
+            "PRAGMA data_version").fetchone()[0] for shard in shards}
+        versions[''] = self.sql_conn.execute("PRAGMA data_version").fetchone()[0]
+        known = self._flag_versions or {}
+        stale = [shard for shard in versions if known.get(shard) != versions[shard]]
+        gone = [shard for shard in known if shard not in versions]
+        if not stale and not gone:
+            return
+        rows = []
+        if '' in stale:
+            rows = [('',) + row for row in self.sql_conn.execute("""SELECT exchange,
+                filing_id, has_content, has_text FROM main.filing_content""")]
+        rows += self.router.fan_out("""SELECT exchange, filing_id, has_content,
+            has_text FROM filing_content""", shards=[shard for shard in stale if shard],
+            with_shard=True)
+        with self.sql_conn:
+            if self._flag_versions is None:
+                self.sql_conn.execute("DROP VIEW IF EXISTS filing_content_shards")
+                self.sql_conn.execute("DROP TABLE IF EXISTS temp.filing_content_flags")
+                self.sql_conn.execute("""CREATE TEMP TABLE filing_content_flags (
+                    shard TEXT, exchange TEXT, filing_id TEXT,
+                    has_content INTEGER, has_text INTEGER,
+                    PRIMARY KEY (exchange, filing_id))""")
+                self.sql_conn.execute("""CREATE INDEX temp.filing_content_flags_shard
+                    ON filing_content_flags (shard)""")
+            self.sql_conn.executemany("DELETE FROM filing_content_flags WHERE shard = ?",
+                [(shard,) for shard in stale + gone])
+            self.sql_conn.executemany("""INSERT OR REPLACE INTO filing_content_flags
+                VALUES (?, ?, ?, ?, ?)""", rows)
+        self._flag_versions = versions
+
+    def shard_sizes(self) -> Dict[str, int]:
+        """size on disk of each shard, in bytes"""
+        return {shard: os.path.getsize(self.router.path(shard))
+            for shard in self.router.shards()}
+
+    def vacuum(self, shards: Optional[List[str]]=None) -> None:
+        """vacuum shards one at a time, only locking the one being vacuumed"""
+        for shard in shards or self.router.shards():
+            store = self._shard_store(shard)
+            store.sql_conn.execute("VACUUM")
+
+    def close(self) -> None:
+        """close the shard connections (the catalog belongs to the caller)"""
+        for store in self._shards.values():
+            store.sql_conn.close()
+        self._shards = {}
+        self._flag_versions = None # the versions were those of the connections
@@ -0,0 +1,214 @@
+"""Unified filings store. Filing metadata from every exchange goes into one
+`filings` table, keyed by (exchange, filing_id), so that it can be queried
+without knowing which per-stock table a filing was saved into.
+Content (bytes and extracted text) is kept apart in `filing_content`, so
+listing metadata never has to touch the blobs. Downloads that failed
+validation are set aside in `filing_quarantine` with the reason."""
+
+from __future__ import annotations
+from typing import Iterable, Optional, Sequence, Tuple, Any, List
+import pathlib
+import time
+import sqlite3
+from .utils import iter_by_chunk
+
+__all__ = ['FilingStore', 'filing_fields', 'connect']
+
+filing_fields = ('exchange', 'filing_id', 'ticker', 'issuer', 'doctype',
+    'filing_date', 'title', 'url', 'size')
+
+
+def connect(path: str, read_only: bool=False, **kwargs: Any) -> sqlite3.Connection:
+    """open a sqlite database, through a mode=ro URI if read_only, so that
+    a copy on read-only storage can be opened and nothing is ever written
+    :param kwargs: passed to sqlite3.connect
+    """
+    if not read_only:
+        return sqlite3.connect(path, **kwargs)
+    return sqlite3.connect(f"{pathlib.Path(path).absolute().as_uri()}?mode=ro",
+        uri=True, **kwargs)
+
+
+class FilingStore:
+    def __init__(self, sql_conn: sqlite3.Connection, read_only: bool=False):
+        """
+        :param sql_conn: the sqlite connection the store lives in. Usually
+            the scraper's own `sql_conn`
+        :param read_only: don't create or migrate the tables, which have to
+            be there already (ValueError otherwise), as for a connection
+            opened with connect(path, read_only=True)
+        """
+        self.sql_conn = sql_conn
+        self.read_only = read_only
+        if read_only:
+            self.check_tables()
+        else:
+            self.create_tables()
+
+    def check_tables(self) -> None:
+        """make sure the store tables exist in their current layout
+        :raise ValueError: if they don't, e.g. the database was last written
+            by an older version. Opening it once with a scraper migrates it
+        """
+        columns = [row[1] for row in self.sql_conn.execute(
+            "PRAGMA table_info(filing_content)")]
+        if not self.sql_conn.execute("""SELECT 1 FROM sqlite_master
+            WHERE type = 'table' AND name = 'filings'""").fetchone() \
+            or 'has_text' not in columns:
+            raise ValueError("the filings store is missing or out of date, "
+                "open it once with a scraper to create or migrate it")
+
+    def create_tables(self) -> None:
+        """create the store tables if they don't exist yet"""
+        with self.sql_conn:
+            self.sql_conn.execute("""CREATE TABLE IF NOT EXISTS filings (
+                exchange TEXT NOT NULL,
+                filing_id TEXT NOT NULL,
+                ticker TEXT,
+                issuer TEXT,
+                doctype TEXT,
+                filing_date TEXT,
+                title TEXT,
+                url TEXT,
+                size INTEGER,
+                PRIMARY KEY (exchange, filing_id))""")
+            self.sql_conn.execute("""CREATE INDEX IF NOT EXISTS
+                filings_ticker_date ON filings (exchange, ticker, filing_date)""")
+            self.sql_conn.execute("""CREATE TABLE IF NOT EXISTS filing_labels (
+                exchange TEXT NOT NULL,
+                filing_id TEXT NOT NULL,
+                doctype TEXT NOT NULL,
+                PRIMARY KEY (exchange, filing_id, doctype))""")
+            self.sql_conn.execute("""CREATE TABLE IF NOT EXISTS filing_content (
+                exchange TEXT NOT NULL,
+                filing_id TEXT NOT NULL,
+                content BLOB,
+                text TEXT,
+                has_content INTEGER NOT NULL DEFAULT 0,
+                has_text INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (exchange, filing_id))""")
+            columns = [row[1] for row in self.sql_conn.execute(
+                "PRAGMA table_info(filing_content)")]
+            if 'has_text' not in columns: # stores made before the flags
+                for flag in ('has_content', 'has_text'):
+                    self.sql_conn.execute(f"""ALTER TABLE filing_content
+                        ADD COLUMN {flag} INTEGER NOT NULL DEFAULT 0""")
+                self.sql_conn.execute("""UPDATE filing_content SET
+                    has_content = content IS NOT NULL, has_text = text IS NOT NULL""")
+            # the flags are covered by this index, so filtering on them
+            # never has to read the blobs
+            self.sql_conn.execute("""CREATE INDEX IF NOT EXISTS
+                filing_content_present ON filing_content (exchange, filing_id,
+                has_content, has_text)""")
+            self.sql_conn.execute("""CREATE TABLE IF NOT EXISTS filing_quarantine (
+                exchange TEXT NOT NULL,
+                filing_id TEXT NOT NULL,
+                url TEXT,
+                reason TEXT,
+                attempts INTEGER NOT NULL DEFAULT 1,
+                content BLOB,
+                quarantined_at REAL,
+                PRIMARY KEY (exchange, filing_id))""")
+
+    def insert_filings(self, rows: Iterable[Sequence[Any]],
+        batch_size: int=5000, replace: bool=False) -> int:
+        """insert filing metadata in batched transactions
+        :param rows: tuples ordered as `filing_fields`
+        :param batch_size: number of rows committed per transaction
+        :param replace: overwrite existing rows if True, otherwise keep them
+            and only fill in a missing doctype
+        :return: number of rows passed in
+        """
+        sql = f"""{"INSERT OR REPLACE" if replace else "INSERT"} INTO filings
+            ({', '.join(filing_fields)})
+            VALUES ({', '.join('?' * len(filing_fields))})"""
+        if not replace:
+            sql += """ ON CONFLICT (exchange, filing_id) DO UPDATE
+                SET doctype = COALESCE(filings.doctype, excluded.doctype)"""
+        n = 0
+        for chunk in iter_by_chunk(rows, batch_size):
+            with self.sql_conn:
+                self.sql_conn.executemany(sql, chunk)
+            n += len(chunk)
+        return n
+
+    def insert_labels(self, rows: Iterable[Tuple[str, str, str]]) -> None:
+        """label filings with the doctypes they were listed under. A filing
+        can carry several labels, e.g. a category and its parent category
+        :param rows: (exchange, filing_id, doctype) tuples
+        """
+        with self.sql_conn:
+            self.sql_conn.executemany("""INSERT OR IGNORE INTO filing_labels
+                (exchange, filing_id, doctype) VALUES (?, ?, ?)""", rows)
+
+    def get_content(self, exchange: str, filing_id: str
+        ) -> Optional[Tuple[Optional[bytes], Optional[str]]]:
+        """
+        :return: the (content, text) of a filing, None if it isn't stored
+        """
+        return self.sql_conn.execute("""SELECT content, text FROM filing_content
+            WHERE exchange = ? AND filing_id = ?""",
+            (exchange, str(filing_id))).fetchone()
+
+    def insert_content(self, exchange: str, filing_id: str,
+        content: Optional[bytes]=None, text: Optional[str]=None) -> None:
+        """save the content and/or text of a single filing"""
+        with self.sql_conn:
+            self.sql_conn.execute("""INSERT OR REPLACE INTO filing_content
+                (exchange, filing_id, content, text, has_content, has_text)
+                VALUES (?, ?, ?, ?, ?, ?)""",
+                (exchange, str(filing_id), content, text, content is not None,
+                    text is not None))
+
+    def quarantine(self, exchange: str, filing_id: str, url: Optional[str],
+        reason: str, content: Optional[bytes]=None, attempts: int=1) -> None:
+        """set aside a filing whose download failed validation. The payload
+        is kept (up to 1MB) to see what the server sent"""
+        with self.sql_conn:
+            self.sql_conn.execute("""INSERT OR REPLACE INTO filing_quarantine
+                (exchange, filing_id, url, reason, attempts, content, quarantined_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (exchange, str(filing_id), url, reason, attempts,
+                    None if content is None else bytes(content[:1 << 20]),
+                    time.time()))
+
+    def quarantined(self, exchange: Optional[str]=None
+        ) -> List[Tuple[str, str, str, str, int]]:
+        """
+        :return: (exchange, filing_id, url, reason, attempts) of the
+            quarantined filings, to look into or to retry
+        """
+        sql = """SELECT exchange, filing_id, url, reason, attempts
+            FROM filing_quarantine"""
+        if exchange is None:
+            return self.sql_conn.execute(sql).fetchall()
+        return self.sql_conn.execute(sql + " WHERE exchange = ?",
+            (exchange,)).fetchall()
+
+    def release(self, exchange: str, filing_id: str) -> None:
+        """take a filing out of the quarantine"""
+        with self.sql_conn:
+            self.sql_conn.execute("""DELETE FROM filing_quarantine
+                WHERE exchange = ? AND filing_id = ?""", (exchange, str(filing_id)))
+
+    def content_conn(self, exchange: str, filing_id: str) -> sqlite3.Connection:
+        """the connection holding a filing's content"""
+        return self.sql_conn
+
+    def content_relation(self) -> str:
+        """name of the view (or table) to read content flags from, with
+        columns exchange, filing_id, has_content and has_text, in queries
+        on sql_conn. The view pins the covering index, so the blobs are
+        never read"""
+        self.sql_conn.execute("""CREATE TEMP VIEW IF NOT EXISTS filing_content_local
+            AS SELECT exchange, filing_id, has_content, has_text
+            FROM main.filing_content INDEXED BY filing_content_present""")
+        return "filing_content_local"
+
+    def count(self, exchange: Optional[str]=None) -> int:
+        """number of filings in the store, optionally for one exchange"""
+        if exchange is None:
+            return self.sql_conn.execute("SELECT COUNT(*) FROM filings").fetchone()[0]
+        return self.sql_conn.execute(
+            "SELECT COUNT(*) FROM filings WHERE exchange = ?", (exchange,)
+            ).fetchone()[0]
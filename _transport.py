@@ -0,0 +1,285 @@
+"""HTTP transport. Sessions get a connection pool sized to the number of
+threads that will share them, and block for a free connection rather than
+opening one that gets thrown away ("connection pool is full, discarding
+connection"). Optionally an HTTP/2 client (httpx, if installed) can be used
+instead, multiplexing requests to a host over a few connections.
+Both report how many requests went over reused connections.
+Sessions can also be given a request rate and a bandwidth budget, enforced
+by token buckets in the adapter, so that each exchange of a combined run
+stays within its own limits, and per-endpoint adaptive timeouts with
+circuit breakers (see _breaker)."""
+
+from __future__ import annotations
+from typing import Dict, Any, Optional, Union
+import threading
+import time
+import weakref
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from ._breaker import CircuitOpenError, Endpoint, Endpoints, failure_statuses
+
+__all__ = ['make_session', 'Http2Session', 'connection_stats', 'default_session',
+    'TokenBucket', 'BudgetedAdapter', 'endpoint_stats', 'CircuitOpenError', 'Endpoints']
+
+_default_session = None
+_default_lock = threading.Lock()
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float]=None):
+        """
+        :param rate: tokens added per second
+        :param capacity: most tokens that can pile up while idle, one
+            second's worth by default
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, amount: float=1) -> float:
+        """take tokens, sleeping until the bucket can pay for them. Amounts
+        larger than the capacity put the bucket in debt, so a big download
+        delays what comes after it rather than never going through
+        :return: seconds slept"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity,
+                self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class BudgetedAdapter(HTTPAdapter):
+    def __init__(self, requests_per_second: Optional[float]=None,
+        bytes_per_second: Optional[float]=None, endpoints: Optional[Endpoints]=None,
+        **kwargs):
+        """HTTPAdapter holding every thread that shares it to a request
+        rate and a bandwidth budget
+        :param requests_per_second: request rate, unlimited if None
+        :param bytes_per_second: download bandwidth, unlimited if None
+        :param endpoints: adapt the timeout of each endpoint to its latency
+            and fail fast with CircuitOpenError while its breaker is open,
+            and give bodies of known size a deadline scaled to it.
+            Fixed timeouts if None
+        :param kwargs: passed to HTTPAdapter
+        """
+        self.request_bucket = TokenBucket(requests_per_second) \
+            if requests_per_second else None
+        self.byte_bucket = TokenBucket(bytes_per_second) \
+            if bytes_per_second else None
+        self.endpoints = endpoints
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        endpoint = None
+        if self.endpoints is not None:
+            endpoint = self.endpoints.get(request.url)
+            endpoint.acquire() # before spending any budget on it
+            kwargs['timeout'] = endpoint.timeout(kwargs.get('timeout'))
+        if self.request_bucket is not None:
+            self.request_bucket.take(1)
+        start = time.monotonic()
+        try:
+            response = super().send(request, **kwargs)
+        except requests.exceptions.Timeout:
+            if endpoint is not None:
+                endpoint.record_failure(time.monotonic() - start)
+            raise
+        except requests.exceptions.ConnectionError:
+            if endpoint is not None:
+                endpoint.record_failure()
+            raise
+        if endpoint is not None:
+            if response.status_code in failure_statuses:
+                endpoint.record_failure()
+            else: # send returns with the headers, the body is read later
+                endpoint.record_success(time.monotonic() - start)
+        if self.byte_bucket is not None or endpoint is not None:
+            self._meter(response, endpoint)
+        return response
+
+    def _meter(self, response, endpoint: Optional[Endpoint]=None) -> None:
+        """charge the byte budget as the body is read, chunk by chunk, so
+        streamed and chunked bodies count too and a big download is paced
+        while it comes in. With an endpoint, a body of known size has to be
+        read within the endpoint's deadline for that size (a ReadTimeoutError,
+        which requests raises as a ConnectionError, otherwise), and its
+        transfer rate is recorded for the next deadlines"""
+        raw = response.raw
+        stream = getattr(raw, 'stream', None)
+        if stream is None:
+            return
+        bucket = self.byte_bucket
+        try:
+            size = int(response.headers.get('Content-Length'))
+        except (TypeError, ValueError): # chunked
+            size = None
+        def metered(*args, **kwargs):
+            deadline = endpoint.deadline(size) if endpoint is not None else None
+            start, read = time.monotonic(), 0
+            for chunk in stream(*args, **kwargs):
+                if bucket is not None:
+                    bucket.take(len(chunk))
+                read += len(chunk)
+                if deadline is not None and time.monotonic() - start > deadline:
+                    endpoint.record_transfer(read, time.monotonic() - start, size)
+                    endpoint.record_failure()
+                    raise ReadTimeoutError(None, response.url,
+                        f"{size} byte body not read within {deadline:.1f}s")
+                yield chunk
+            if endpoint is not None and size is not None:
+                endpoint.record_transfer(read, time.monotonic() - start)
+        raw.stream = metered
+
+
+def make_session(pool_size: int=10, max_retries: int=3, http2: bool=False,
+    schemas=('https://', 'http://'), requests_per_second: Optional[float]=None,
+    bytes_per_second: Optional[float]=None, circuit_breaker: bool=False
+    ) -> Union[requests.Session, Http2Session]:
+    """
+    :param pool_size: connections kept per host. Set it to the number of
+        threads sharing the session
+    :param max_retries: retries per request
+    :param http2: use an HTTP/2 client instead of requests
+    :param schemas: the schemas to mount the pooled adapter on
+    :param requests_per_second: request rate budget of the session
+    :param bytes_per_second: download bandwidth budget of the session
+    :param circuit_breaker: adaptive timeouts and circuit breakers per
+        endpoint, see _breaker
+    """
+    if http2:
+        if requests_per_second or bytes_per_second or circuit_breaker:
+            raise ValueError("budgets and circuit breakers need an HTTP/1.1 session")
+        return Http2Session(pool_size=pool_size, max_retries=max_retries)
+    session = requests.Session()
+    adapter = BudgetedAdapter(requests_per_second, bytes_per_second,
+        endpoints=Endpoints() if circuit_breaker else None,
+        pool_connections=max(pool_size, 10), pool_maxsize=pool_size,
+        pool_block=True, max_retries=max_retries)
+    for schema in schemas:
+        session.mount(schema, adapter)
+    return session
+
+
+def default_session() -> requests.Session:
+    """a process wide session, for calls that aren't given one"""
+    global _default_session
+    if _default_session is None:
+        with _default_lock:
+            if _default_session is None:
+                _default_session = make_session(pool_size=32)
+    return _default_session
+
+
+def connection_stats(session: Union[requests.Session, Http2Session]) -> Dict[str, int]:
+    """
+    :return: dict of requests made, connections opened and requests that
+        went over an already open connection
+    """
+    if isinstance(session, Http2Session):
+        return session.stats()
+    n_requests, n_connections = 0, 0
+    for adapter in set(session.adapters.values()):
+        pools = getattr(getattr(adapter, 'poolmanager', None), 'pools', None)
+        if pools is None:
+            continue
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            n_requests += pool.num_requests
+            n_connections += pool.num_connections
+    return dict(requests=n_requests, connections=n_connections,
+        reused=max(n_requests - n_connections, 0))
+
+
+def endpoint_stats(session: Any) -> Dict[str, Dict[str, Any]]:
+    """
+    :return: dict of endpoint: its breaker state, failures, trips, latency
+        percentiles and current timeout, for sessions with circuit breakers
+    """
+    stats = {}
+    for adapter in set(getattr(session, 'adapters', {}).values()):
+        if getattr(adapter, 'endpoints', None) is not None:
+            stats.update(adapter.endpoints.stats())
+    return stats
+
+
+class Http2Session:
+    def __init__(self, pool_size: int=10, max_retries: int=3, **kwargs):
+        """requests-like wrapper over an httpx client with HTTP/2 enabled.
+        Needs `httpx[http2]` installed.
+        :param pool_size: maximum connections per host. With HTTP/2 a few
+            connections carry all the concurrent requests
+        :param max_retries: connection retries
+        """
+        try:
+            import httpx
+        except ImportError as e:
+            raise ImportError("http2 needs httpx, run `pip install httpx[http2]`") from e
+        self._lock = threading.Lock()
+        self._requests = 0
+        # streams seen so far, weakly so that a closed connection's stream
+        # can go (and an id reused by a new one doesn't hide it)
+        self._streams = weakref.WeakSet()
+        self._connections = 0
+        self._versions: Dict[str, int] = {}
+        self.headers = {}
+        self.client = httpx.Client(http2=True, follow_redirects=True,
+            limits=httpx.Limits(max_connections=pool_size,
+                max_keepalive_connections=pool_size),
+            transport=httpx.HTTPTransport(http2=True, retries=max_retries),
+            event_hooks={'response': [self._count]}, **kwargs)
+
+    def _count(self, response) -> None:
+        stream = response.extensions.get('network_stream')
+        with self._lock:
+            self._requests += 1
+            if stream is not None and stream not in self._streams:
+                self._streams.add(stream)
+                self._connections += 1
+            self._versions[response.http_version] = self._versions.get(
+                response.http_version, 0) + 1
+
+    def mount(self, prefix: str, adapter: Any) -> None:
+        """no-op, for code written against requests.Session"""
+        pass
+
+    def request(self, method: str, url: str, params: Optional[Dict]=None,
+        data: Any=None, headers: Optional[Dict]=None, timeout: Any=None,
+        **kwargs):
+        """same arguments as requests.Session.request, returns an httpx
+        Response (which has .content, .text, .json() and .status_code)"""
+        merged = dict(self.headers)
+        merged.update(headers or {})
+        if timeout is None:
+            return self.client.request(method, url, params=params, data=data,
+                headers=merged, **kwargs)
+        return self.client.request(method, url, params=params, data=data,
+            headers=merged, timeout=timeout, **kwargs)
+
+    def get(self, url: str, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def head(self, url: str, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            n_connections = self._connections
+            return dict(requests=self._requests, connections=n_connections,
+                reused=max(self._requests - n_connections, 0),
+                http_versions=dict(self._versions))
+
+    def close(self) -> None:
+        self.client.close()
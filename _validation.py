@@ -0,0 +1,92 @@
+"""Cheap checks on downloaded filings before anything tries to parse them.
+Throttling pages, HTML interstitials and truncated transfers come back with a
+200 often enough that they used to end up stored as filing content and only
+fail much later inside PyPDF2. These checks only look at the status, the
+headers and both ends of the payload."""
+
+from __future__ import annotations
+from typing import Any, Optional
+import re
+
+__all__ = ['InvalidDocumentError', 'check_pdf', 'check_response', 'is_valid_pdf']
+
+_html_start = re.compile(rb"\s*(<!doctype|<html|<head|<body|<\?xml|<script|<meta)", re.I)
+# PyPDF2 looks for %%EOF in the last 1024 bytes, leave some slack for
+# trailing whitespace and junk
+_tail_size = 2048
+# the magic bytes may come after some junk
+_head_size = 1024
+_pdf_types = ('application/pdf', 'application/x-pdf', 'application/octet-stream',
+    'binary/octet-stream', 'application/force-download', 'application/download')
+# worth trying again later: throttling and server errors, cut off transfers
+_retry_statuses = (408, 425, 429, 500, 502, 503, 504)
+
+
+class InvalidDocumentError(ValueError):
+    def __init__(self, reason: str, retryable: bool=False,
+        content: Optional[bytes]=None):
+        """
+        :param reason: what was wrong with the payload
+        :param retryable: whether fetching it again may help (throttling,
+            truncated transfers), as opposed to a document that is broken
+        :param content: the payload, kept for the quarantine
+        """
+        super().__init__(reason)
+        self.reason = reason
+        self.retryable = retryable
+        self.content = content
+
+
+def check_pdf(content: Optional[bytes]) -> None:
+    """raise InvalidDocumentError unless the payload starts with the pdf
+    magic bytes and ends with an %%EOF marker"""
+    if not content:
+        raise InvalidDocumentError("empty payload", retryable=True, content=content)
+    _check_head(bytes(content[:_head_size]), content)
+    if b"%%EOF" not in bytes(content[-_tail_size:]):
+        raise InvalidDocumentError("no %%EOF trailer, truncated transfer",
+            retryable=True, content=content)
+
+
+def _check_head(head: bytes, content: Optional[bytes]=None) -> None:
+    """raise InvalidDocumentError unless the first bytes of a payload have
+    the pdf magic bytes"""
+    if b"%PDF-" not in head:
+        if _html_start.match(head):
+            raise InvalidDocumentError("html page instead of a pdf",
+                retryable=True, content=content)
+        raise InvalidDocumentError("no %PDF- header", content=content)
+
+
+def is_valid_pdf(content: Optional[bytes]) -> bool:
+    try:
+        check_pdf(content)
+    except InvalidDocumentError:
+        return False
+    return True
+
+
+def check_response(response: Any) -> bytes:
+    """check the status, Content-Type and Content-Length of a pdf download
+    and the payload itself
+    :param response: a requests (or httpx) response
+    :return: the content
+    """
+    content = response.content
+    status = response.status_code
+    if status != 200:
+        raise InvalidDocumentError(f"http status {status}",
+            retryable=status in _retry_statuses, content=content)
+    content_type = (response.headers.get('Content-Type') or '').split(';')[0].strip().lower()
+    if content_type and content_type not in _pdf_types:
+        raise InvalidDocumentError(f"content type {content_type}",
+            retryable=content_type.startswith('text/'), content=content)
+    length = response.headers.get('Content-Length')
+    # with a content encoding the header counts the compressed bytes
+    if length and length.isdigit() and not response.headers.get('Content-Encoding') \
+        and int(length) != len(content):
+        raise InvalidDocumentError(
+            f"got {len(content)} of {length} bytes, truncated transfer",
+            retryable=True, content=content)
+    check_pdf(content)
+    return content
@@ -0,0 +1,222 @@
+"""Cooperative work queue for spreading batch downloads over any number of
+worker processes and machines. Items (a ticker, a filing) are leased to one
+worker at a time for a limited period, which the worker keeps extending with
+heartbeats while it works. If a worker dies its lease expires and the item
+goes to someone else.
+
+WorkQueue is the interface; SQLiteWorkQueue keeps the queue in a sqlite file,
+relying on sqlite's file locking, so every worker only needs access to the
+same file (local disk, or a network share with working locks)."""
+
+from __future__ import annotations
+from typing import Optional, Iterable, Dict, Any, Callable, NamedTuple
+from abc import ABC, abstractmethod
+import json
+import os
+import sqlite3
+import threading
+import time
+
+__all__ = ['Lease', 'WorkQueue', 'SQLiteWorkQueue', 'run_worker']
+
+
+class Lease(NamedTuple):
+    item_id: int
+    item: str
+    payload: Dict[str, Any]
+    worker_id: str
+    token: str
+    attempts: int
+
+
+class WorkQueue(ABC):
+    lease_seconds = 300
+
+    @abstractmethod
+    def put(self, items: Iterable[str], payload: Optional[Dict[str, Any]]=None,
+        priority: int=0) -> int:
+        """add items to the queue. Items already queued with the same
+        payload are left alone
+        :return: number of items added"""
+        pass
+
+    @abstractmethod
+    def lease(self, worker_id: str) -> Optional[Lease]:
+        """take the next pending (or expired) item, None if there is none"""
+        pass
+
+    @abstractmethod
+    def heartbeat(self, lease: Lease) -> bool:
+        """extend a lease. False if the lease was lost to another worker"""
+        pass
+
+    @abstractmethod
+    def complete(self, lease: Lease) -> None:
+        pass
+
+    @abstractmethod
+    def fail(self, lease: Lease, error: str) -> None:
+        """give an item back, or mark it failed once out of attempts"""
+        pass
+
+    @abstractmethod
+    def counts(self) -> Dict[str, int]:
+        """number of items per status"""
+        pass
+
+    def keep_alive(self, lease: Lease, interval: Optional[float]=None
+        ) -> threading.Event:
+        """heartbeat a lease from a background thread until the returned
+        event is set"""
+        interval = interval or self.lease_seconds / 3
+        stop = threading.Event()
+        def beat():
+            while not stop.wait(interval):
+                if not self.heartbeat(lease):
+                    break
+        threading.Thread(target=beat, daemon=True).start()
+        return stop
+
+
+class SQLiteWorkQueue(WorkQueue):
+    def __init__(self, path: str='work_queue.db', name: str='default',
+        lease_seconds: int=300, max_attempts: int=3):
+        """
+        :param path: path to the sqlite file shared by all the workers
+        :param name: name of the queue, several queues can share a file
+        :param lease_seconds: how long a lease lasts without a heartbeat
+        :param max_attempts: items are marked failed after this many leases
+        """
+        self.path = path
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self.sql_conn = sqlite3.connect(path, timeout=60, isolation_level=None,
+            check_same_thread=False)
+        self.sql_conn.execute("""CREATE TABLE IF NOT EXISTS work_queue (
+            item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            queue TEXT NOT NULL,
+            item TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'pending',
+            worker_id TEXT,
+            lease_token TEXT,
+            lease_expires REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            UNIQUE (queue, item, payload))""")
+        self.sql_conn.execute("""CREATE INDEX IF NOT EXISTS
+            work_queue_next ON work_queue (queue, status, priority, item_id)""")
+
+    def put(self, items: Iterable[str], payload: Optional[Dict[str, Any]]=None,
+        priority: int=0) -> int:
+        payload = json.dumps(payload or {}, sort_keys=True, default=str)
+        with self._lock:
+            cur = self.sql_conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            cur.executemany("""INSERT OR IGNORE INTO work_queue
+                (queue, item, payload, priority) VALUES (?, ?, ?, ?)""",
+                [(self.name, str(item), payload, priority) for item in items if str(item).strip()])
+            n = cur.rowcount
+            cur.execute("COMMIT")
+        return n
+
+    def lease(self, worker_id: str) -> Optional[Lease]:
+        now = time.time()
+        with self._lock:
+            cur = self.sql_conn.cursor()
+            cur.execute("BEGIN IMMEDIATE") # lock the file so only one worker gets the item
+            try:
+                # expired leases that are out of attempts won't be retried
+                cur.execute("""UPDATE work_queue SET status = 'failed',
+                    last_error = COALESCE(last_error, 'lease expired')
+                    WHERE queue = ? AND status = 'leased' AND lease_expires < ?
+                    AND attempts >= ?""", (self.name, now, self.max_attempts))
+                row = cur.execute("""SELECT item_id, item, payload, attempts
+                    FROM work_queue WHERE queue = ?
+                    AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?))
+                    ORDER BY priority DESC, item_id LIMIT 1""",
+                    (self.name, now)).fetchone()
+                if row is None:
+                    cur.execute("COMMIT")
+                    return None
+                item_id, item, payload, attempts = row
+                token = os.urandom(16).hex()
+                cur.execute("""UPDATE work_queue SET status = 'leased',
+                    worker_id = ?, lease_token = ?, lease_expires = ?,
+                    attempts = attempts + 1 WHERE item_id = ?""",
+                    (worker_id, token, now + self.lease_seconds, item_id))
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+        return Lease(item_id, item, json.loads(payload), worker_id, token, attempts + 1)
+
+    def _update_lease(self, lease: Lease, sql: str, params: tuple) -> bool:
+        with self._lock:
+            cur = self.sql_conn.execute(sql + """ WHERE item_id = ?
+                AND lease_token = ? AND status = 'leased'""",
+                params + (lease.item_id, lease.token))
+            return cur.rowcount == 1
+
+    def heartbeat(self, lease: Lease) -> bool:
+        return self._update_lease(lease,
+            "UPDATE work_queue SET lease_expires = ?",
+            (time.time() + self.lease_seconds,))
+
+    def complete(self, lease: Lease) -> None:
+        self._update_lease(lease,
+            "UPDATE work_queue SET status = 'done', lease_expires = NULL", ())
+
+    def fail(self, lease: Lease, error: str) -> None:
+        status = 'failed' if lease.attempts >= self.max_attempts else 'pending'
+        self._update_lease(lease,
+            "UPDATE work_queue SET status = ?, last_error = ?, lease_expires = NULL",
+            (status, str(error)))
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.sql_conn.execute("""SELECT status, COUNT(*)
+                FROM work_queue WHERE queue = ? GROUP BY status""",
+                (self.name,)).fetchall())
+
+
+def run_worker(queue: WorkQueue, handle: Callable[[str, Dict[str, Any]], Any],
+    worker_id: Optional[str]=None, wait_for_work: bool=False,
+    poll_interval: float=5, verbose: bool=False) -> int:
+    """lease items and handle them until the queue runs dry
+    :param queue: the shared work queue
+    :param handle: called with (item, payload) for every leased item. Raising
+        gives the item back to the queue
+    :param worker_id: name of this worker, host:pid:thread by default
+    :param wait_for_work: keep polling when the queue is empty instead of
+        returning. Leased items of other workers may still expire and come back
+    :param poll_interval: seconds between polls of an empty queue
+    :return: number of items completed
+    """
+    if not worker_id:
+        import socket
+        worker_id = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+    done = 0
+    while True:
+        lease = queue.lease(worker_id)
+        if lease is None:
+            counts = queue.counts()
+            if not wait_for_work and not counts.get('leased'):
+                return done
+            time.sleep(poll_interval)
+            continue
+        if verbose: print(f"{worker_id} leased {lease.item} (attempt {lease.attempts})")
+        stop = queue.keep_alive(lease)
+        try:
+            handle(lease.item, lease.payload)
+        except Exception as e:
+            if verbose: print(f"{lease.item}: {e}")
+            queue.fail(lease, repr(e))
+        else:
+            queue.complete(lease)
+            done += 1
+        finally:
+            stop.set()
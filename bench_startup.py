@@ -0,0 +1,90 @@
+"""Startup-time benchmark for the scraper entry points.
+Imports each entry point in a fresh interpreter with `python -X importtime`
+and fails if the cumulative import time goes over budget, or if a heavy
+dependency is imported at module load. Run it from anywhere:
+
+    python -m FilingScraper.bench_startup -V
+"""
+
+from __future__ import annotations
+from typing import Dict, List, Tuple, Optional
+from argparse import ArgumentParser
+import subprocess
+import statistics
+import sys
+import os
+
+package_dir = os.path.dirname(os.path.abspath(__file__))
+package_name = os.path.basename(package_dir)
+
+# entry point -> cumulative import budget in microseconds
+entry_points = {
+    '_Abstract_scraper': 100_000,
+    'hkex.hkexnews': 100_000,
+    'cninfo.cninfo': 100_000,
+    'edgar.sec_edgar': 100_000,
+}
+heavy_modules = ('pandas', 'numpy', 'dask', 'PyPDF2', 'bs4', 'requests')
+
+
+def import_profile(module: str) -> Dict[str, int]:
+    """import a module in a fresh interpreter and parse `-X importtime`
+    :param module: the fully qualified module name
+    :return: cumulative import time in microseconds for every module loaded
+    """
+    res = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.dirname(package_dir), capture_output=True, text=True)
+    if res.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{res.stderr}")
+    profile = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        profile[name.strip()] = int(cumulative)
+    return profile
+
+
+def check_entry_point(entry_point: str, budget: int, repeat: int=5
+    ) -> Tuple[int, List[str]]:
+    """
+    :param entry_point: module path relative to the package
+    :param budget: cumulative import budget in microseconds
+    :param repeat: number of fresh interpreters to take the median over
+    :return: the median import time and a list of problems found
+    """
+    module = f"{package_name}.{entry_point}"
+    timings, problems = [], []
+    for _ in range(repeat):
+        profile = import_profile(module)
+        timings.append(profile.get(module, 0))
+    loaded_heavy = [m for m in heavy_modules if m in profile]
+    if loaded_heavy:
+        problems.append(f"{module} imports {', '.join(loaded_heavy)} at load time")
+    median = int(statistics.median(timings))
+    if median > budget:
+        problems.append(f"{module} takes {median}us to import, budget is {budget}us")
+    return median, problems
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-E', '--entry_points', type=str, nargs='+',
+        default=list(entry_points.keys()),
+        help='entry points to check, relative to the package')
+    parser.add_argument('-B', '--budget', type=int, default=None,
+        help='override the import budget (microseconds) for every entry point')
+    parser.add_argument('-R', '--repeat', type=int, default=5,
+        help='number of fresh interpreters per entry point')
+    parser.add_argument('-V', '--verbose', action='store_true',
+        help='print the timings')
+    args = parser.parse_args()
+    failures = []
+    for entry_point in args.entry_points:
+        budget = args.budget or entry_points.get(entry_point, 100_000)
+        median, problems = check_entry_point(entry_point, budget, args.repeat)
+        if args.verbose: print(f"{entry_point}: {median / 1000:.1f}ms (budget {budget / 1000:.0f}ms)")
+        failures.extend(problems)
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    sys.exit(1 if failures else 0)
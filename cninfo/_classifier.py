@@ -0,0 +1,42 @@
+"""Doctype classification for CNInfo announcements. All the doctype patterns
+are compiled into a single regex, one optional lookahead per doctype, so a
+title gets every label it matches in one pass. The labels are saved in the
+filings store's `filing_labels`, which is what later doctype queries (and
+the corpus) read instead of going back to the API."""
+
+from __future__ import annotations
+from typing import Dict, List, Optional
+import re
+from ._doctype import cninfo_doctypes, cninfo_doctype_priority
+
+__all__ = ['DoctypeClassifier']
+
+
+class DoctypeClassifier:
+    def __init__(self, patterns: Dict[str, str]=cninfo_doctypes):
+        """
+        :param patterns: doctype -> regex matched against announcement
+            titles. Empty patterns (e.g. 'all') are left out
+        """
+        self.doctypes = [k for k, v in patterns.items() if v]
+        lookaheads = "".join(f"(?:(?=(?P<g{i}>.*?(?:{patterns[k]}))))?"
+            for i, k in enumerate(self.doctypes))
+        self.pattern = re.compile(f"^{lookaheads}", re.S)
+
+    def classify(self, title: str) -> List[str]:
+        """
+        :param title: the announcement title
+        :return: every doctype the title matches
+        """
+        groups = self.pattern.match(title or "").groupdict()
+        return [doctype for i, doctype in enumerate(self.doctypes)
+            if groups[f"g{i}"] is not None]
+
+    @staticmethod
+    def primary(labels: List[str]) -> Optional[str]:
+        """the most specific of the labels, by cninfo_doctype_priority"""
+        for doctype in cninfo_doctype_priority:
+            if doctype in labels:
+                return doctype
+        return labels[0] if labels else None
+
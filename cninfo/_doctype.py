@@ -5,10 +5,26 @@ cninfo_doctypes = {
     'quarterly_report': '季度报告全文$',
     'presentation': '演示文稿',
     'prospectus': '首次公开发行股票招股说明书',
-    'esg_report': '[(ESG)(社会责任)]',
+    'esg_report': '(ESG|社会责任)',
     'all': ''
 }
 
+# doctype -> pattern matched against the category names returned by
+# p_public0006, used to push the doctype filter to the API
+cninfo_doctype_categories = {
+    'periodic_report': '定期报告|年度报告|季度报告',
+    'interim_report': '^半年度报告',
+    'annual_report': '^年度报告',
+    'quarterly_report': '^[一三]?季度报告',
+    'prospectus': '招股说明书',
+    'esg_report': '社会责任|ESG',
+}
+
+# the label stored in the filings store when a title matches several doctypes
+cninfo_doctype_priority = ['annual_report', 'interim_report',
+    'quarterly_report', 'prospectus', 'presentation', 'esg_report',
+    'periodic_report']
+
 filing_list_flds = {
     "TEXTID": "text_id",		
     "RECID": "record_id",	
@@ -2,18 +2,25 @@
 from __future__ import annotations
 
 import re
-from typing import Dict, Any, Union, Optional, List
+import threading
+from typing import Dict, Any, Union, Optional, List, Iterator
 from argparse import ArgumentParser
 import datetime as dt
 from urllib.parse import urljoin
-import pandas as pd
-import numpy as np
-import requests
-from ..utils import config, iter_by_chunk
+from ..utils import config, iter_by_chunk, LazyModule
 from .._Abstract_scraper import AbstractScraper
-from ._doctype import cninfo_doctypes, filing_list_flds, filing_list_types
+from ._doctype import cninfo_doctypes, filing_list_flds, filing_list_types, \
+    cninfo_doctype_categories
+from ._classifier import DoctypeClassifier
+from .._scheduler import Task, estimate_costs, filing_cost, run_largest_first, \
+    default_filing_size
+
+pd = LazyModule('pandas')
+np = LazyModule('numpy')
 
 class CNInfo(AbstractScraper):
+    exchange = 'cninfo'
+
     def get_token(self, **kwargs) -> str:
         """get the token for the API"""
         url = urljoin(self.endpoint, "api-cloud-platform/oauth2/token")
@@ -29,10 +36,18 @@ class CNInfo(AbstractScraper):
         """
         :param config: config path or config object
         :param db_path: path to the database for storage
+        :param kwargs: passed to AbstractScraper, plus token: an API access
+            token to use instead of requesting one with the credentials
         """
         super(CNInfo, self).__init__(config=config, db_path=db_path, **kwargs)
         self.endpoint = 'http://webapi.cninfo.com.cn/'
-        self.token = self.get_token()
+        if kwargs.get('session') is None: # a shared session is set up by its owner
+            self.session.mount("http://", self.adapter) # filings are accessible via http only for cninfo
+        self.token = kwargs.get('token') or self.get_token()
+        self.classifier = DoctypeClassifier()
+        # name of the p_info3015 parameter taking category codes. Doctype
+        # filters are only pushed to the API when this is configured
+        self.category_param = self.config.get(name='category_param', returntype='str', default=None)
     
     def _get_category_df(self) -> None:
         """get filing categories which will be saved in self.category_df_"""
@@ -45,11 +60,64 @@ class CNInfo(AbstractScraper):
             s = pd.DataFrame(data=d.values(), index=list(d.keys()), columns=[i])
             ls.append(s.T)
         self.category_df_ = pd.concat(ls)
-        self.category_df_.columns = self.category_df.columns.str.replace("SORTCODE", "F006V") # TODO - this seems to be wrong field returned by CNINFO but can't find where the correct field is.       
+        self.category_df_.columns = self.category_df_.columns.str.replace("SORTCODE", "F006V") # TODO - this seems to be wrong field returned by CNINFO but can't find where the correct field is.       
+
+    def category_codes(self, doctype: str) -> List[str]:
+        """category codes (F006V) whose names match the doctype, looked up in
+        self.category_df_. Empty if the doctype has no category equivalent"""
+        if doctype not in cninfo_doctype_categories:
+            return []
+        if not hasattr(self, 'category_df_'):
+            self._get_category_df()
+        names = self.category_df_.get('SORTNAME')
+        if names is None:
+            return []
+        mask = names.astype(str).str.contains(cninfo_doctype_categories[doctype], regex=True)
+        return self.category_df_.loc[mask, 'F006V'].astype(str).tolist()
+
+    def classify(self, df: pd.DataFrame) -> List[List[str]]:
+        """label the records of a raw p_info3015 frame with every doctype
+        their title matches, and cache the labels and metadata locally"""
+        labels = [self.classifier.classify(title) for title in df.F002V]
+        self.store.insert_labels((self.exchange, text_id, doctype)
+            for text_id, l in zip(df.TEXTID, labels) for doctype in l)
+        self.store.insert_filings(
+            (self.exchange, text_id, ticker, name, self.classifier.primary(l),
+                date, title, url, size)
+            for text_id, ticker, name, date, title, url, size, l in zip(
+                df.TEXTID, df.SECCODE, df.SECNAME, df.F001D, df.F002V,
+                df.F003V, df.F005N, labels))
+        return labels
+
+    def get_indexed_filing_list(self, ticker: str, doctype: str='all',
+        start_date: dt.date=dt.date(2015, 12, 31),
+        end_date: dt.date=dt.date.today()) -> pd.DataFrame:
+        """read the filing list from the local filings store, without calling
+        the API. Only covers filings seen by earlier get_filing_list calls
+        :param ticker: the ticker of the stock
+        :param doctype: the type of the filing, see get_filing_list
+        :param start_date: the start date of the filings
+        :param end_date: the end date of the filings
+        """
+        params = [self.exchange, ticker, start_date.strftime('%Y-%m-%d'),
+            end_date.strftime('%Y-%m-%d 23:59:59')]
+        sql = """SELECT f.filing_id AS text_id, f.ticker, f.issuer AS security_name,
+            f.filing_date AS annoucement_date, f.title AS annoucement_title,
+            f.url, f.size AS announcement_size, f.doctype
+            FROM filings f
+            WHERE f.exchange = ? AND f.ticker = ?
+            AND f.filing_date BETWEEN ? AND ?"""
+        if doctype != 'all':
+            sql += """ AND f.filing_id IN (SELECT filing_id FROM filing_labels
+                WHERE exchange = f.exchange AND doctype = ?)"""
+            params.append(doctype)
+        return pd.read_sql(sql + " ORDER BY f.filing_date", self.sql_conn,
+            params=params, parse_dates=['annoucement_date'])
 
     def get_filing_list(self, ticker: str, start_date: dt.date=dt.date(2015, 12, 31),
         end_date: dt.date=dt.date.today(), return_format: str='json',
-        doctype: str='all', verbose: bool=False, **kwargs) -> pd.DataFrame:
+        doctype: str='all', verbose: bool=False, use_coverage: bool=False,
+        **kwargs) -> pd.DataFrame:
         """get a list of the filings for a stock
         :param ticker: the ticker of the stock
         :param start_date: the start date of the filings
@@ -73,7 +141,39 @@ class CNInfo(AbstractScraper):
             - textid
             - maxid
             check http://webapi.cninfo.com.cn/#/apiDoc > p_info3015 for more information
+        :param use_coverage: if True, only the parts of the date range the 
+            coverage index doesn't have yet are fetched, and the list is read
+            from the filings store (see get_indexed_filing_list), which keeps
+            fewer columns than the API returns. If False, the whole range is
+            fetched and returned as the API returns it
+        Every record fetched is labelled in one regex pass and cached in the
+        filings store.
         """
+        pushdown = []
+        if self.category_param and doctype != 'all':
+            pushdown = self.category_codes(doctype)
+            if pushdown: # push the filter to the API
+                kwargs.setdefault(self.category_param, ",".join(pushdown))
+        # without a pushed down filter every doctype is labelled locally, so
+        # the range is covered for all of them
+        covered_as = doctype if pushdown else 'all'
+        if use_coverage:
+            for start, end in self.coverage.missing(self.exchange, ticker, doctype,
+                start_date, end_date, covered_by=('all',)):
+                if verbose: print(f"fetching {ticker} {doctype} {start} - {end}")
+                self._fetch_filing_list(ticker, start, end, return_format,
+                    doctype, **kwargs)
+                self.coverage.add(self.exchange, ticker, covered_as, start, end)
+            return self.get_indexed_filing_list(ticker, doctype, start_date, end_date)
+        df = self._fetch_filing_list(ticker, start_date, end_date,
+            return_format, doctype, **kwargs)
+        self.coverage.add(self.exchange, ticker, covered_as, start_date, end_date)
+        return df
+
+    def _fetch_filing_list(self, ticker: str, start_date: dt.date,
+        end_date: dt.date, return_format: str='json', doctype: str='all',
+        **kwargs) -> pd.DataFrame:
+        """query p_info3015 for the filings of a stock over a date range"""
         url = urljoin(self.endpoint, 'api/info/p_info3015')
         res = self.session.post(url, data=dict(scode=ticker,
             access_token=self.token,
@@ -85,30 +185,113 @@ class CNInfo(AbstractScraper):
         if res.get('resultmsg') == 'success' and res.get('total') > 0:
             df = pd.concat([pd.Series(s).to_frame().T 
                 for s in res['records']])
-            df = df.loc[df.F002V.str.contains(
-                cninfo_doctypes.get(doctype, ''), regex=True), :]
+            labels = self.classify(df)
+            if doctype != 'all':
+                df = df.loc[[doctype in l for l in labels], :]
             df.loc[:, 'F001D'] = df.loc[:, 'F001D'].apply(lambda d: dt.datetime.strptime(d, '%Y-%m-%d %H:%M:%S'))
             df.loc[:, 'RECTIME'] = df.loc[:, 'RECTIME'].apply(lambda d: dt.datetime.strptime(d, '%Y-%m-%d %H:%M:%S'))
             for colname, col in df.iteritems():
                 df.loc[:, colname] = col.astype(filing_list_types.get(colname, str)).values
             df.columns = df.columns.to_series().map(filing_list_flds)
             return df
+        elif res.get('resultmsg') == 'success':
+            return pd.DataFrame(columns=list(filing_list_flds.values()))
         else:
             raise ValueError(f"Cannot get list of filings; error message: {res.get('resultmsg')};\nerror code: {res.get('resultcode')}")
 
     def get_filing_content(self, ticker: str, start_date: dt.date=dt.date(2015, 12, 31),
         end_date: dt.date=dt.date.today(), return_format: str='json',
         doctype: str='all', verbose: bool=False, **kwargs) -> pd.DataFrame:
-        """get the content of the filings for a stock"""
+        """get the content of the filings for a stock. Downloads that fail
+        validation are retried, then quarantined in the filings store and
+        left without content (see AbstractScraper.download_filing)"""
         df = self.get_filing_list(ticker=ticker, start_date=start_date,
             end_date=end_date, return_format=return_format, doctype=doctype, 
             verbose=verbose, **kwargs)
-        session = requests.Session()
-        session.mount("http://", self.adapter) # filings are accessible via http only for cninfo
-        df.loc[:, 'filing_content'] = df.loc[:, 'url'].apply(
-            lambda u: self.get_pdf(u, session=session, timeout=self.timeout))
+        # download_filing reuses the pooled session (mounted for http in
+        # __init__) rather than opening new connections for every call
+        df.loc[:, 'filing_content'] = [self.download_filing(text_id, url,
+            verbose=verbose) for text_id, url in zip(df.text_id, df.url)]
         return df
-        raise NotImplementedError
+
+    def iter_filing_content(self, ticker: str, start_date: dt.date=dt.date(2015, 12, 31),
+        end_date: dt.date=dt.date.today(), return_format: str='json',
+        doctype: str='all', verbose: bool=False, save_to_sql: bool=True,
+        convert_to_text: bool=False, ignore_errors: bool=False,
+        batch_size: int=1, **kwargs
+        ) -> Iterator[Union[Dict[str, Any], List[Dict[str, Any]]]]:
+        """yield the content of the filings for a stock one at a time (or in
+        lists of batch_size), downloading, converting and saving each to the
+        filings store as it goes, so peak memory stays flat
+        :param save_to_sql: save each filing to the filings store
+        :param convert_to_text: convert the content to text
+        :param ignore_errors: skip filings that fail instead of raising
+        :param batch_size: yield lists of this many filings if > 1
+        see get_filing_list for the other arguments
+        """
+        df = self.get_filing_list(ticker=ticker, start_date=start_date,
+            end_date=end_date, return_format=return_format, doctype=doctype,
+            verbose=verbose, **kwargs)
+        return self._iter_content(df, 'text_id', convert_to_text=convert_to_text,
+            save_to_sql=save_to_sql, ignore_errors=ignore_errors,
+            batch_size=batch_size, verbose=verbose)
+
+    @classmethod
+    def batch_download(cls, stock_list: List[str], verbose: bool=False,
+        ignore_errors: bool=False, max_workers: int=0,
+        start_date: dt.date=dt.date(2015, 12, 31),
+        end_date: dt.date=dt.date.today(), doctype: str='all',
+        **kwargs) -> Dict[str, Any]:
+        """download the filings of a list of stocks into the filings store,
+        largest first by the filing sizes (F005N) recorded on earlier runs.
+        Once a stock is listed its filings are queued individually, so the
+        filings of a heavy stock are spread over all the workers. Each worker
+        thread has its own scraper (sqlite connections can't be shared
+        between threads)
+        :param stock_list: a list of tickers
+        :param max_workers: the number of worker threads
+        :param kwargs: passed to the constructor (e.g. session, convert_pool),
+            plus convert_to_text
+        :return: the scheduler stats, see run_largest_first
+        """
+        convert_to_text = kwargs.get('convert_to_text', False)
+        tickers = [str(ticker).strip() for ticker in stock_list if str(ticker).strip()]
+        scraper = cls(**kwargs)
+        try:
+            costs = estimate_costs(scraper.store, scraper.exchange, tickers,
+                start_date, end_date, doctype)
+        finally:
+            scraper.close_sql_conn()
+        local = threading.local()
+
+        def handle(task: Task) -> Optional[List[Task]]:
+            if getattr(local, 'scraper', None) is None:
+                local.scraper = cls(**kwargs)
+            if task.payload is None: # list the stock, queue its filings
+                df = local.scraper.get_filing_list(task.key, start_date=start_date,
+                    end_date=end_date, doctype=doctype, verbose=verbose,
+                    use_coverage=True)
+                if df.empty:
+                    return None
+                typical_size = df['announcement_size'].median()
+                if typical_size != typical_size: # no sizes listed
+                    typical_size = default_filing_size
+                return [Task(filing_cost(record['announcement_size'], typical_size),
+                        str(record['text_id']), record)
+                    for record in df.to_dict('records')]
+            for _ in local.scraper._iter_content(pd.DataFrame([task.payload]),
+                'text_id', convert_to_text=convert_to_text, save_to_sql=True,
+                can_defer=True, verbose=verbose):
+                pass
+
+        def close():
+            if getattr(local, 'scraper', None) is not None:
+                local.scraper.close_sql_conn()
+
+        return run_largest_first(
+            [Task(costs[ticker], ticker) for ticker in tickers],
+            handle, max_workers=max_workers, ignore_errors=ignore_errors,
+            verbose=verbose, on_worker_exit=close)
 
 if __name__ == '__main__':
     parser = ArgumentParser()
@@ -0,0 +1,209 @@
+"""Read side of the filings store. Query the scraped corpus by exchange,
+ticker, doctype, date range and whether content or text is there, without
+knowing which table anything was saved in. Filters go into the SQL, only
+metadata comes back, and a filing's content or text is read when it's
+asked for.
+
+    corpus = Corpus('hkexnews.db')
+    corpus.frame(doctype='annual_report', ticker='00005',
+        columns=['filing_date', 'title'])
+    for filing in corpus.filings(exchange='cninfo', has_text=True):
+        print(filing.title, len(filing.text))
+"""
+
+from __future__ import annotations
+from typing import Optional, Union, Sequence, List, Tuple, Iterator, Any
+import datetime as dt
+import sqlite3
+from ._store import FilingStore, filing_fields, connect
+from ._shards import ShardRouter, ShardedFilingStore
+from .utils import LazyModule
+
+pd = LazyModule('pandas')
+
+__all__ = ['Corpus', 'Filing']
+
+Many = Union[str, Sequence[str], None]
+Date = Union[dt.date, str, None]
+
+
+class Filing:
+    __slots__ = filing_fields + ('_corpus',)
+
+    def __init__(self, corpus: Corpus, *values: Any):
+        """a filing's metadata. content and text are read from the store
+        on access"""
+        self._corpus = corpus
+        for field, value in zip(filing_fields, values):
+            setattr(self, field, value)
+
+    @property
+    def content(self) -> Optional[bytes]:
+        return self._corpus.content(self.exchange, self.filing_id)
+
+    @property
+    def text(self) -> Optional[str]:
+        return self._corpus.text(self.exchange, self.filing_id)
+
+    def __repr__(self) -> str:
+        return (f"Filing({self.exchange}, {self.filing_id}, {self.ticker}, "
+            f"{self.filing_date}, {self.title!r})")
+
+
+def _as_list(value: Many) -> Optional[List[str]]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [value]
+    return [str(v) for v in value]
+
+
+def _as_date(value: Date, end: bool=False) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, (dt.date, dt.datetime)):
+        value = value.strftime('%Y-%m-%d')
+    # filing dates are stored as 'YYYY-MM-DD HH:MM:SS' text
+    return f"{value} 23:59:59" if end and len(value) == 10 else value
+
+
+class Corpus:
+    def __init__(self, db: Union[str, sqlite3.Connection],
+        shards: Optional[ShardRouter]=None):
+        """
+        :param db: path to the database the scrapers saved into, or an open
+            connection to it, used as it is. A path is opened read-only, so
+            a copy on read-only storage will do, but its store has to be in
+            the current layout (see FilingStore.check_tables)
+        :param shards: the shard router, if the content was saved in shards
+            (see the "shard_dir" config key of the scrapers)
+        """
+        self._own_conn = not isinstance(db, sqlite3.Connection)
+        self.sql_conn = connect(db, read_only=True) if self._own_conn else db
+        self.store = FilingStore(self.sql_conn, self._own_conn) if shards is None \
+            else ShardedFilingStore(self.sql_conn, shards, self._own_conn)
+
+    def _has_table(self, name: str) -> bool:
+        """tables of optional features are only looked up, creating them
+        would fail on a read-only database"""
+        return self.sql_conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' "
+            "AND name = ?", (name,)).fetchone() is not None
+
+    def _where(self, exchange: Many=None, ticker: Many=None, doctype: Many=None,
+        start_date: Date=None, end_date: Date=None, has_content: Optional[bool]=None,
+        has_text: Optional[bool]=None, title: Optional[str]=None,
+        duplicate: Optional[bool]=None) -> Tuple[str, list]:
+        clauses, params = [], []
+        def one_of(column: str, values: Many):
+            values = _as_list(values)
+            if values is not None:
+                clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+        one_of('f.exchange', exchange)
+        one_of('f.ticker', ticker)
+        doctypes = _as_list(doctype)
+        if doctypes is not None:
+            marks = ', '.join('?' * len(doctypes))
+            clauses.append(f"""(f.doctype IN ({marks}) OR EXISTS (SELECT 1
+                FROM filing_labels l WHERE l.exchange = f.exchange
+                AND l.filing_id = f.filing_id AND l.doctype IN ({marks})))""")
+            params.extend(doctypes * 2)
+        if start_date is not None:
+            clauses.append("f.filing_date >= ?")
+            params.append(_as_date(start_date))
+        if end_date is not None:
+            clauses.append("f.filing_date <= ?")
+            params.append(_as_date(end_date, end=True))
+        if title is not None:
+            clauses.append("f.title LIKE ?")
+            params.append(f"%{title}%")
+        # answered from the filing_content_present index, the blobs aren't read
+        content = None
+        for column, wanted in (('content', has_content), ('text', has_text)):
+            if wanted is not None:
+                content = content or self.store.content_relation()
+                clauses.append(f"""{'' if wanted else 'NOT '}EXISTS (SELECT 1
+                    FROM {content} c WHERE c.exchange = f.exchange
+                    AND c.filing_id = f.filing_id AND c.has_{column} = 1)""")
+        # without the table dedup never ran, and no filing is a duplicate
+        if duplicate is not None and self._has_table('filing_duplicates'):
+            clauses.append(f"""{'' if duplicate else 'NOT '}EXISTS (SELECT 1
+                FROM filing_duplicates d WHERE d.exchange = f.exchange
+                AND d.filing_id = f.filing_id)""")
+        elif duplicate:
+            clauses.append("0")
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _select(self, columns: Sequence[str], ascending: bool, limit: Optional[int],
+        **filters: Any) -> Tuple[str, list]:
+        unknown = set(columns) - set(filing_fields)
+        if unknown:
+            raise ValueError(f"unknown columns {sorted(unknown)}, pick from {filing_fields}")
+        where, params = self._where(**filters)
+        sql = (f"SELECT {', '.join('f.' + c for c in columns)} FROM filings f{where}"
+            f" ORDER BY f.filing_date {'ASC' if ascending else 'DESC'}, f.filing_id")
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return sql, params
+
+    def frame(self, columns: Optional[Sequence[str]]=None, ascending: bool=True,
+        limit: Optional[int]=None, **filters: Any) -> pd.DataFrame:
+        """the metadata of the matching filings
+        :param columns: the metadata columns to return, all of them by default
+        :param ascending: order by filing date, oldest first
+        :param limit: return at most this many filings
+        :param filters: exchange, ticker, doctype (a value or a list of
+            values), start_date, end_date (dates or 'YYYY-MM-DD'), has_content,
+            has_text (True/False), title (a substring) and duplicate (True/False,
+            whether the filing was linked to a near-duplicate, see the "dedup"
+            config key of the scrapers)
+        """
+        sql, params = self._select(columns or filing_fields, ascending, limit, **filters)
+        df = pd.read_sql(sql, self.sql_conn, params=params)
+        if 'filing_date' in df.columns:
+            df['filing_date'] = pd.to_datetime(df['filing_date'])
+        return df
+
+    def filings(self, ascending: bool=True, limit: Optional[int]=None,
+        **filters: Any) -> Iterator[Filing]:
+        """iterate over the matching filings, see frame for the filters.
+        Rows are fetched from the cursor as they're consumed"""
+        sql, params = self._select(filing_fields, ascending, limit, **filters)
+        for row in self.sql_conn.execute(sql, params):
+            yield Filing(self, *row)
+
+    def count(self, **filters: Any) -> int:
+        """number of matching filings, see frame for the filters"""
+        where, params = self._where(**filters)
+        return self.sql_conn.execute(f"SELECT COUNT(*) FROM filings f{where}",
+            params).fetchone()[0]
+
+    def duplicate_of(self, exchange: str, filing_id: str) -> Optional[Tuple[str, str]]:
+        """the (exchange, filing_id) a filing was linked to as a near-duplicate"""
+        if not self._has_table('filing_duplicates'):
+            return None
+        return self.sql_conn.execute("""SELECT duplicate_of_exchange, duplicate_of_id
+            FROM filing_duplicates WHERE exchange = ? AND filing_id = ?""",
+            (exchange, str(filing_id))).fetchone()
+
+    def content(self, exchange: str, filing_id: str) -> Optional[bytes]:
+        """the raw content of a filing, None if it wasn't downloaded"""
+        row = self.store.content_conn(exchange, filing_id).execute("""SELECT content
+            FROM filing_content WHERE exchange = ? AND filing_id = ?""",
+            (exchange, str(filing_id))).fetchone()
+        return None if row is None else row[0]
+
+    def text(self, exchange: str, filing_id: str) -> Optional[str]:
+        """the extracted text of a filing, None if it wasn't converted"""
+        row = self.store.content_conn(exchange, filing_id).execute("""SELECT text
+            FROM filing_content WHERE exchange = ? AND filing_id = ?""",
+            (exchange, str(filing_id))).fetchone()
+        return None if row is None else row[0]
+
+    def close(self) -> None:
+        """close the connection if the corpus opened it"""
+        if isinstance(self.store, ShardedFilingStore):
+            self.store.close()
+        if self._own_conn:
+            self.sql_conn.close()
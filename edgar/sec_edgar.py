@@ -1,32 +1,188 @@
 """extract text from filings on EDGAR"""
 from __future__ import annotations
 import re, os
-from typing import Union, Optional, List, Dict, Any
-from ..utils import config
+import json
+import zipfile
+from typing import Union, Optional, List, Dict, Any, Iterable, Tuple
+from ..utils import config, iter_by_chunk
 from .._Abstract_scraper import AbstractScraper
 from urllib.parse import urljoin
+from argparse import ArgumentParser
+
+edgar_archive = 'https://www.sec.gov/Archives/edgar/data/'
+
+def _cik(submission: Dict[str, Any], member_name: str) -> str:
+    cik = submission.get('cik')
+    if cik is None:
+        cik = re.findall("CIK(\\d+)", member_name)[0]
+    return str(int(cik))
+
+def _company(submission: Dict[str, Any], cik: str) -> Tuple[str, Optional[str]]:
+    """ticker and name of a main submissions file's company"""
+    tickers = submission.get('tickers') or []
+    return (tickers[0] if tickers else cik), submission.get('name')
+
+def _group_by_cik(member_names: Iterable[str]) -> List[List[str]]:
+    """the member names of each CIK, the main file ahead of its overflow
+    files so these can take the company details from it"""
+    groups: Dict[str, List[str]] = {}
+    for name in member_names:
+        match = re.search("CIK(\\d+)", name)
+        groups.setdefault(str(int(match.group(1))) if match else name, []).append(name)
+    return [sorted(names, key=lambda name: ('-submissions-' in name, name))
+        for names in groups.values()]
+
+def _submission_rows(submission: Dict[str, Any], member_name: str,
+    forms: Optional[Tuple[str]]=None,
+    company: Optional[Tuple[str, Optional[str]]]=None) -> List[tuple]:
+    """turn one submissions JSON into rows for the filings store.
+    The main file for a CIK keeps its filings under filings/recent, while the
+    overflow files (CIK##########-submissions-001.json) hold the same
+    columnar arrays at the top level and carry no company details.
+    :param company: (ticker, name) of the CIK from its main file, for
+        overflow files
+    """
+    cik = _cik(submission, member_name)
+    ticker, issuer = company or _company(submission, cik)
+    recent = submission.get('filings', {}).get('recent', submission)
+    accession_numbers = recent.get('accessionNumber', [])
+    n = len(accession_numbers)
+    def column(name: str) -> list:
+        col = recent.get(name)
+        return col if col and len(col) == n else [None] * n
+    rows = []
+    for accession_number, filing_date, form, primary_document, description, size in zip(
+        accession_numbers, column('filingDate'), column('form'),
+        column('primaryDocument'), column('primaryDocDescription'),
+        column('size')):
+        if forms and form not in forms:
+            continue
+        url = urljoin(edgar_archive,
+            f"{cik}/{accession_number.replace('-', '')}/{primary_document or ''}")
+        rows.append(('edgar', accession_number, ticker, issuer, form,
+            filing_date, description or form, url, size))
+    return rows
+
+def _parse_submissions_members(zip_path: str, member_names: List[str],
+    forms: Optional[Tuple[str]]=None) -> List[tuple]:
+    """parse a chunk of zip members. Runs in worker processes, so each call
+    opens its own handle on the archive and only one member is decoded at a
+    time. A CIK's overflow files take the ticker and name of its main
+    file, which has to come earlier in the same chunk (see _group_by_cik)"""
+    rows = []
+    companies: Dict[str, Tuple[str, Optional[str]]] = {}
+    with zipfile.ZipFile(zip_path) as zf:
+        for name in member_names:
+            with zf.open(name) as f:
+                try:
+                    submission = json.load(f)
+                except json.JSONDecodeError:
+                    continue
+            cik = _cik(submission, name)
+            if 'filings' in submission: # the main file
+                companies[cik] = _company(submission, cik)
+            rows.extend(_submission_rows(submission, name, forms, companies.get(cik)))
+    return rows
 
 class SECEdgar(AbstractScraper):
-    def __init__(self,  financial_modeling_prep_key: str,
-        config: Optional[Union[str, config]]=None, 
-        db_path: Optional[str]='secedgar.db', 
+    exchange = 'edgar'
+
+    def __init__(self,  financial_modeling_prep_key: Optional[str]=None,
+        config: Optional[Union[str, config]]=None,
+        db_path: Optional[str]='secedgar.db',
         **kwargs):
         """
+        :param financial_modeling_prep_key: API key for financialmodelingprep.
+            Not needed when only loading the bulk submissions archive
         :param config: config path or config object
         :param db_path: path to the database for storage
         """
         super(SECEdgar, self).__init__(config=config, db_path=db_path, **kwargs)
         self.fmp_endpoint = 'https://financialmodelingprep.com/api/v3/'
-        self.endpoint = 'https://www.sec.gov/Archives/edgar/data/'
+        self.endpoint = edgar_archive
         self.fmp_key = financial_modeling_prep_key
-        res = self.session.get(
-            urljoin(self.fmp_endpoint,'financial-statement-symbol-lists'),
-            params={'apikey': self.fmp_key}
-            )
-        self.available_stocks = res.json()
+        self.available_stocks = None
+        if self.fmp_key:
+            res = self.session.get(
+                urljoin(self.fmp_endpoint,'financial-statement-symbol-lists'),
+                params={'apikey': self.fmp_key}
+                )
+            self.available_stocks = res.json()
+
+    def load_bulk_submissions(self, zip_path: str,
+        forms: Optional[List[str]]=None, max_workers: int=0,
+        chunk_size: int=200, batch_size: int=5000,
+        verbose: bool=False) -> int:
+        """load filing metadata from the bulk submissions.zip published by
+        the SEC (https://www.sec.gov/Archives/edgar/daily-index/bulkdata/submissions.zip)
+        into the filings store. The archive is read in place, member by
+        member, and never unpacked to disk.
+        :param zip_path: path to the locally downloaded submissions.zip
+        :param forms: only keep these form types, e.g. ['10-K', '10-Q'].
+            Keeps everything if None
+        :param max_workers: number of processes parsing zip members. If set
+            to <= 1, will parse in the current process
+        :param chunk_size: number of CIKs (with all their zip members)
+            handed to a worker at a time
+        :param batch_size: number of rows per insert transaction
+        :param verbose: print the progress if True
+        :return: number of filings rows loaded
+        """
+        forms = tuple(forms) if forms else None
+        with zipfile.ZipFile(zip_path) as zf:
+            member_names = [name for name in zf.namelist()
+                if name.lower().endswith('.json')]
+        if verbose: print(f"found {len(member_names)} submissions in {zip_path}")
+        # a CIK's files stay in one chunk, its overflow files need the main one
+        chunks = ([name for group in chunk for name in group]
+            for chunk in iter_by_chunk(_group_by_cik(member_names), chunk_size))
+        n = 0
+        if max_workers > 1: # spread zip members across processes
+            # imported here, multiprocessing is slow to import
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+            # the scraper's session and sqlite connection shouldn't be copied
+            # into forked workers, they're spawned like orchestrator's pool
+            with ProcessPoolExecutor(max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn')) as executor:
+                pending = set()
+                for chunk in chunks: # bounded number of chunks in flight
+                    pending.add(executor.submit(_parse_submissions_members,
+                        zip_path, list(chunk), forms))
+                    if len(pending) >= max_workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            n += self.store.insert_filings(future.result(), batch_size)
+                        if verbose: print(f"loaded {n} filings")
+                for future in pending:
+                    n += self.store.insert_filings(future.result(), batch_size)
+        else:
+            for chunk in chunks:
+                n += self.store.insert_filings(
+                    _parse_submissions_members(zip_path, list(chunk), forms),
+                    batch_size)
+                if verbose: print(f"loaded {n} filings")
+        return n
+
     def get_filing_list(self, **kwargs) -> pd.DataFrame:
         """get a list of the filings for a stock"""
         raise NotImplementedError
     def get_filing_content(self, **kwargs) -> pd.DataFrame:
         """get the content of the filings for a stock"""
-        raise NotImplementedError
\ No newline at end of file
+        raise NotImplementedError
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-Z', '--zip_path', type=str, default='submissions.zip',
+        help='path to the bulk submissions.zip downloaded from EDGAR')
+    parser.add_argument('-D', '--db_path', type=str, default='secedgar.db',
+        help='path to sqlite database')
+    parser.add_argument('-F', '--forms', type=str, nargs='+',
+        help='form types to keep, e.g. 10-K 10-Q. Keeps all if not specified')
+    parser.add_argument('-M', '--maxworker', default=0, type=int,
+        help='max worker processes parsing the archive. Default 0, if set to <=1, will not use multiprocessing')
+    parser.add_argument('-V', '--verbose', action='store_true',
+        help='print the progress')
+    args = parser.parse_args()
+    SECEdgar(db_path=args.db_path).load_bulk_submissions(args.zip_path,
+        forms=args.forms, max_workers=args.maxworker, verbose=args.verbose)
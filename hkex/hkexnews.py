@@ -1,27 +1,47 @@
 from __future__ import annotations # to enable type hints when returning self. not needed in python 3.11
-import requests
-
 import re
-from typing import Union, Optional, List, Dict, Any
+import sys
+import threading
+import time
+from typing import Union, Optional, List, Dict, Any, Iterator, Callable
 from types import SimpleNamespace
 import json
 from urllib.parse import urljoin
-import pandas as pd
-import dask.dataframe as dd
-from dask.multiprocessing import get
-import numpy as np
 import datetime as dt
-import PyPDF2
-from ..utils import config, iter_by_chunk
+from ..utils import config, iter_by_chunk, LazyModule
 from .._Abstract_scraper import AbstractScraper
 from . import _filetypes
+from .._work_queue import WorkQueue, SQLiteWorkQueue, run_worker
+from .._validation import is_valid_pdf
+from .._live import SeenFilings, AdaptiveInterval, ConditionalGet
+from .._scheduler import Task, estimate_costs, filing_cost, run_largest_first, \
+    default_filing_size
 from argparse import ArgumentParser
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from collections import deque
 
+pd = LazyModule('pandas')
+dd = LazyModule('dask.dataframe')
+np = LazyModule('numpy')
+_transport = LazyModule(f"{__package__.rsplit('.', 1)[0]}._transport")
+
 hkexnews_doc_types = _filetypes.hkexnews_doc_types
+# latest filings of SEHK listed companies, in English
+latest_filings_url = 'https://www1.hkexnews.hk/ncms/json/eds/lcisehk1relsde_1.json'
+latest_columns = ['news_id', 'stock_code', 'stock_name', 'title', 'date_time',
+    'url', 'file_info', 'category']
+
+def _file_size(file_info: Optional[str]) -> Optional[int]:
+    """turn the FILE_INFO of a filing (e.g. '368KB', '1.2MB') into bytes"""
+    found = re.findall("([\\d.]+)\\s*([KMG]?B)", str(file_info or ''), re.I)
+    if not found:
+        return None
+    size, unit = found[0]
+    return int(float(size) * {'B': 1, 'KB': 1 << 10, 'MB': 1 << 20,
+        'GB': 1 << 30}[unit.upper()])
 
 class HKEXNews(AbstractScraper):
+    exchange = 'hkexnews'
+
     def __init__(self, config: Optional[Union[str, config]]=None, 
         db_path: Optional[str]="hkexnews.db", **kwargs):
         """
@@ -31,6 +51,10 @@ class HKEXNews(AbstractScraper):
         """
         super(HKEXNews, self).__init__(config=config, db_path=db_path, **kwargs)
         self.endpoint = 'https://www1.hkexnews.hk/'
+        self.latest_filings_url = self.config.get(name='latest_filings_url',
+            returntype='str', default=latest_filings_url)
+        self._latest = None
+        self._seen = None
     def __get_stock_info(self, keyword: str) -> dict:
         params = self.params.copy()
         params.update(dict(callback="callback",
@@ -50,16 +74,25 @@ class HKEXNews(AbstractScraper):
         res = json.loads(res).get('stockInfo')[0]
         return {str(k): str(v) for k, v in res.items()}
 
-    def get_filing_list(self, keyword: str, start_date: dt.date=dt.date(1999, 12, 31),
-        end_date: dt.dated=dt.date.today(), doctype='all', ascending: bool=False,
-        verbose: bool=False, save_to_sql=False) -> pd.DataFrame:
-        """return filing list for a given stock
-        :param keyword: the stock name or symbol
-        :param start_date: the start date of filings
-        :param end_date: the end date of filings
-        :param doctype: the type of filing, default is all
-        :param ascending: sort the list in ascending order
-        :param verbose: print the progress if True"""
+    def _ticker(self, keyword: str) -> str:
+        """the stock code the filings of a keyword are stored under. Names
+        are looked up in the filings store first, so hkexnews is only asked
+        about names that were never listed"""
+        keyword = str(keyword).strip()
+        if keyword.isdigit():
+            return keyword.zfill(5)
+        # through the store, which creates the filings table on a new database
+        row = self.store.sql_conn.execute("""SELECT ticker FROM filings
+            WHERE exchange = ? AND issuer = ? COLLATE NOCASE LIMIT 1""",
+            (self.exchange, keyword)).fetchone()
+        if row is not None:
+            return row[0]
+        return self._get_stock_info(keyword).get('code')
+
+    def _fetch_filing_list(self, keyword: str, start_date: dt.date,
+        end_date: dt.date, doctype='all', ascending: bool=False,
+        verbose: bool=False) -> pd.DataFrame:
+        """query hkexnews for the filing list of a stock over a date range"""
         url = urljoin(self.endpoint, "search/titleSearchServlet.do")
         headers = self.headers.copy()
         params = self.params.copy()
@@ -80,11 +113,10 @@ class HKEXNews(AbstractScraper):
         def returndf(res: dict): 
             assert isinstance(res, dict) and 'hasNextRow' in res.keys()
             if not res.get('hasNextRow'):
-                if 'result' in res.keys():
-                    res = json.loads(res.get('result'))
-                    df = pd.DataFrame([pd.Series(d) for d in res])
-                    if verbose: print(f"found {df.TOTAL_COUNT[0]} results")
-                    return df
+                res = json.loads(res.get('result') or '[]')
+                df = pd.DataFrame([pd.Series(d) for d in res])
+                if verbose: print(f"found {len(df)} results")
+                return df
             else:
                 total_count = json.loads(res.get('result'))[0].get('TOTAL_COUNT')
                 params.update({"rowRange": total_count})
@@ -92,15 +124,225 @@ class HKEXNews(AbstractScraper):
                 df = returndf(res)
             return df
         df = returndf(res)
+        if df.empty:
+            return df
         df = df.applymap(self.html_entities_to_unicode)
         df.loc[:, 'FILE_LINK'] = df.loc[:, 'FILE_LINK'].apply(lambda x: urljoin(self.endpoint, x))
         df.columns = df.columns.str.lower()
         df.columns = df.columns.str.replace("file_link", 'url')
+        return df
+
+    def _record_filings(self, df: pd.DataFrame, ticker: str, doctype: str) -> None:
+        """save a fetched filing list of a stock into the filings store"""
+        if df.empty:
+            return
+        label = None if doctype == 'all' else doctype
+        self.store.insert_filings(
+            (self.exchange, news_id, ticker, stock_name, label,
+                dt.datetime.strptime(date_time, '%d/%m/%Y %H:%M').isoformat(' '),
+                title, url, _file_size(file_info))
+            for news_id, stock_name, date_time, title, url, file_info
+            in zip(df.news_id, df.stock_name, df.date_time,
+                df.title, df.url, df.get('file_info', [None] * len(df))))
+        if label:
+            self.store.insert_labels((self.exchange, news_id, label)
+                for news_id in df.news_id)
+
+    def _local_filing_list(self, ticker: str, start_date: dt.date,
+        end_date: dt.date, doctype='all', ascending: bool=False) -> pd.DataFrame:
+        """read the filing list of a stock from the filings store"""
+        params = [self.exchange, ticker, start_date.strftime('%Y-%m-%d'),
+            end_date.strftime('%Y-%m-%d 23:59:59')]
+        sql = """SELECT filing_id AS news_id, ticker AS stock_code,
+            issuer AS stock_name, title, filing_date AS date_time, url, size,
+            doctype
+            FROM filings
+            WHERE exchange = ? AND ticker = ?
+            AND filing_date BETWEEN ? AND ?"""
+        if doctype != 'all':
+            sql += """ AND filing_id IN (SELECT filing_id FROM filing_labels
+                WHERE exchange = ? AND doctype = ?)"""
+            params.extend([self.exchange, doctype])
+        sql += f" ORDER BY filing_date {'ASC' if ascending else 'DESC'}"
+        return pd.read_sql(sql, self.sql_conn, params=params,
+            parse_dates=['date_time'])
+
+    def is_downloaded(self, keyword: str, start_date: dt.date, end_date: dt.date,
+        doctype='all') -> bool:
+        """True if the filing list of the range was fetched completely and
+        every filing in it has its content in the filings store (or was
+        quarantined), so downloading the stock again would fetch nothing"""
+        ticker = self._ticker(keyword)
+        if not self.coverage.is_covered(self.exchange, ticker, doctype,
+            start_date, end_date):
+            return False
+        params = [self.exchange, ticker, start_date.strftime('%Y-%m-%d'),
+            end_date.strftime('%Y-%m-%d 23:59:59')]
+        sql = f"""SELECT COUNT(*) FROM filings f
+            LEFT JOIN {self.store.content_relation()} c
+            ON c.exchange = f.exchange AND c.filing_id = f.filing_id
+            WHERE f.exchange = ? AND f.ticker = ? AND f.filing_date BETWEEN ? AND ?
+            AND COALESCE(c.has_content, 0) = 0
+            AND NOT EXISTS (SELECT 1 FROM filing_quarantine q
+                WHERE q.exchange = f.exchange AND q.filing_id = f.filing_id)"""
+        if doctype != 'all':
+            sql += """ AND f.filing_id IN (SELECT filing_id FROM filing_labels
+                WHERE exchange = f.exchange AND doctype = ?)"""
+            params.append(doctype)
+        return self.sql_conn.execute(sql, params).fetchone()[0] == 0
+
+    def get_filing_list(self, keyword: str, start_date: dt.date=dt.date(1999, 12, 31),
+        end_date: dt.dated=dt.date.today(), doctype='all', ascending: bool=False,
+        verbose: bool=False, save_to_sql=False, use_coverage: bool=False) -> pd.DataFrame:
+        """return filing list for a given stock. Filings are recorded in the
+        filings store, and with use_coverage only the parts of the date range
+        that the coverage index doesn't have yet are fetched from hkexnews
+        :param keyword: the stock name or symbol
+        :param start_date: the start date of filings
+        :param end_date: the end date of filings
+        :param doctype: the type of filing, default is all
+        :param ascending: sort the list in ascending order
+        :param verbose: print the progress if True
+        :param use_coverage: read the list from the filings store, fetching
+            only what it's missing. The store keeps news_id, stock_code,
+            stock_name, title, date_time, url, size and doctype, not all the
+            columns hkexnews returns"""
+        ticker = self._ticker(keyword)
+        if use_coverage:
+            for start, end in self.coverage.missing(self.exchange, ticker,
+                doctype, start_date, end_date):
+                if verbose: print(f"fetching {ticker} {doctype} {start} - {end}")
+                self._record_filings(self._fetch_filing_list(keyword, start,
+                    end, doctype, ascending, verbose), ticker, doctype)
+                self.coverage.add(self.exchange, ticker, doctype, start, end)
+            df = self._local_filing_list(ticker, start_date, end_date,
+                doctype, ascending)
+        else:
+            df = self._fetch_filing_list(keyword, start_date, end_date,
+                doctype, ascending, verbose)
+            self._record_filings(df, ticker, doctype)
+            self.coverage.add(self.exchange, ticker, doctype, start_date, end_date)
         if save_to_sql:
             table_name = f"{keyword}_hkexnews_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}_{doctype}"
             self.frame_to_sql(df, table_name, if_exists='replace')
         return df
     
+    def _parse_latest(self, payload: Dict[str, Any]) -> pd.DataFrame:
+        """turn the latest filings json into a filing list"""
+        rows = []
+        for news in payload.get('newsInfoLst') or []:
+            stock = (news.get('stock') or [{}])[0] # filed under the first stock
+            rows.append(dict(news_id=str(news.get('newsId')),
+                stock_code=stock.get('sc'), stock_name=stock.get('sn'),
+                title=self.html_entities_to_unicode(str(news.get('title') or '')),
+                date_time=news.get('relTime'),
+                url=urljoin(self.endpoint, news.get('webPath') or ''),
+                file_info=news.get('size'), category=news.get('lTxt')))
+        return pd.DataFrame(rows, columns=latest_columns)
+
+    def poll_latest(self, mark_seen: bool=True, verbose: bool=False) -> pd.DataFrame:
+        """poll the latest filings listing once (endpoint set by the
+        "latest_filings_url" config key) and return the filings that weren't
+        seen before, after recording them in the filings store. Unchanged
+        listings are answered with a 304 and cost nothing to diff
+        :param mark_seen: mark the returned filings as seen, so the next poll
+            won't return them again. Without it the caller marks them and
+            calls self._latest.commit() once they're handled, until then the
+            listing isn't answered with a 304
+        """
+        if self._latest is None:
+            headers = self.headers.copy()
+            headers.update(dict(referer=self.endpoint, Accept='application/json'))
+            self._latest = ConditionalGet(self.session, self.latest_filings_url,
+                timeout=self.timeout, headers=headers)
+            self._seen = SeenFilings(self.sql_conn, self.exchange)
+        res = self._latest.get()
+        if res is None:
+            return pd.DataFrame(columns=latest_columns)
+        df = self._parse_latest(res.json())
+        df = df.loc[df.news_id.isin(self._seen.new(df.news_id))]
+        if df.empty:
+            self._latest.commit()
+            return df
+        if verbose: print(f"{len(df)} new filings")
+        for ticker, filings in df.groupby('stock_code'):
+            self._record_filings(filings, ticker, 'all')
+        if mark_seen:
+            self._seen.add(df.news_id)
+            self._latest.commit()
+        return df
+
+    def watch(self, on_filing: Optional[Callable[[Dict[str, Any]], Any]]=None,
+        queue: Optional[Any]=None, convert_to_text: bool=False,
+        min_interval: float=2, max_interval: float=60,
+        max_polls: Optional[int]=None, stop: Optional[threading.Event]=None,
+        verbose: bool=False) -> int:
+        """poll for newly published filings until stopped. New pdfs are 
+        downloaded, validated, converted and saved right away, then handed
+        over. Polls come every min_interval seconds while filings keep
+        coming, backing off to max_interval while it's quiet. Filings that
+        couldn't be handed over (or quarantined) are tried again on the
+        next poll
+        :param on_filing: called with each new filing (a dict of the filing
+            list columns plus filing_content)
+        :param queue: a queue.Queue (or anything with put) new filings are
+            put on
+        :param convert_to_text: hand over the text instead of the pdf
+        :param max_polls: stop after this many polls, runs until stop is set
+            otherwise
+        :param stop: an event to stop watching from another thread
+        :return: number of filings handed over
+        """
+        interval = AdaptiveInterval(min_interval, max_interval)
+        delivered, polls = 0, 0
+        def deliver(record: Dict[str, Any]):
+            if on_filing is not None:
+                on_filing(record)
+            if queue is not None:
+                queue.put(record)
+        while not (stop is not None and stop.is_set()) \
+            and (max_polls is None or polls < max_polls):
+            polls += 1
+            try:
+                df = self.poll_latest(mark_seen=False, verbose=verbose)
+            except Exception as e: # a failed poll shouldn't end the watch
+                if verbose: print(f"poll failed: {e}")
+                df = pd.DataFrame(columns=latest_columns)
+            is_pdf = df.url.str.lower().str.endswith('.pdf')
+            handled = set()
+            try:
+                for record in self._iter_content(df.loc[is_pdf], 'news_id',
+                    convert_to_text=convert_to_text, ignore_errors=True,
+                    verbose=verbose):
+                    deliver(record)
+                    delivered += 1
+                    handled.add(str(record['news_id']))
+                for record in df.loc[~is_pdf].to_dict('records'): # html notices
+                    record['filing_content'] = None
+                    deliver(record)
+                    delivered += 1
+                    handled.add(str(record['news_id']))
+            except Exception as e: # nor should a failed delivery
+                if verbose: print(f"delivery failed: {e}")
+            # quarantined filings are done with too. The ones skipped (an
+            # endpoint paused for too long, a network error) come back with
+            # the next poll, as the listing isn't committed until they're in
+            if not df.empty:
+                polled = set(df.news_id.astype(str))
+                handled.update(row[1] for row in self.store.quarantined(self.exchange)
+                    if row[1] in polled)
+                self._seen.add(handled)
+                if handled == polled:
+                    self._latest.commit()
+            pause = interval.update(not df.empty)
+            if max_polls is not None and polls >= max_polls:
+                break
+            if stop is not None:
+                stop.wait(pause)
+            else:
+                time.sleep(pause)
+        return delivered
+
     def get_filing_content(self, keyword: str, start_date: dt.date=dt.date(1999, 12, 31),
         end_date: dt.dated=dt.date.today(), doctype='all', ascending: bool=False,
         verbose: bool=False, save_to_sql=False, convert_to_text=False, 
@@ -119,27 +361,46 @@ class HKEXNews(AbstractScraper):
         :param use_dask: use dask to parallelize the process
         :param npartitions: the number of partitions to use when using dask
             no_cores * 2 recommended for optimal performance
+        Downloads that fail validation are quarantined in the filings store
+        and left without content (see AbstractScraper.download_filing)
         """
         df = self.get_filing_list(keyword, start_date, end_date, doctype, 
             ascending, verbose)
-        df.loc[:, 'filing_content'] = df.loc[:, 'url'].apply(
-            lambda u: self.get_pdf(u, session=self.session, timeout=self.timeout))
+        def get_content(news_id: str, url: str) -> Optional[bytes]:
+            stored = self.store.get_content(self.exchange, news_id)
+            if stored is not None and is_valid_pdf(stored[0]):
+                return stored[0]
+            content = self.download_filing(news_id, url, verbose=verbose)
+            if save_to_sql and content is not None:
+                self.store.insert_content(self.exchange, news_id, content)
+                self.store.release(self.exchange, news_id)
+            return content
+        df.loc[:, 'filing_content'] = [get_content(news_id, url)
+            for news_id, url in zip(df.news_id, df.url)]
         # for i, url in df.FILE_LINK.iteritems():
         #     df.loc[i, 'FILE_CONTENT'] = self.get_pdf(url, 
         #         session=self.session, timeout=self.timeout)
         if convert_to_text:
             try:
                 if use_dask:
-                    ddf = dd.from_pandas(df.filing_content.astype(bytes), 
+                    # quarantined filings have no content, which astype(bytes)
+                    # would turn into b'None'
+                    content = df.filing_content.loc[df.filing_content.notna()]
+                    ddf = dd.from_pandas(content.astype(bytes), 
                         npartitions=npartitions)
                     df = ddf.astype(bytes).apply(
-                        lambda row: self.pdf_to_text(bytes(row)) 
+                        lambda row: self.to_text(bytes(row), 
+                            cache=self.extraction_cache) 
                         if str(row)[1:6] else np.nan, 
                         meta=('filing_conent', 'object')
-                        ).compute(scheduler='threads')
+                        ).compute(scheduler='threads').reindex(df.index)
                 # FIXME - issues remain here
                 else:
-                    df.loc[:, 'filing_content'] = df.loc[:, 'filing_content'].apply(self.pdf_to_text)
+                    # near-duplicates (with "dedup" configured) aren't converted
+                    df.loc[:, 'filing_content'] = [None if c is None
+                        or self.find_duplicate(news_id, c) is not None
+                        else self.convert(c)
+                        for news_id, c in zip(df.news_id, df.filing_content)]
             except Exception as e:
                 if ignore_errors:
                     print(e)
@@ -151,56 +412,231 @@ class HKEXNews(AbstractScraper):
             self.frame_to_sql(df, table_name, if_exists='replace')
         return df
 
+    def iter_filing_content(self, keyword: str, start_date: dt.date=dt.date(1999, 12, 31),
+        end_date: dt.date=dt.date.today(), doctype='all', ascending: bool=False,
+        verbose: bool=False, save_to_sql: bool=True, convert_to_text: bool=False,
+        ignore_errors: bool=False, batch_size: int=1
+        ) -> Iterator[Union[Dict[str, Any], List[Dict[str, Any]]]]:
+        """same as get_filing_content, but yields one filing at a time (or
+        lists of batch_size filings), downloading, converting and saving each
+        as it goes. Peak memory doesn't grow with the number of filings.
+        :param keyword: the stock name or symbol
+        :param start_date: the start date of filings
+        :param end_date: the end date of filings
+        :param doctype: the type of filing, default is all
+        :param ascending: sort the list in ascending order
+        :param verbose: print the progress if True
+        :param save_to_sql: save each filing to the filings store
+        :param convert_to_text: convert the content to text
+        :param ignore_errors: skip filings that fail instead of raising
+        :param batch_size: yield lists of this many filings if > 1
+        """
+        df = self.get_filing_list(keyword, start_date, end_date, doctype,
+            ascending, verbose)
+        return self._iter_content(df, 'news_id', convert_to_text=convert_to_text,
+            save_to_sql=save_to_sql, ignore_errors=ignore_errors,
+            batch_size=batch_size, verbose=verbose)
+
+    @classmethod
+    def download_stock(cls, stock_name: str, start_date: dt.date,
+        end_date: dt.date, doctype='annual_report', verbose=False,
+        ignore_errors: bool=False, stream: bool=False, **kwargs) -> None:
+        """download and save the filings of one stock with a fresh scraper.
+        The scraper is created in the calling thread as sqlite connections 
+        can't be shared between threads
+        :param kwargs: passed to the constructor, plus convert_to_text
+        """
+        scraper = cls(**kwargs)
+        job = dict(keyword=stock_name, save_to_sql=True, verbose=verbose,
+            start_date=start_date, end_date=end_date, doctype=doctype,
+            convert_to_text=kwargs.get('convert_to_text', False),
+            ignore_errors=ignore_errors)
+        try:
+            if stream:
+                for _ in scraper.iter_filing_content(**job):
+                    pass
+            else:
+                scraper.get_filing_content(**job)
+        finally:
+            scraper.close_sql_conn()
+
+    @staticmethod
+    def enqueue(queue: WorkQueue, stock_list: List[str],
+        start_date: dt.date=dt.date(2015, 12, 31),
+        end_date: dt.date=dt.date.today(), doctype='annual_report',
+        priority: int=0) -> int:
+        """put a stock list on a shared work queue for work_from_queue
+        :return: number of stocks added (stocks already queued for the same
+            job are skipped)"""
+        return queue.put(stock_list, dict(start_date=start_date.isoformat(),
+            end_date=end_date.isoformat(), doctype=doctype), priority=priority)
+
+    @classmethod
+    def work_from_queue(cls, queue: WorkQueue, max_workers: int=1,
+        verbose=False, ignore_errors: bool=False, stream: bool=False,
+        wait_for_work: bool=False, **kwargs) -> int:
+        """lease stocks from a shared work queue and download them until the
+        queue is empty. Any number of processes, on any number of machines, 
+        can work from the same queue; stocks held by a worker that dies are
+        handed out again once their lease expires.
+        :param queue: the work queue, see enqueue
+        :param max_workers: number of worker threads in this process
+        :param wait_for_work: keep polling an empty queue instead of returning
+        :param kwargs: passed to the constructor, plus convert_to_text
+        :return: number of stocks completed by this process
+        """
+        def handle(stock_name: str, payload: Dict[str, Any]):
+            cls.download_stock(stock_name,
+                start_date=dt.date.fromisoformat(payload['start_date']),
+                end_date=dt.date.fromisoformat(payload['end_date']),
+                doctype=payload.get('doctype', 'annual_report'),
+                verbose=verbose, ignore_errors=ignore_errors, stream=stream,
+                **kwargs)
+        if max_workers <= 1:
+            return run_worker(queue, handle, wait_for_work=wait_for_work,
+                verbose=verbose)
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(run_worker, queue, handle,
+                wait_for_work=wait_for_work, verbose=verbose)
+                for _ in range(max_workers)]
+            return sum(future.result() for future in as_completed(futures))
+
+    @classmethod
+    def scheduled_download(cls, stock_list: List[str], verbose=False,
+        ignore_errors: bool=False, max_workers: int=0,
+        start_date: dt.date=dt.date(2015, 12, 31),
+        end_date: dt.date=dt.date.today(), doctype='annual_report',
+        **kwargs) -> Dict[str, Any]:
+        """download a stock list into the filings store, largest first.
+        Stocks are ordered by the size of their filings still to download,
+        as recorded by earlier listings (stocks never listed are taken to
+        have a few filings of the typical size, see estimate_costs). Once a
+        stock is listed its filings are queued individually, so the filings
+        of a heavy stock are spread over all the workers.
+        :param kwargs: passed to the constructor, plus convert_to_text
+        :return: the scheduler stats, see run_largest_first
+        """
+        convert_to_text = kwargs.get('convert_to_text', False)
+        tickers = {stock_name: str(stock_name).strip().zfill(5)
+            if str(stock_name).strip().isdigit() else str(stock_name).strip()
+            for stock_name in stock_list if str(stock_name).strip()}
+        scraper = cls(**kwargs)
+        try:
+            costs = estimate_costs(scraper.store, scraper.exchange,
+                tickers.values(), start_date, end_date, doctype)
+        finally:
+            scraper.close_sql_conn()
+        local = threading.local()
+
+        def thread_scraper() -> HKEXNews:
+            if getattr(local, 'scraper', None) is None:
+                local.scraper = cls(**kwargs)
+            return local.scraper
+
+        def close():
+            if getattr(local, 'scraper', None) is not None:
+                local.scraper.close_sql_conn()
+
+        def handle(task: Task) -> Optional[List[Task]]:
+            scraper = thread_scraper()
+            if task.payload is None: # list the stock, queue its filings
+                df = scraper.get_filing_list(task.key, start_date, end_date,
+                    doctype, verbose=verbose, use_coverage=True)
+                if df.empty:
+                    return None
+                typical_size = df['size'].median()
+                if typical_size != typical_size: # no sizes listed
+                    typical_size = default_filing_size
+                return [Task(filing_cost(record['size'], typical_size),
+                        str(record['news_id']), record)
+                    for record in df.to_dict('records')]
+            for _ in scraper._iter_content(pd.DataFrame([task.payload]),
+                'news_id', convert_to_text=convert_to_text, save_to_sql=True,
+                can_defer=True, verbose=verbose):
+                pass
+
+        tasks = [Task(costs[ticker], stock_name)
+            for stock_name, ticker in tickers.items()]
+        return run_largest_first(tasks, handle, max_workers=max_workers,
+            ignore_errors=ignore_errors, verbose=verbose, on_worker_exit=close)
+
     @classmethod
     def batch_download(cls, stock_list: List[str], verbose=False, 
         ignore_errors: bool=False, max_workers: int=0, 
         start_date: dt.date=dt.date(2015, 12, 31), 
         end_date: dt.date=dt.date.today(), doctype='annual_report',
-        **kwargs):
+        stream: bool=False, schedule: bool=False, **kwargs):
         """download filing list for a list of stocks
         :param stock_list: a list of stock names or symbols
         :param verbose: print the progress if True
         :param ignore_errors: ignore errors if True
         :param max_workers: the number of workers to download the data. If set to <= 1, will not use multithreading
+        :param stream: go through iter_filing_content and save filings one at
+            a time into the filings store, instead of holding a stock's
+            filings in a dataframe
+        :param schedule: download largest first and share the filings of
+            each stock between workers, see scheduled_download. Filings are
+            saved into the filings store
+        :param kwargs: passed to the constructor. All workers share one
+            session whose pool holds a connection per worker (pool_size,
+            http2 and circuit_breaker can be passed to change that)
         """
+        if kwargs.get('session') is None:
+            kwargs['session'] = _transport.make_session(
+                pool_size=kwargs.pop('pool_size', None) or max(max_workers, 1),
+                http2=kwargs.pop('http2', False),
+                circuit_breaker=kwargs.pop('circuit_breaker', False))
+        session = kwargs['session']
+        if schedule:
+            stats = cls.scheduled_download(stock_list, verbose=verbose,
+                ignore_errors=ignore_errors, max_workers=max_workers,
+                start_date=start_date, end_date=end_date, doctype=doctype,
+                **kwargs)
+            if verbose: print(_transport.connection_stats(session))
+            return stats
+        def download(stock_name: str):
+            cls.download_stock(stock_name, start_date=start_date,
+                end_date=end_date, doctype=doctype, verbose=verbose,
+                ignore_errors=ignore_errors, stream=stream, **kwargs)
+
         if max_workers > 1: # use multithreading
+            from concurrent.futures import ThreadPoolExecutor, as_completed
             for chunk in iter_by_chunk(stock_list, max_workers):
                 if verbose: print(chunk)
                 with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                    futures = [executor.submit(cls(**kwargs).get_filing_content, 
-                        keyword=stock_name, 
-                        save_to_sql=True, 
-                        verbose=verbose, start_date=start_date,
-                        end_date=end_date, 
-                        doctype=doctype,
-                        convert_to_text=kwargs.get('convert_to_text', False),
-                        ignore_errors=ignore_errors)
+                    futures = [executor.submit(download, stock_name)
                         for stock_name in chunk]
                     for future in as_completed(futures):
                         _ = future.result()
+            if verbose: print(_transport.connection_stats(session))
 
         else: # single threaded execution
             queue = deque() 
-            for stock_name in stock_list:
-                tablename = f"{stock_name}_hkexnews_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}_{doctype}"
-                if tablename not in cls(**kwargs).existing_tables:
-                    queue.append(stock_name)
+            scraper = cls(**kwargs)
+            try:
+                for stock_name in stock_list:
+                    # streamed downloads go to the filings store only
+                    if stream:
+                        done = scraper.is_downloaded(stock_name, start_date,
+                            end_date, doctype)
+                    else:
+                        tablename = f"{stock_name}_hkexnews_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}_{doctype}"
+                        done = tablename in scraper.existing_tables
+                    if not done:
+                        queue.append(stock_name)
+            finally:
+                scraper.close_sql_conn()
             while queue:
                 stock_name = queue.popleft()
                 try:
                     if verbose: print(stock_name)
-                    cls(**kwargs).get_filing_content(keyword=stock_name, save_to_sql=True, 
-                        verbose=verbose, 
-                        start_date=start_date,
-                        end_date=end_date, 
-                        doctype=doctype,
-                        convert_to_text=kwargs.get('convert_to_text', False),
-                        ignore_errors=ignore_errors
-                    )
+                    download(stock_name)
                 except Exception as e:
                     if verbose: print(e)
                     if not ignore_errors: raise e
                     else: pass
+            if verbose: print(_transport.connection_stats(session))
 
 if __name__ == '__main__':
     parser = ArgumentParser()
@@ -230,9 +666,30 @@ if __name__ == '__main__':
         help='max workers allowed for multithreading. Default 0, if set to <=1, will not use multithreading')
     parser.add_argument('-I', '--ignore_errors', action='store_true',
         help='if specified, will ignore errors and continue')
+    parser.add_argument('--stream', action='store_true',
+        help='if specified, will save filings one at a time to keep memory flat')
+    parser.add_argument('--schedule', action='store_true',
+        help='if specified, will download the largest stocks first and share their filings between workers')
+    parser.add_argument('-W', '--watch', action='store_true',
+        help='if specified, will poll for newly published filings and save them as they come, until interrupted')
+    parser.add_argument('-Q', '--queue_path', type=str, default=None,
+        help='path to a shared work queue (sqlite). If specified, will lease stocks from the queue instead of going through the stock list')
+    parser.add_argument('--enqueue', action='store_true',
+        help='with --queue_path, put the stock list on the queue and exit')
     args = parser.parse_args()
     if args.display_doctype_list:
         print(list(hkexnews_doc_types.keys()))
+    elif args.watch:
+        HKEXNews(config=args.config, db_path=args.db_path).watch(
+            on_filing=lambda record: print(record['date_time'], 
+                record['stock_code'], record['title']),
+            convert_to_text=args.convert_to_text, verbose=args.verbose)
+    elif args.queue_path and not args.enqueue:
+        HKEXNews.work_from_queue(SQLiteWorkQueue(args.queue_path),
+            max_workers=args.maxworker, verbose=args.verbose,
+            ignore_errors=args.ignore_errors, stream=args.stream,
+            config=args.config, db_path=args.db_path,
+            convert_to_text=args.convert_to_text)
     else:
         if not args.stock_list:
             stocks_path = args.stocks_path
@@ -241,13 +698,22 @@ if __name__ == '__main__':
                 stock_list = stock_list.split("\n")
         else:
             stock_list = args.stock_list
+        if args.queue_path:
+            n = HKEXNews.enqueue(SQLiteWorkQueue(args.queue_path), stock_list,
+                start_date=dt.datetime.strptime(args.start_date, '%Y%m%d').date(),
+                end_date=dt.datetime.strptime(args.end_date, '%Y%m%d').date(),
+                doctype=args.doctype)
+            if args.verbose: print(f"queued {n} stocks")
+            sys.exit(0)
         HKEXNews().batch_download(stock_list=stock_list, 
             verbose=args.verbose, start_date=dt.datetime.strptime(args.start_date, '%Y%m%d').date(),
             end_date=dt.datetime.strptime(args.end_date, '%Y%m%d').date(),
             config=args.config,
-            dbpath=args.db_path, 
+            db_path=args.db_path, 
             doctype=args.doctype,
             convert_to_text=args.convert_to_text,
             max_workers=args.maxworker,
-            ignore_errors=args.ignore_errors
+            ignore_errors=args.ignore_errors,
+            stream=args.stream,
+            schedule=args.schedule
             )
\ No newline at end of file
@@ -0,0 +1,187 @@
+"""Run the jobs of several exchanges at the same time, in one process tree.
+Each job gets its own worker threads and its own session, budgeted for
+requests per second and bytes per second, so one exchange's limits don't
+slow the others down. Sessions adapt their timeouts to each endpoint and
+pause endpoints that keep failing (set "circuit_breaker": false on a job to
+use fixed timeouts), so a dead host doesn't eat the run's time. Conversion to text, the CPU heavy part, goes to one
+process pool shared by all the jobs. A combined nightly run then takes as
+long as its slowest exchange instead of the sum of all of them.
+
+Jobs are described in a json file:
+
+    {"convert_workers": 4,
+     "jobs": [
+        {"exchange": "hkexnews", "stocks_path": "hkstocklist.txt",
+         "doctype": "annual_report", "start_date": "20151231",
+         "max_workers": 8, "requests_per_second": 5,
+         "bytes_per_second": 4000000, "convert_to_text": true,
+         "db_path": "hkexnews.db"},
+        {"exchange": "cninfo", "stock_list": ["000001", "600000"],
+         "max_workers": 4, "requests_per_second": 2,
+         "config": "./FilingScraper/config/cninfo_config.json"},
+        {"exchange": "edgar", "zip_path": "submissions.zip",
+         "forms": ["10-K"], "max_workers": 4}]}
+"""
+
+from __future__ import annotations
+from typing import Dict, Any, List, Optional, Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from argparse import ArgumentParser
+import datetime as dt
+import json
+import multiprocessing
+import time
+from . import utils
+
+_transport = utils.LazyModule(f"{__package__}._transport")
+
+__all__ = ['run_jobs', 'run_jobs_file', 'runners']
+
+
+def _date(value: Optional[str], default: dt.date) -> dt.date:
+    if not value:
+        return default
+    return dt.datetime.strptime(str(value).replace('-', ''), '%Y%m%d').date()
+
+
+def _stock_list(job: Dict[str, Any]) -> List[str]:
+    if job.get('stock_list'):
+        return [str(stock) for stock in job['stock_list']]
+    with open(job['stocks_path'], 'r') as f:
+        return [line.strip() for line in f.read().split('\n') if line.strip()]
+
+
+def _scraper_kwargs(job: Dict[str, Any], session: Any,
+    convert_pool: Optional[Executor]) -> Dict[str, Any]:
+    kwargs = dict(session=session, convert_pool=convert_pool,
+        convert_to_text=job.get('convert_to_text', False))
+    for key in ('config', 'db_path'):
+        if job.get(key):
+            kwargs[key] = job[key]
+    return kwargs
+
+
+def _run_hkexnews(job: Dict[str, Any], session: Any,
+    convert_pool: Optional[Executor], verbose: bool) -> Any:
+    from .hkex.hkexnews import HKEXNews
+    return HKEXNews.batch_download(_stock_list(job), verbose=verbose,
+        ignore_errors=job.get('ignore_errors', True),
+        max_workers=job.get('max_workers', 1),
+        start_date=_date(job.get('start_date'), dt.date(2015, 12, 31)),
+        end_date=_date(job.get('end_date'), dt.date.today()),
+        doctype=job.get('doctype', 'annual_report'), schedule=True,
+        **_scraper_kwargs(job, session, convert_pool))
+
+
+def _run_cninfo(job: Dict[str, Any], session: Any,
+    convert_pool: Optional[Executor], verbose: bool) -> Any:
+    from .cninfo.cninfo import CNInfo
+    return CNInfo.batch_download(_stock_list(job), verbose=verbose,
+        ignore_errors=job.get('ignore_errors', True),
+        max_workers=job.get('max_workers', 1),
+        start_date=_date(job.get('start_date'), dt.date(2015, 12, 31)),
+        end_date=_date(job.get('end_date'), dt.date.today()),
+        doctype=job.get('doctype', 'all'),
+        **_scraper_kwargs(job, session, convert_pool))
+
+
+def _run_edgar(job: Dict[str, Any], session: Any,
+    convert_pool: Optional[Executor], verbose: bool) -> Any:
+    from .edgar.sec_edgar import SECEdgar
+    scraper = SECEdgar(**_scraper_kwargs(job, session, convert_pool))
+    try:
+        return scraper.load_bulk_submissions(job.get('zip_path', 'submissions.zip'),
+            forms=job.get('forms'), max_workers=job.get('max_workers', 0),
+            verbose=verbose)
+    finally:
+        scraper.close_sql_conn()
+
+
+# exchange: function running a job of that exchange
+runners: Dict[str, Callable[[Dict[str, Any], Any, Optional[Executor], bool], Any]] = {
+    'hkexnews': _run_hkexnews,
+    'cninfo': _run_cninfo,
+    'edgar': _run_edgar,
+    }
+
+
+def run_job(job: Dict[str, Any], convert_pool: Optional[Executor]=None,
+    verbose: bool=False) -> Dict[str, Any]:
+    """run one job with its own budgeted session
+    :return: dict with the job's elapsed seconds, its result or its error,
+        and the connection and endpoint stats of its session
+    """
+    if job.get('exchange') not in runners:
+        raise ValueError(f"unknown exchange {job.get('exchange')}, pick from {list(runners)}")
+    session = _transport.make_session(pool_size=max(job.get('max_workers', 1), 1),
+        requests_per_second=job.get('requests_per_second'),
+        bytes_per_second=job.get('bytes_per_second'),
+        circuit_breaker=job.get('circuit_breaker', True))
+    start = time.perf_counter()
+    summary = dict(exchange=job['exchange'])
+    try:
+        summary['result'] = runners[job['exchange']](job, session, convert_pool, verbose)
+    except Exception as e:
+        summary['error'] = repr(e)
+    summary['elapsed'] = time.perf_counter() - start
+    summary['connections'] = _transport.connection_stats(session)
+    summary['endpoints'] = _transport.endpoint_stats(session)
+    return summary
+
+
+def run_jobs(jobs: List[Dict[str, Any]], convert_workers: int=0,
+    verbose: bool=False) -> Dict[str, Dict[str, Any]]:
+    """run the jobs side by side, one thread per job
+    :param jobs: job descriptions, see the module docstring. A job's "name"
+        defaults to its exchange
+    :param convert_workers: processes in the conversion pool shared by all
+        the jobs. Conversion happens in the worker threads if <= 0
+    :return: dict of job name: summary, see run_job
+    """
+    names = [job.get('name', job.get('exchange')) for job in jobs]
+    if len(set(names)) != len(names):
+        raise ValueError("jobs need distinct names, set 'name' on jobs of the same exchange")
+    # the pool starts its processes on demand, from the jobs' worker threads.
+    # Forking a process with running threads can copy a held lock into the
+    # child, so they're spawned instead
+    convert_pool = ProcessPoolExecutor(convert_workers,
+        mp_context=multiprocessing.get_context('spawn')) if convert_workers > 0 else None
+    try:
+        with ThreadPoolExecutor(max_workers=max(len(jobs), 1)) as executor:
+            futures = {name: executor.submit(run_job, job, convert_pool, verbose)
+                for name, job in zip(names, jobs)}
+            summaries = {name: future.result() for name, future in futures.items()}
+    finally:
+        if convert_pool is not None:
+            convert_pool.shutdown()
+    if verbose:
+        for name, summary in summaries.items():
+            print(f"{name}: {summary['elapsed']:.1f}s"
+                f"{', failed: ' + summary['error'] if 'error' in summary else ''}")
+    return summaries
+
+
+def run_jobs_file(jobs_path: str, convert_workers: Optional[int]=None,
+    verbose: bool=False) -> Dict[str, Dict[str, Any]]:
+    """run the jobs of a json file, see the module docstring
+    :param convert_workers: overrides convert_workers in the file
+    :return: dict of job name: summary, see run_job
+    """
+    with open(jobs_path, 'r') as f:
+        spec = json.load(f)
+    if convert_workers is None:
+        convert_workers = spec.get('convert_workers', 0)
+    return run_jobs(spec['jobs'], convert_workers=convert_workers, verbose=verbose)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-J', '--jobs_path', type=str, default='jobs.json',
+        help='path to the json file describing the jobs, see the module docstring')
+    parser.add_argument('-P', '--convert_workers', type=int, default=None,
+        help='processes converting filings to text, shared by all the jobs. Overrides convert_workers in the jobs file')
+    parser.add_argument('-V', '--verbose', action='store_true',
+        help='print the progress')
+    args = parser.parse_args()
+    run_jobs_file(args.jobs_path, convert_workers=args.convert_workers,
+        verbose=args.verbose)
@@ -0,0 +1,122 @@
+"""Helpers shared by the tests: scrapers on an in-memory database whose
+session the test controls, and small generated pdfs."""
+import json
+import unittest
+from typing import Any, Dict, List, Optional, Union
+import requests
+
+font = "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+
+
+def make_pdf(n: int, pad: int=20000, typed: bool=False, text: str="Page {i} text") -> bytes:
+    """a pdf of n pages in a two level page tree, whose intermediate nodes
+    and odd pages have no /Type unless typed. Each page is followed by a
+    padding stream, like the images of a report, and inherits the font and
+    media box from the root
+    :param text: what page i says, formatted with i
+    """
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, font]
+    nodes = []
+    for start in range(0, n, 4):
+        node = len(objects) + 1
+        objects.append(None)
+        kids = []
+        for i in range(start, min(start + 4, n)):
+            page = len(objects) + 1
+            kids.append(f"{page} 0 R")
+            content = f"BT /F1 12 Tf 72 720 Td ({text.format(i=i)}) Tj ET"
+            objects.append(f"<< {'' if i % 2 and not typed else '/Type /Page '}/Parent {node} 0 R "
+                f"/Contents {page + 1} 0 R >>")
+            objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+            objects.append(f"<< /Length {pad} >>\nstream\n{' ' * pad}\nendstream")
+        objects[node - 1] = f"<< {'/Type /Pages ' if typed else ''}/Parent 2 0 R /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+        nodes.append(f"{node} 0 R")
+    objects[1] = (f"<< /Type /Pages /Kids [{' '.join(nodes)}] /Count {n} "
+        "/MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> >>")
+    pdf, offsets = b"%PDF-1.4\n", []
+    for i, obj in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += f"{i} 0 obj\n{obj}\nendobj\n".encode('latin-1')
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    pdf += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    pdf += (f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref}\n%%EOF\n").encode()
+    return pdf
+
+
+class Response:
+    def __init__(self, content: Union[bytes, str, dict]=b"", status_code: int=200,
+        headers: Optional[Dict[str, str]]=None):
+        if isinstance(content, dict):
+            content = json.dumps(content)
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        self.content = content
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers or {})
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8')
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}", response=self)
+
+
+class StubSession:
+    def __init__(self, responses: Optional[Dict[str, Any]]=None):
+        """a session answering from a dict instead of the network
+        :param responses: url (without the query) to a Response, the bytes
+            of a 200 response, an exception to raise, or a callable taking
+            the url and the request's kwargs and returning any of those.
+            Other urls are answered with a 404
+        """
+        self.responses = dict(responses or {})
+        self.requests: List[str] = []
+
+    def request(self, method: str, url: str, **kwargs) -> Response:
+        self.requests.append(url)
+        answer = self.responses.get(url.split('?')[0], Response(status_code=404))
+        if callable(answer) and not isinstance(answer, type):
+            answer = answer(url, kwargs)
+        if isinstance(answer, BaseException):
+            raise answer
+        if not isinstance(answer, Response):
+            answer = Response(answer)
+        return answer
+
+    def get(self, url: str, **kwargs) -> Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> Response:
+        return self.request('POST', url, **kwargs)
+
+    def mount(self, prefix: str, adapter: Any) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class ScraperTestCase(unittest.TestCase):
+    def make_scraper(self, cls: Optional[type]=None, session: Any=None, **kwargs) -> Any:
+        """a scraper on a fresh in-memory database, closed after the test
+        :param cls: the scraper class, HKEXNews by default
+        :param session: the session it downloads with, a StubSession
+            answering 404 to everything by default
+        :param kwargs: passed to the constructor
+        """
+        if cls is None:
+            from ..hkex.hkexnews import HKEXNews as cls
+        from ..cninfo.cninfo import CNInfo
+        if issubclass(cls, CNInfo):
+            kwargs.setdefault('token', 'test-token')
+        scraper = cls(db_path=kwargs.pop('db_path', ':memory:'),
+            session=StubSession() if session is None else session, **kwargs)
+        self.addCleanup(scraper.close_sql_conn)
+        return scraper
@@ -0,0 +1,175 @@
+import time
+import unittest
+from unittest import mock
+import pandas as pd
+from .._breaker import CircuitOpenError, Endpoint, Endpoints
+from ..hkex.hkexnews import HKEXNews
+from ..utils import config
+from .fixtures import ScraperTestCase, StubSession, make_pdf
+
+
+class TestEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.endpoint = Endpoint('host/*.pdf', failure_threshold=3, cooldown=0.05,
+            max_cooldown=0.15, max_timeout=0.2)
+
+    def trip(self):
+        for _ in range(3):
+            self.endpoint.acquire()
+            self.endpoint.record_failure()
+
+    def test_opens_after_consecutive_failures(self):
+        for _ in range(2):
+            self.endpoint.acquire()
+            self.endpoint.record_failure()
+        self.endpoint.record_success(0.1) # resets the count
+        for _ in range(2):
+            self.endpoint.record_failure()
+        self.assertEqual(self.endpoint.state, 'closed')
+        self.endpoint.record_failure()
+        self.assertEqual(self.endpoint.state, 'open')
+        self.assertEqual(self.endpoint.trips, 1)
+        with self.assertRaises(CircuitOpenError) as cm:
+            self.endpoint.acquire()
+        self.assertEqual(cm.exception.endpoint, 'host/*.pdf')
+        self.assertGreater(cm.exception.retry_in, 0)
+        self.assertLessEqual(cm.exception.retry_in, 0.05)
+
+    def test_failures_sent_before_opening_dont_extend_it(self):
+        self.trip()
+        open_until = self.endpoint.open_until
+        self.endpoint.record_failure()
+        self.assertEqual((self.endpoint.open_until, self.endpoint.trips), (open_until, 1))
+
+    def test_successful_trial_closes(self):
+        self.trip()
+        time.sleep(0.06)
+        self.assertEqual(self.endpoint.state, 'half-open')
+        self.endpoint.acquire() # the trial
+        with self.assertRaises(CircuitOpenError): # one trial at a time
+            self.endpoint.acquire()
+        self.endpoint.record_success(0.1)
+        self.assertEqual(self.endpoint.state, 'closed')
+        self.endpoint.acquire()
+        self.assertEqual((self.endpoint.failures, self.endpoint.cooldown), (0, 0.05))
+
+    def test_failed_trial_reopens_for_longer(self):
+        self.trip()
+        for cooldown in (0.1, 0.15, 0.15):
+            time.sleep(self.endpoint.cooldown + 0.01)
+            self.endpoint.acquire()
+            self.endpoint.record_failure()
+            self.assertEqual(self.endpoint.state, 'open')
+            self.assertEqual(self.endpoint.cooldown, cooldown)
+        self.assertEqual(self.endpoint.trips, 4)
+
+    def test_lost_trial_expires(self):
+        self.trip()
+        time.sleep(0.06)
+        self.endpoint.acquire() # never reports back
+        with self.assertRaises(CircuitOpenError) as cm:
+            self.endpoint.acquire()
+        time.sleep(cm.exception.retry_in + 0.01)
+        self.endpoint.acquire()
+
+    def test_adaptive_timeout(self):
+        endpoint = Endpoint('host/', min_samples=5, multiplier=4, min_timeout=1,
+            max_timeout=60)
+        for latency in (0.5, 0.6, 0.7, 0.8):
+            endpoint.record_success(latency)
+        self.assertEqual(endpoint.timeout((3, 10)), (3, 10))
+        endpoint.record_failure(2.) # a timeout counts what was waited
+        self.assertEqual(endpoint.timeout(10), 8.)
+        for _ in range(100): # the slow ones leave the window
+            endpoint.record_success(0.01)
+        self.assertEqual(endpoint.timeout(10), 1)
+        self.assertEqual(endpoint.stats()['state'], 'closed')
+
+    def test_deadline_scales_with_size(self):
+        endpoint = Endpoint('host/*.pdf', min_samples=2, multiplier=4, min_timeout=1,
+            min_transfer_size=1000, max_transfer_time=100)
+        endpoint.record_transfer(10 ** 6, 1)
+        self.assertIsNone(endpoint.deadline(10 ** 6))
+        endpoint.record_transfer(10 ** 6, 2)
+        endpoint.record_transfer(500, 10) # too small to tell a rate
+        self.assertEqual(len(endpoint.rates), 2)
+        # at the slow end, 500kB/s
+        self.assertEqual(endpoint.deadline(10 ** 7), 80)
+        self.assertEqual(endpoint.deadline(10 ** 5), 1)
+        self.assertEqual(endpoint.deadline(10 ** 8), 100)
+        for size in (None, 0, 999):
+            self.assertIsNone(endpoint.deadline(size))
+        self.assertEqual(endpoint.stats()['rate_p05'], 5 * 10 ** 5)
+
+
+class TestEndpoints(unittest.TestCase):
+    def test_key(self):
+        self.assertEqual(Endpoints.key("https://www1.hkexnews.hk/listedco/2020/0301/a.PDF"),
+            "www1.hkexnews.hk/*.pdf")
+        self.assertEqual(Endpoints.key("http://www.cninfo.com.cn/new/hisAnnouncement/query"),
+            "www.cninfo.com.cn/new/hisAnnouncement/query")
+        self.assertEqual(Endpoints.key("https://host/search/titleSearchServlet.do?x=1"),
+            "host/search/titleSearchServlet.do")
+        self.assertEqual(Endpoints.key("https://host"), "host/")
+
+    def test_endpoints_are_shared(self):
+        endpoints = Endpoints(cooldown=1)
+        endpoint = endpoints.get("https://host/a/1.pdf")
+        self.assertIs(endpoints.get("https://host/b/2.pdf"), endpoint)
+        self.assertEqual(endpoint.base_cooldown, 1)
+        self.assertEqual(list(endpoints.stats()), ["host/*.pdf"])
+
+
+class TestScraper(ScraperTestCase):
+    def test_open_breaker_ends_the_batch(self):
+        session = StubSession({'http://host/1.pdf':
+            CircuitOpenError('host/*.pdf', time.monotonic() + 30)})
+        scraper = self.make_scraper(session=session)
+        df = pd.DataFrame([dict(news_id='1', url='http://host/1.pdf'),
+            dict(news_id='2', url='http://host/2.pdf')])
+        with self.assertRaises(CircuitOpenError):
+            list(scraper._iter_content(df, 'news_id', ignore_errors=True, can_defer=True))
+        self.assertEqual(session.requests, ['http://host/1.pdf'])
+
+    def test_downloads_wait_for_the_endpoint(self):
+        pdf = make_pdf(1, pad=10, typed=True)
+        answers = [CircuitOpenError('host/*.pdf', time.monotonic() + 30), pdf]
+        session = StubSession({'http://host/1.pdf': lambda url, kwargs: answers.pop(0),
+            'http://host/2.pdf': pdf})
+        scraper = self.make_scraper(session=session)
+        df = pd.DataFrame([dict(news_id='1', url='http://host/1.pdf'),
+            dict(news_id='2', url='http://host/2.pdf')])
+        with mock.patch('time.sleep') as sleep:
+            records = list(scraper._iter_content(df, 'news_id', ignore_errors=True))
+        # the other filing goes first, then the wait for the endpoint
+        self.assertEqual([record['news_id'] for record in records], ['2', '1'])
+        self.assertAlmostEqual(sleep.call_args[0][0], 30, delta=1)
+        answers[:] = [CircuitOpenError('host/*.pdf', time.monotonic() + 30), pdf]
+        with mock.patch('time.sleep') as sleep:
+            self.assertEqual(scraper.download_filing('1', 'http://host/1.pdf'), pdf)
+        self.assertAlmostEqual(sleep.call_args[0][0], 30, delta=1)
+
+    def test_a_paused_endpoint_eventually_fails_the_filing(self):
+        session = StubSession({'http://host/1.pdf': lambda url, kwargs:
+            CircuitOpenError('host/*.pdf', time.monotonic() + 30)})
+        scraper = self.make_scraper(session=session, config=config(max_deferrals=2))
+        df = pd.DataFrame([dict(news_id='1', url='http://host/1.pdf')])
+        with mock.patch('time.sleep'):
+            self.assertEqual(list(scraper._iter_content(df, 'news_id', ignore_errors=True)), [])
+            self.assertEqual(len(session.requests), 3)
+            with self.assertRaises(CircuitOpenError):
+                list(scraper._iter_content(df, 'news_id'))
+            with self.assertRaises(CircuitOpenError):
+                scraper.download_filing('1', 'http://host/1.pdf')
+        # not quarantined, the filing may well be fine
+        self.assertEqual(scraper.store.quarantined(), [])
+
+    def test_circuit_breaker_needs_its_own_http1_session(self):
+        with self.assertRaises(ValueError):
+            HKEXNews(db_path=':memory:', session=object(), circuit_breaker=True)
+        with self.assertRaises(ValueError):
+            HKEXNews(db_path=':memory:', http2=True, circuit_breaker=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import io
+import unittest
+import PyPDF2
+from .._Abstract_scraper import AbstractScraper
+from .._chinese import is_chinese_page, strip_chinese
+
+latin = "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+# the names say nothing, only the encoding or the CID ordering does
+gb_cmap = "<< /Type /Font /Subtype /Type0 /BaseFont /ABCDEF+Font1 /Encoding /UniGB-UCS2-H >>"
+cns_ordering = ("<< /Type /Font /Subtype /Type0 /BaseFont /ABCDEF+Font2 /Encoding /Identity-H "
+    "/DescendantFonts [<< /Type /Font /Subtype /CIDFontType0 /BaseFont /ABCDEF+Font2 "
+    "/CIDSystemInfo << /Registry (Adobe) /Ordering (CNS1) /Supplement 0 >> >>] >>")
+japanese = ("<< /Type /Font /Subtype /Type0 /BaseFont /ABCDEF+Font3 /Encoding /Identity-H "
+    "/DescendantFonts [<< /Type /Font /Subtype /CIDFontType0 /BaseFont /ABCDEF+Font3 "
+    "/CIDSystemInfo << /Registry (Adobe) /Ordering (Japan1) /Supplement 0 >> >>] >>")
+# a Latin font whose name merely contains "Sun"
+sun_latin = "<< /Type /Font /Subtype /Type1 /BaseFont /ABCDEF+SunValley >>"
+
+
+def make_pdf(pages):
+    """a pdf of the given pages, each (fonts, text) with its own resources.
+    The text is set in the first font"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None]
+    kids = []
+    for fonts, text in pages:
+        refs = []
+        for font in fonts:
+            objects.append(font)
+            refs.append(f"/F{len(refs) + 1} {len(objects)} 0 R")
+        content = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        resources = f"<< /Font << {' '.join(refs)} >> >>"
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+        page = f"<< /Type /Page /Parent 2 0 R /Resources {resources} /Contents {len(objects)} 0 R >>"
+        objects.append(page)
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} /MediaBox [0 0 612 792] >>"
+    pdf, offsets = b"%PDF-1.4\n", []
+    for i, obj in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += f"{i} 0 obj\n{obj}\nendobj\n".encode('latin-1')
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    pdf += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    pdf += (f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref}\n%%EOF\n").encode()
+    return pdf
+
+
+def pages(*specs):
+    return PyPDF2.PdfFileReader(io.BytesIO(make_pdf(specs))).pages
+
+
+class TestIsChinesePage(unittest.TestCase):
+    def test_cmap_and_ordering_fonts(self):
+        gb, cns, both = pages(([gb_cmap], "a"), ([cns_ordering], "b"), ([gb_cmap, cns_ordering], "c"))
+        self.assertTrue(is_chinese_page(gb))
+        self.assertTrue(is_chinese_page(cns))
+        self.assertTrue(is_chinese_page(both))
+
+    def test_pages_with_latin_fonts_are_kept(self):
+        for fonts in ([latin, gb_cmap], [gb_cmap, latin], [latin], [sun_latin], [japanese], []):
+            page, = pages((fonts, "x"))
+            self.assertFalse(is_chinese_page(page), fonts)
+
+
+class TestPagesToText(unittest.TestCase):
+    def test_chinese_pages_are_skipped(self):
+        document = pages(([latin], "English page"), ([gb_cmap], "Chinese page"),
+            ([latin, cns_ordering], "Mixed page"))
+        text = AbstractScraper._pages_to_text(document, skip_chinese_pages=True)
+        self.assertIn("English page", text)
+        self.assertIn("Mixed page", text)
+        self.assertNotIn("Chinese page", text)
+        # only when asked for, and never when keeping Chinese
+        for kwargs in (dict(), dict(keep_chinese=True, skip_chinese_pages=True)):
+            self.assertIn("Chinese page", AbstractScraper._pages_to_text(document, **kwargs))
+
+    def test_skipped_pages_aren_t_extracted(self):
+        english, chinese = pages(([latin], "English page"), ([gb_cmap], "Chinese page"))
+        extracted = []
+        for page in (english, chinese):
+            extract_text = page.extract_text
+            page.extract_text = lambda extract_text=extract_text, page=page: \
+                extracted.append(page) or extract_text()
+        AbstractScraper._pages_to_text([english, chinese], skip_chinese_pages=True)
+        self.assertEqual(extracted, [english])
+
+
+class TestStripChinese(unittest.TestCase):
+    def test_punctuation(self):
+        self.assertEqual(strip_chinese("Revenue（收入）：１００。「年報」、Profit，"),
+            "Revenue１００Profit")
+
+    def test_extension_ranges(self):
+        # extension A, compatibility ideographs, extension B and beyond
+        self.assertEqual(strip_chinese("a㐀b豈c\U00020000d\U0002a700e⼀f"),
+            "abcdef")
+
+    def test_blank_lines(self):
+        self.assertEqual(strip_chinese("English\n中文\n\n中文\nMore"), "English\n\nMore")
+        self.assertEqual(strip_chinese("one\ntwo"), "one\ntwo")
+
+
+if __name__ == '__main__':
+    unittest.main()
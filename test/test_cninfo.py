@@ -0,0 +1,109 @@
+import datetime as dt
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import pandas as pd
+from ..cninfo._classifier import DoctypeClassifier
+from ..cninfo._doctype import cninfo_doctypes
+from ..cninfo.cninfo import CNInfo
+from .fixtures import ScraperTestCase, StubSession, make_pdf
+
+titles = ['2019年年度报告', '2019年半年度报告', '2019年第一季度报告全文', '2019年社会责任报告',
+    '2019年度ESG报告', '首次公开发行股票招股说明书', '2019年度业绩说明会演示文稿',
+    '关于召开2019年度股东大会的通知', '*ST公司关于股票交易异常波动的公告', '', None]
+
+
+class TestDoctypeClassifier(unittest.TestCase):
+    def setUp(self):
+        self.classifier = DoctypeClassifier()
+
+    def test_every_label(self):
+        self.assertEqual(self.classifier.classify('2019年年度报告'),
+            ['periodic_report', 'annual_report'])
+        self.assertEqual(self.classifier.classify('2019年半年度报告'),
+            ['periodic_report', 'interim_report'])
+        self.assertEqual(self.classifier.classify('2019年第一季度报告全文'),
+            ['periodic_report', 'quarterly_report'])
+        self.assertEqual(self.classifier.classify('2019年度ESG报告'), ['esg_report'])
+
+    def test_same_as_one_search_per_doctype(self):
+        for title in titles:
+            self.assertEqual(self.classifier.classify(title), [doctype for doctype, pattern
+                in cninfo_doctypes.items() if pattern and re.search(pattern, title or '')], title)
+
+    def test_esg_pattern_is_an_alternation(self):
+        # a character class matched any title with 会, S, E, G, ( or )
+        for title in ('关于召开2019年度股东大会的通知', '*ST公司关于股票交易异常波动的公告',
+            '董事会决议公告(更正后)'):
+            self.assertNotIn('esg_report', self.classifier.classify(title), title)
+        self.assertEqual(self.classifier.classify('2019年社会责任报告'), ['esg_report'])
+
+    def test_primary(self):
+        self.assertEqual(DoctypeClassifier.primary(['periodic_report', 'annual_report']),
+            'annual_report')
+        self.assertEqual(DoctypeClassifier.primary(['custom']), 'custom')
+        self.assertIsNone(DoctypeClassifier.primary([]))
+
+    def test_custom_patterns(self):
+        classifier = DoctypeClassifier({'notice': '通知$', 'all': ''})
+        self.assertEqual(classifier.doctypes, ['notice'])
+        self.assertEqual(classifier.classify('关于召开2019年度股东大会的通知'), ['notice'])
+
+
+class TestIndexedFilingList(ScraperTestCase):
+    def test_read_back_without_the_api(self):
+        scraper = self.make_scraper(CNInfo)
+        records = pd.DataFrame([dict(TEXTID=str(i), SECCODE='000001', SECNAME='平安银行',
+            F001D=date, F002V=title, F003V=f"http://cn/{i}.pdf", F005N=100)
+            for i, (date, title) in enumerate((('2020-03-01 00:00:00', '2019年年度报告'),
+                ('2020-08-01 00:00:00', '2020年半年度报告'),
+                ('2020-09-01 00:00:00', '关于召开2020年度股东大会的通知')))])
+        self.assertEqual(scraper.classify(records),
+            [['periodic_report', 'annual_report'], ['periodic_report', 'interim_report'], []])
+        scraper.session.requests.clear()
+        period = dict(start_date=dt.date(2020, 1, 1), end_date=dt.date(2020, 12, 31))
+        df = scraper.get_indexed_filing_list('000001', **period)
+        self.assertEqual(df.text_id.tolist(), ['0', '1', '2'])
+        # the primary doctype in the filings store, every label in filing_labels
+        self.assertEqual(df.doctype.fillna('').tolist(), ['annual_report', 'interim_report', ''])
+        df = scraper.get_indexed_filing_list('000001', 'periodic_report', **period)
+        self.assertEqual(df.text_id.tolist(), ['0', '1'])
+        df = scraper.get_indexed_filing_list('000001', 'annual_report',
+            start_date=dt.date(2020, 1, 1), end_date=dt.date(2020, 3, 1))
+        self.assertEqual(df.text_id.tolist(), ['0'])
+        self.assertEqual(df.announcement_size.tolist(), [100])
+        self.assertTrue(scraper.get_indexed_filing_list('000002', **period).empty)
+        self.assertEqual(scraper.session.requests, [])
+
+
+class TestBatchDownload(ScraperTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.db_path = os.path.join(directory, 'cninfo.db')
+
+    def test_filings_are_queued_individually(self):
+        pdfs = {f"http://cn/{i}.pdf": make_pdf(1, pad=10, typed=True, text=f"Filing {i}")
+            for i in range(3)}
+        session = StubSession(pdfs)
+        listing = pd.DataFrame([dict(text_id=str(i), url=f"http://cn/{i}.pdf",
+            announcement_size=size) for i, size in enumerate((100, 3000, 2000))])
+        with mock.patch.object(CNInfo, 'get_filing_list', return_value=listing) as get_list:
+            stats = CNInfo.batch_download(['000001'], max_workers=1, session=session,
+                db_path=self.db_path, token='test-token')
+        get_list.assert_called_once()
+        self.assertEqual(get_list.call_args[0][0], '000001')
+        self.assertTrue(get_list.call_args[1]['use_coverage'])
+        # the listing, then a task per filing, largest first
+        self.assertEqual((stats['done'], stats['failed']), (4, 0))
+        self.assertEqual(session.requests, ["http://cn/1.pdf", "http://cn/2.pdf", "http://cn/0.pdf"])
+        scraper = self.make_scraper(CNInfo, session=session, db_path=self.db_path)
+        for i in range(3):
+            self.assertEqual(scraper.store.get_content('cninfo', str(i))[0], pdfs[f"http://cn/{i}.pdf"])
+
+
+if __name__ == '__main__':
+    unittest.main()
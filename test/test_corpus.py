@@ -0,0 +1,142 @@
+import datetime as dt
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from .._dedup import DuplicateIndex
+from .._shards import ShardRouter, ShardedFilingStore
+from .._store import FilingStore
+from ..corpus import Corpus
+
+filings = [
+    ('hkexnews', '1', '00005', 'HSBC', 'annual_report', '2019-03-01 00:00:00', 'Annual Report 2018', 'http://h/1.pdf', 100),
+    ('hkexnews', '2', '00005', 'HSBC', 'interim_report', '2019-08-01 00:00:00', 'Interim Report 2019', 'http://h/2.pdf', 100),
+    ('hkexnews', '3', '01398', 'ICBC', 'annual_report', '2020-03-01 00:00:00', 'Annual Report 2019', 'http://h/3.pdf', 100),
+    ('cninfo', '4', '601398', '工商银行', 'annual_report', '2020-03-05 00:00:00', '2019年年度报告', 'http://c/4.pdf', 100),
+    ('cninfo', '5', '000001', '平安银行', None, '2020-04-01 00:00:00', '2019年年度报告摘要', 'http://c/5.pdf', 100)]
+
+
+def ids(frame):
+    return frame.filing_id.tolist()
+
+
+class TestCorpus(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        cls.db = os.path.join(cls.dir, 'filings.db')
+        conn = sqlite3.connect(cls.db)
+        store = FilingStore(conn)
+        store.insert_filings(filings)
+        # filing 5 is labelled, without a primary doctype
+        store.insert_labels([('cninfo', '5', 'annual_report'), ('cninfo', '5', 'summary')])
+        store.insert_content('hkexnews', '1', b'pdf 1', 'text 1')
+        store.insert_content('hkexnews', '3', b'pdf 3')
+        store.insert_content('cninfo', '4', b'pdf 4')
+        DuplicateIndex(conn).link('cninfo', '4', 'hkexnews', '3', 0.9)
+        conn.close()
+        with open(cls.db, 'rb') as f:
+            cls.digest = hashlib.sha256(f.read()).hexdigest()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+
+    def setUp(self):
+        self.corpus = Corpus(self.db)
+        self.addCleanup(self.corpus.close)
+
+    def test_read_only(self):
+        self.assertEqual(self.corpus.count(has_content=True, duplicate=False), 2)
+        with self.assertRaises(sqlite3.OperationalError):
+            self.corpus.sql_conn.execute("CREATE TABLE t (x)")
+        self.corpus.close()
+        with open(self.db, 'rb') as f:
+            self.assertEqual(hashlib.sha256(f.read()).hexdigest(), self.digest)
+
+    def test_stores_need_migrating_first(self):
+        old = os.path.join(self.dir, 'old.db')
+        conn = sqlite3.connect(old)
+        conn.execute("""CREATE TABLE filings (exchange TEXT, filing_id TEXT, ticker TEXT,
+            issuer TEXT, doctype TEXT, filing_date TEXT, title TEXT, url TEXT, size INTEGER)""")
+        conn.execute("CREATE TABLE filing_content (exchange TEXT, filing_id TEXT, content BLOB, text TEXT)")
+        conn.commit()
+        conn.close()
+        with self.assertRaises(ValueError):
+            Corpus(old)
+        FilingStore(sqlite3.connect(old)).sql_conn.close() # a scraper opens it
+        Corpus(old).close()
+
+    def test_exchange(self):
+        self.assertEqual(ids(self.corpus.frame(exchange='cninfo')), ['4', '5'])
+        self.assertEqual(self.corpus.count(exchange=['cninfo', 'hkexnews']), 5)
+
+    def test_ticker(self):
+        self.assertEqual(ids(self.corpus.frame(ticker='00005')), ['1', '2'])
+        self.assertEqual(ids(self.corpus.frame(ticker=['01398', '601398'])), ['3', '4'])
+
+    def test_doctype(self):
+        # the primary doctype or any label
+        self.assertEqual(ids(self.corpus.frame(doctype='annual_report')), ['1', '3', '4', '5'])
+        self.assertEqual(ids(self.corpus.frame(doctype=['interim_report', 'summary'])), ['2', '5'])
+
+    def test_dates(self):
+        self.assertEqual(ids(self.corpus.frame(start_date='2020-03-01')), ['3', '4', '5'])
+        # the end date takes the whole day
+        self.assertEqual(ids(self.corpus.frame(end_date=dt.date(2020, 3, 1))), ['1', '2', '3'])
+        self.assertEqual(ids(self.corpus.frame(start_date='2019-06-01', end_date='2020-03-04')),
+            ['2', '3'])
+
+    def test_presence(self):
+        self.assertEqual(ids(self.corpus.frame(has_content=True)), ['1', '3', '4'])
+        self.assertEqual(ids(self.corpus.frame(has_content=False)), ['2', '5'])
+        self.assertEqual(ids(self.corpus.frame(has_text=True)), ['1'])
+        self.assertEqual(ids(self.corpus.frame(has_content=True, has_text=False)), ['3', '4'])
+
+    def test_duplicate(self):
+        self.assertEqual(ids(self.corpus.frame(duplicate=True)), ['4'])
+        self.assertEqual(ids(self.corpus.frame(duplicate=False)), ['1', '2', '3', '5'])
+        self.assertEqual(self.corpus.duplicate_of('cninfo', '4'), ('hkexnews', '3'))
+
+    def test_title_columns_and_order(self):
+        frame = self.corpus.frame(title='年度报告', columns=['filing_id', 'title'],
+            ascending=False, limit=1)
+        self.assertEqual(frame.values.tolist(), [['5', '2019年年度报告摘要']])
+        with self.assertRaises(ValueError):
+            self.corpus.frame(columns=['content'])
+
+    def test_filings(self):
+        filing, = self.corpus.filings(has_text=True)
+        self.assertEqual((filing.ticker, filing.content, filing.text), ('00005', b'pdf 1', 'text 1'))
+        self.assertIsNone(self.corpus.text('hkexnews', '3'))
+        self.assertIsNone(self.corpus.content('hkexnews', '2'))
+
+
+class TestShardedCorpus(unittest.TestCase):
+    def test_read_only_shards(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        db = os.path.join(directory, 'filings.db')
+        router = ShardRouter(os.path.join(directory, 'shards'))
+        conn = sqlite3.connect(db)
+        store = ShardedFilingStore(conn, router)
+        store.insert_filings(filings)
+        store.insert_content('hkexnews', '1', b'pdf 1', 'text 1')
+        store.close()
+        conn.close()
+        corpus = Corpus(db, shards=router)
+        self.addCleanup(corpus.close)
+        self.assertEqual(ids(corpus.frame(has_text=True)), ['1'])
+        self.assertEqual(corpus.text('hkexnews', '1'), 'text 1')
+        # never saved, its shard doesn't exist and isn't created
+        self.assertIsNone(corpus.content('cninfo', '4'))
+        self.assertEqual(router.shards(), ['hkexnews_2019'])
+        with self.assertRaises(sqlite3.OperationalError):
+            corpus.sql_conn.execute("INSERT INTO shard_0.filing_content (exchange, filing_id) "
+                "VALUES ('hkexnews', '9')")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import hashlib
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import pandas as pd
+from .._dedup import DuplicateIndex, _mersenne_prime, jaccard, shingles
+from .._store import FilingStore
+from ..cninfo.cninfo import CNInfo
+from ..utils import config
+from .fixtures import ScraperTestCase, StubSession, make_pdf
+
+random.seed(0)
+words = [f"word{i}" for i in range(2000)]
+report = " ".join(random.choice(words) for _ in range(3000))
+other_report = " ".join(random.choice(words) for _ in range(3000))
+# a few tokens changed
+revised = " ".join(word if random.random() > 0.005 else "revised"
+    for word in report.split())
+
+
+class TestShingles(unittest.TestCase):
+    def test_tokens(self):
+        self.assertEqual(shingles("Annual, REPORT 2020", k=2).count(b"annual report"), 1)
+        # CJK characters are tokens of their own
+        self.assertEqual(sorted(shingles("年度报告", k=3)), [b"\xe5\xb9\xb4 \xe5\xba\xa6 \xe6\x8a\xa5",
+            "度 报 告".encode('utf-8')])
+        self.assertEqual(shingles("short", k=5), [b"short"])
+        self.assertEqual(shingles(" - ", k=5), [])
+
+    def test_jaccard(self):
+        self.assertEqual(jaccard("a b c d", "a b c d", k=2), 1.)
+        self.assertEqual(jaccard("a b c", "b c d", k=2), 1 / 3)
+        self.assertEqual(jaccard("a b c", "", k=2), 0.)
+
+
+class TestDuplicateIndex(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        FilingStore(self.conn).insert_filings([
+            ('hkexnews', '1', '01398', 'ICBC', None, '2020-03-01 00:00:00', 'Annual Report 2019', None, 1),
+            ('hkexnews', '2', '01398', 'icbc', None, '2020-03-10 00:00:00', 'Revised Annual Report', None, 1),
+            # the A share of the same issuer, listed in Chinese
+            ('cninfo', '3', '601398', '工商银行', None, '2020-03-05', '2019年年度报告', None, 1),
+            ('hkexnews', '4', '01398', 'ICBC', None, '2021-03-01 00:00:00', 'Annual Report 2020', None, 1),
+            ('hkexnews', '5', '00011', 'HANG SENG BANK', None, '2020-03-01 00:00:00', 'Results', None, 1),
+            ('cninfo', '6', '601398', '工商银行', None, '2020-08-30', '2020年半年度报告', None, 1)])
+        self.index = DuplicateIndex(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_signature_does_not_overflow(self):
+        a, b = self.index.permutations
+        self.assertTrue((a < _mersenne_prime).all() and (b < _mersenne_prime).all())
+        text = "one two three four five six seven"
+        expected = [min((int(a_i) * int.from_bytes(hashlib.blake2b(value,
+            digest_size=4).digest(), 'little') + int(b_i)) % _mersenne_prime
+            for value in shingles(text)) for a_i, b_i in zip(a, b)]
+        self.assertEqual(self.index.signature(text).tolist(), expected)
+        # the same in chunks
+        self.assertEqual(self.index.signature(report, chunk_size=100).tolist(),
+            self.index.signature(report).tolist())
+        self.assertIsNone(self.index.signature(""))
+
+    def test_similarity_estimates_jaccard(self):
+        signature = self.index.signature(report)
+        self.assertEqual(self.index.similarity(signature, signature), 1.)
+        self.assertAlmostEqual(self.index.similarity(signature,
+            self.index.signature(revised)), jaccard(report, revised), delta=0.1)
+        self.assertLess(self.index.similarity(signature,
+            self.index.signature(other_report)), 0.1)
+
+    def test_candidates_need_related_metadata(self):
+        signature = self.index.signature(report)
+        for exchange, filing_id in (('hkexnews', '4'), ('cninfo', '6')):
+            self.index.add(exchange, filing_id, signature)
+        self.index.add('hkexnews', '5', self.index.signature(revised))
+        # same text, but a year apart, another issuer or another exchange
+        # half a year apart
+        self.assertIsNone(self.index.find(signature, 'hkexnews', '1'))
+        self.index.add('hkexnews', '1', signature)
+        # same ticker, 9 days later
+        exchange, filing_id, similarity = self.index.find(signature, 'hkexnews', '2')
+        self.assertEqual((exchange, filing_id, similarity), ('hkexnews', '1', 1.))
+        # the dual listing: no name in common, 4 days later. Anything on the
+        # other exchange within the window is a candidate, the best one wins
+        self.assertEqual(self.index.find(signature, 'cninfo', '3')[:2], ('hkexnews', '1'))
+        # never listed
+        self.assertIsNone(self.index.find(signature, 'hkexnews', '9'))
+        self.assertIsNone(self.index.find(self.index.signature(other_report), 'hkexnews', '2'))
+
+    def test_check(self):
+        self.assertIsNone(self.index.check('hkexnews', '1', report))
+        self.assertEqual(self.index.check('hkexnews', '2', revised), ('hkexnews', '1'))
+        self.assertEqual(self.index.duplicate_of('hkexnews', '2'), ('hkexnews', '1'))
+        self.assertEqual(self.index.check('hkexnews', '2', other_report), ('hkexnews', '1'))
+
+    def test_unconfirmed_matches_are_originals(self):
+        calls = []
+        def confirm(exchange, filing_id):
+            calls.append((exchange, filing_id))
+            return False
+        self.index.check('hkexnews', '1', report)
+        self.assertIsNone(self.index.check('cninfo', '3', report, confirm=confirm))
+        self.assertEqual(calls, [('hkexnews', '1')])
+        self.assertIsNone(self.index.duplicate_of('cninfo', '3'))
+        # indexed as an original instead
+        self.assertEqual(self.index.find(self.index.signature(report), 'hkexnews', '1'),
+            ('cninfo', '3', 1.))
+
+
+
+class TestDualListings(ScraperTestCase):
+    def test_a_share_report_links_to_the_h_share_one(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        db_path = os.path.join(directory, 'filings.db')
+        pdf = make_pdf(4, pad=10, typed=True, text=" ".join(report.split()[:40]) + " {i}")
+        session = StubSession({'http://hk/1.pdf': pdf, 'http://cn/3.pdf': pdf})
+        hkex = self.make_scraper(session=session, db_path=db_path,
+            config=config(dedup=True))
+        cninfo = self.make_scraper(CNInfo, session=session, db_path=db_path,
+            config=config(dedup=True))
+        hkex.store.insert_filings([
+            ('hkexnews', '1', '01398', 'ICBC', None, '2020-03-01 00:00:00', 'Annual Report 2019', None, 1),
+            ('cninfo', '3', '601398', '工商银行', None, '2020-03-05', '2019年年度报告', None, 1)])
+        original, = hkex._iter_content(pd.DataFrame([dict(news_id='1', url='http://hk/1.pdf')]),
+            'news_id', convert_to_text=True)
+        self.assertIsNotNone(original['filing_content'])
+        duplicate, = cninfo._iter_content(pd.DataFrame([dict(id='3', url='http://cn/3.pdf')]),
+            'id', convert_to_text=True)
+        self.assertEqual(duplicate['duplicate_of'], ('hkexnews', '1'))
+        self.assertIsNone(duplicate['filing_content'])
+
+
+    def test_pdfs_are_told_apart_like_to_text_does(self):
+        scraper = self.make_scraper(config=config(dedup=True))
+        pdf = b"\r\n " + make_pdf(4, pad=10, typed=True)
+        self.assertTrue(scraper.is_pdf(pdf))
+        self.assertFalse(scraper.is_pdf("<html>%PDF</html>"))
+        self.assertIn("Page 3 text", scraper.to_text(pdf))
+        probe = scraper._dedup_text(pdf, 1)
+        self.assertIn("Page 0 text", probe)
+        self.assertNotIn("Page 1 text", probe)
+
+
+if __name__ == '__main__':
+    unittest.main()
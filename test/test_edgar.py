@@ -0,0 +1,91 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+from ..edgar.sec_edgar import SECEdgar
+from .fixtures import ScraperTestCase
+
+
+def recent(*filings):
+    """columnar filings, as the submissions files hold them"""
+    return dict(accessionNumber=[f[0] for f in filings], filingDate=[f[1] for f in filings],
+        form=[f[2] for f in filings], primaryDocument=[f"{f[0]}.htm" for f in filings],
+        primaryDocDescription=[f[2] for f in filings], size=[1000] * len(filings))
+
+
+submissions = {
+    'CIK0000000001.json': dict(cik='1', tickers=['AAA'], name='A Co', filings=dict(recent=recent(
+        ('0000000001-20-000001', '2020-03-01', '10-K'),
+        ('0000000001-20-000002', '2020-05-01', '10-Q'),
+        ('0000000001-20-000003', '2020-06-01', '8-K')))),
+    # older filings of CIK 1, without company details
+    'CIK0000000001-submissions-001.json': recent(
+        ('0000000001-10-000001', '2010-03-01', '10-K'),
+        ('0000000001-10-000002', '2010-05-01', '10-Q')),
+    'CIK0000000002.json': dict(cik='2', tickers=[], name='B Co', filings=dict(recent=recent(
+        ('0000000002-20-000001', '2020-03-02', '10-K')))),
+    'CIK0000000003.json': None, # truncated
+}
+
+
+class TestBulkSubmissions(ScraperTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.zip_path = os.path.join(directory, 'submissions.zip')
+        with zipfile.ZipFile(self.zip_path, 'w') as zf:
+            for name, submission in submissions.items():
+                zf.writestr(name, '{"cik": ' if submission is None else json.dumps(submission))
+            zf.writestr('README.txt', 'not a submission')
+        self.scraper = self.make_scraper(SECEdgar)
+
+    def rows(self):
+        return self.scraper.sql_conn.execute("""SELECT filing_id, ticker, issuer, doctype
+            FROM filings ORDER BY filing_id""").fetchall()
+
+    def test_rows(self):
+        self.assertEqual(self.scraper.load_bulk_submissions(self.zip_path), 6)
+        rows = self.rows()
+        self.assertEqual(len(rows), 6)
+        # overflow files take the company of their main file
+        self.assertIn(('0000000001-10-000001', 'AAA', 'A Co', '10-K'), rows)
+        # no ticker, the CIK stands in
+        self.assertIn(('0000000002-20-000001', '2', 'B Co', '10-K'), rows)
+        url, = self.scraper.sql_conn.execute("""SELECT url FROM filings
+            WHERE filing_id = '0000000001-20-000001'""").fetchone()
+        self.assertEqual(url, 'https://www.sec.gov/Archives/edgar/data/1/'
+            '000000000120000001/0000000001-20-000001.htm')
+
+    def test_forms(self):
+        self.assertEqual(self.scraper.load_bulk_submissions(self.zip_path, forms=['10-K']), 3)
+        self.assertEqual({row[3] for row in self.rows()}, {'10-K'})
+
+    def test_batching(self):
+        statements = []
+        self.scraper.sql_conn.set_trace_callback(statements.append)
+        with mock.patch.object(self.scraper.store, 'insert_filings',
+            wraps=self.scraper.store.insert_filings) as insert:
+            self.scraper.load_bulk_submissions(self.zip_path, chunk_size=1, batch_size=2)
+        self.scraper.sql_conn.set_trace_callback(None)
+        # a transaction per batch: 2 + 2 + 1 rows of CIK 1, 1 of CIK 2
+        self.assertEqual(sum(statement == 'COMMIT' for statement in statements), 4)
+        # a chunk per CIK, the overflow file with its main one
+        self.assertEqual([len(call[0][0]) for call in insert.call_args_list], [5, 1, 0])
+        self.assertEqual({call[0][1] for call in insert.call_args_list}, {2})
+        self.assertEqual(len(self.rows()), 6)
+
+    def test_worker_processes_are_spawned(self):
+        with mock.patch('multiprocessing.get_context',
+            wraps=multiprocessing.get_context) as get_context:
+            self.assertEqual(self.scraper.load_bulk_submissions(self.zip_path,
+                max_workers=2, chunk_size=1), 6)
+        get_context.assert_called_with('spawn')
+        self.assertEqual(len(self.rows()), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from .._Abstract_scraper import AbstractScraper
+from .._extraction_cache import ExtractionCache
+from .fixtures import make_pdf
+
+
+class TestExtractionCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = ExtractionCache(os.path.join(self.dir, 'cache.db'))
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.dir)
+
+    def test_pdf_to_text_round_trip(self):
+        pdf = make_pdf(3, pad=10, typed=True)
+        text = AbstractScraper.pdf_to_text(pdf, cache=self.cache)
+        self.assertIn("Page 2 text", text)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+        with mock.patch.object(AbstractScraper, '_pages_to_text') as parse:
+            self.assertEqual(AbstractScraper.pdf_to_text(pdf, cache=self.cache), text)
+        parse.assert_not_called()
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        # other options, other entries
+        first = AbstractScraper.pdf_to_text(pdf, cache=self.cache, max_pages=1)
+        self.assertIn("Page 0 text", first)
+        self.assertNotIn("Page 1 text", first)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_least_recently_used_are_evicted(self):
+        keys = [ExtractionCache.make_key(str(i), 'pdf', '1') for i in range(3)]
+        self.cache.put(keys[0], "zero")
+        self.cache.max_bytes = self.cache._size() * 2 # room for two entries
+        self.cache.put(keys[1], "one")
+        self.assertEqual(self.cache.get(keys[0]), "zero") # now the most recent
+        self.cache.put(keys[2], "two")
+        self.assertIsNone(self.cache.get(keys[1]))
+        self.assertEqual(self.cache.get(keys[0]), "zero")
+        self.assertEqual(self.cache.get(keys[2]), "two")
+        self.assertLessEqual(self.cache._size(), self.cache.max_bytes)
+
+    def test_keys(self):
+        key = ExtractionCache.make_key(b"doc", 'pdf', '2', keep_chinese=False)
+        self.assertEqual(key, ExtractionCache.make_key("doc", 'pdf', '2', keep_chinese=False))
+        self.assertNotEqual(key, ExtractionCache.make_key(b"doc", 'pdf', '3', keep_chinese=False))
+        self.assertNotEqual(key, ExtractionCache.make_key(b"doc", 'pdf', '2', keep_chinese=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
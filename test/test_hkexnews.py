@@ -0,0 +1,32 @@
+import datetime as dt
+import json
+import unittest
+from .fixtures import ScraperTestCase, StubSession
+
+prefix_url = "https://www1.hkexnews.hk/search/prefix.do"
+
+
+def prefix(code: str, name: str) -> str:
+    stock = dict(stockId=1, code=code, name=name)
+    return f"callback({json.dumps(dict(more='0', stockInfo=[stock]))});\n"
+
+
+class TestTicker(ScraperTestCase):
+    def test_names_on_a_new_database(self):
+        scraper = self.make_scraper(session=StubSession({prefix_url: prefix('00700', 'TENCENT')}))
+        self.assertEqual(scraper._ticker('Tencent'), '00700')
+        self.assertEqual(scraper._ticker('700'), '00700')
+        self.assertFalse(scraper.is_downloaded('Tencent', dt.date(2020, 1, 1),
+            dt.date(2020, 12, 31)))
+        self.assertEqual(len(scraper.session.requests), 2)
+
+    def test_listed_names_come_from_the_store(self):
+        scraper = self.make_scraper()
+        scraper.store.insert_filings([('hkexnews', '1', '00005', 'HSBC HOLDINGS',
+            None, '2020-03-01 00:00:00', None, None, 1)])
+        self.assertEqual(scraper._ticker('hsbc holdings'), '00005')
+        self.assertEqual(scraper.session.requests, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
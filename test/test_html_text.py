@@ -0,0 +1,31 @@
+import unittest
+from .._html_text import html_to_text
+
+
+class TestHTMLToText(unittest.TestCase):
+    def test_space_between_inline_elements(self):
+        self.assertEqual(html_to_text('<span>Hello</span> <span>World</span>'),
+            'Hello World')
+
+    def test_adjacent_ixbrl_figures(self):
+        text = html_to_text('<ix:nonFraction>1,234</ix:nonFraction> '
+            '<ix:nonFraction>5,678</ix:nonFraction>')
+        self.assertEqual(text.split(), ['1,234', '5,678'])
+
+    def test_layout_whitespace_is_collapsed(self):
+        html = ("<table>\n <tr>\n  <td> a </td>\n  <td>b</td>\n </tr>\n"
+            " <tr><td>c</td><td>d</td></tr></table>\n<div>\n  text  <b>bold</b>\n</div>")
+        self.assertEqual(html_to_text(html), "a\tb\nc\td\ntext bold")
+
+    def test_hidden_blocks_are_dropped(self):
+        html = ('<html><head><title>t</title></head><body><ix:header>hidden'
+            '</ix:header><div style="display: none">gone</div><p>shown</p></body></html>')
+        self.assertEqual(html_to_text(html), 'shown')
+
+    def test_chunked_bytes(self):
+        html = ('<p>café ' + 'x' * 50 + '</p>').encode('utf-8')
+        self.assertEqual(html_to_text(html, chunk_size=7), 'café ' + 'x' * 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
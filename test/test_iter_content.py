@@ -0,0 +1,110 @@
+import unittest
+from unittest import mock
+import pandas as pd
+from .fixtures import ScraperTestCase, StubSession, make_pdf
+
+pdfs = {f"http://host/{i}.pdf": make_pdf(2, pad=10, typed=True, text=f"Filing {i} page {{i}}")
+    for i in range(3)}
+
+
+def filing_list(n: int=3) -> pd.DataFrame:
+    return pd.DataFrame([dict(news_id=str(i), url=f"http://host/{i}.pdf")
+        for i in range(n)])
+
+
+class TestIterContent(ScraperTestCase):
+    def test_filings_are_saved_as_they_go(self):
+        scraper = self.make_scraper(session=StubSession(pdfs))
+        records = scraper._iter_content(filing_list(), 'news_id')
+        first = next(records)
+        self.assertEqual(first['filing_content'], pdfs["http://host/0.pdf"])
+        # saved before the next one is downloaded
+        self.assertEqual(scraper.store.get_content('hkexnews', '0'), (first['filing_content'], None))
+        self.assertEqual(scraper.session.requests, ["http://host/0.pdf"])
+        self.assertEqual([record['news_id'] for record in records], ['1', '2'])
+        self.assertEqual(scraper.store.get_content('hkexnews', '2')[0], pdfs["http://host/2.pdf"])
+
+    def test_stored_filings_aren_t_downloaded_again(self):
+        scraper = self.make_scraper(session=StubSession(pdfs))
+        list(scraper._iter_content(filing_list(2), 'news_id'))
+        scraper.session.requests.clear()
+        records = list(scraper._iter_content(filing_list(), 'news_id'))
+        self.assertEqual(scraper.session.requests, ["http://host/2.pdf"])
+        self.assertEqual([record['filing_content'] for record in records], list(pdfs.values()))
+        # a bad payload stored before validation existed is fetched again
+        scraper.store.insert_content('hkexnews', '0', b"<html>busy</html>")
+        list(scraper._iter_content(filing_list(1), 'news_id'))
+        self.assertEqual(scraper.store.get_content('hkexnews', '0')[0], pdfs["http://host/0.pdf"])
+
+    def test_text_is_converted_once(self):
+        scraper = self.make_scraper(session=StubSession(pdfs))
+        records = list(scraper._iter_content(filing_list(1), 'news_id', convert_to_text=True))
+        self.assertIn("Filing 0 page 1", records[0]['filing_content'])
+        content, text = scraper.store.get_content('hkexnews', '0')
+        self.assertEqual((content, text), (pdfs["http://host/0.pdf"], records[0]['filing_content']))
+        with mock.patch.object(scraper, 'convert') as convert:
+            again = list(scraper._iter_content(filing_list(1), 'news_id', convert_to_text=True))
+        convert.assert_not_called()
+        self.assertEqual(again[0]['filing_content'], text)
+
+    def test_without_saving(self):
+        scraper = self.make_scraper(session=StubSession(pdfs))
+        self.assertEqual(len(list(scraper._iter_content(filing_list(), 'news_id',
+            save_to_sql=False))), 3)
+        self.assertIsNone(scraper.store.get_content('hkexnews', '0'))
+
+    def test_batches(self):
+        scraper = self.make_scraper(session=StubSession(pdfs))
+        batches = list(scraper._iter_content(filing_list(), 'news_id', batch_size=2))
+        self.assertEqual([[record['news_id'] for record in batch] for batch in batches],
+            [['0', '1'], ['2']])
+
+    def test_failures(self):
+        missing = dict(pdfs)
+        del missing["http://host/1.pdf"] # 404, won't get better
+        scraper = self.make_scraper(session=StubSession(missing))
+        records = list(scraper._iter_content(filing_list(), 'news_id', ignore_errors=True))
+        self.assertEqual([record['news_id'] for record in records], ['0', '2'])
+        self.assertEqual([row[:2] for row in scraper.store.quarantined()], [('hkexnews', '1')])
+        scraper.session.responses["http://host/9.pdf"] = ValueError("boom")
+        with self.assertRaises(ValueError):
+            list(scraper._iter_content(pd.DataFrame([dict(news_id='9',
+                url="http://host/9.pdf")]), 'news_id'))
+
+    def test_retries_back_off(self):
+        answers = [b"", b"", pdfs["http://host/0.pdf"]] # empty payloads are retryable
+        scraper = self.make_scraper(session=StubSession({"http://host/0.pdf":
+            lambda url, kwargs: answers.pop(0)}))
+        with mock.patch('time.sleep') as sleep:
+            records = list(scraper._iter_content(filing_list(1), 'news_id'))
+        self.assertEqual(records[0]['filing_content'], pdfs["http://host/0.pdf"])
+        # the only filing left waits like download_filing does
+        self.assertEqual(len(scraper.session.requests), 3)
+        delays = [call[0][0] for call in sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        for delay, expected in zip(delays, (scraper.retry_delay(1), scraper.retry_delay(2))):
+            self.assertAlmostEqual(delay, expected, delta=0.5)
+        # the others go first, and never past the attempts allowed
+        answers[:] = [b""] * 3
+        scraper.session.responses["http://host/1.pdf"] = pdfs["http://host/1.pdf"]
+        scraper.session.requests.clear()
+        with mock.patch('time.sleep'):
+            records = list(scraper._iter_content(pd.DataFrame([dict(news_id='9',
+                url="http://host/0.pdf"), dict(news_id='1', url="http://host/1.pdf")]),
+                'news_id', ignore_errors=True))
+        self.assertEqual([record['news_id'] for record in records], ['1'])
+        self.assertEqual(scraper.session.requests, ["http://host/0.pdf", "http://host/1.pdf",
+            "http://host/0.pdf", "http://host/0.pdf"])
+        self.assertEqual([row[:2] for row in scraper.store.quarantined()], [('hkexnews', '9')])
+
+    def test_iter_filing_content(self):
+        scraper = self.make_scraper(session=StubSession(pdfs))
+        with mock.patch.object(scraper, 'get_filing_list', return_value=filing_list()) as listing:
+            batches = list(scraper.iter_filing_content('00005', batch_size=2))
+        self.assertEqual(listing.call_args[0][0], '00005')
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+        self.assertEqual(scraper.store.get_content('hkexnews', '1')[0], pdfs["http://host/1.pdf"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import json
+import sqlite3
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from .._breaker import CircuitOpenError
+from .._live import AdaptiveInterval, ConditionalGet, SeenFilings
+from ..utils import config
+from .fixtures import Response, ScraperTestCase, StubSession, make_pdf
+
+
+def listing(*news_ids, extension='htm'):
+    return {'newsInfoLst': [{'newsId': news_id, 'stock': [{'sc': '00700', 'sn': 'TENCENT'}],
+        'title': f'announcement {news_id}', 'relTime': '19/10/2026 10:00',
+        'webPath': f'/listedco/{news_id}.{extension}', 'size': '10KB', 'lTxt': 'Announcements'}
+        for news_id in news_ids]}
+
+
+class ListingServer(ThreadingHTTPServer):
+    """serves self.body with an ETag derived from it, answering 304 when
+    the client already has it"""
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), ListingHandler)
+        self.body = listing()
+        self.requests = []
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/latest.json"
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class ListingHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps(self.server.body).encode()
+        etag = f'"{hash(body) & 0xffffffff:x}"'
+        self.server.requests.append(self.headers.get('If-None-Match'))
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestConditionalGet(unittest.TestCase):
+    def setUp(self):
+        self.server = ListingServer()
+        self.session = requests.Session()
+
+    def tearDown(self):
+        self.session.close()
+        self.server.close()
+
+    def test_validators_only_count_once_committed(self):
+        get = ConditionalGet(self.session, self.server.url)
+        self.assertIsNotNone(get.get())
+        # not committed, e.g. the poll failed: the listing comes again
+        self.assertIsNotNone(get.get())
+        get.commit()
+        self.assertIsNone(get.get())
+        self.assertEqual(self.server.requests[:2], [None, None])
+        self.assertIsNotNone(self.server.requests[2])
+        self.server.body = listing(1)
+        self.assertEqual(get.get().json(), listing(1))
+
+
+class TestPollLatest(ScraperTestCase):
+    def setUp(self):
+        self.server = ListingServer()
+        self.addCleanup(self.server.close)
+        self.session = requests.Session()
+        self.addCleanup(self.session.close)
+        self.scraper = self.make_scraper(session=self.session)
+        self.scraper.latest_filings_url = self.server.url
+
+    def test_new_filings_once(self):
+        self.server.body = listing(1, 2)
+        self.assertEqual(self.scraper.poll_latest().news_id.tolist(), ['1', '2'])
+        self.assertTrue(self.scraper.poll_latest().empty) # 304
+        self.server.body = listing(3, 2, 1)
+        self.assertEqual(self.scraper.poll_latest().news_id.tolist(), ['3'])
+        self.assertEqual(self.scraper.store.count('hkexnews'), 3)
+
+    def test_failed_poll_is_fetched_again(self):
+        self.server.body = listing(1)
+        record_filings = self.scraper._record_filings
+        def fail(*args):
+            raise sqlite3.OperationalError("database is locked")
+        self.scraper._record_filings = fail
+        with self.assertRaises(sqlite3.OperationalError):
+            self.scraper.poll_latest()
+        self.scraper._record_filings = record_filings
+        self.assertEqual(self.scraper.poll_latest().news_id.tolist(), ['1'])
+
+
+class TestWatch(ScraperTestCase):
+    def setUp(self):
+        self.pdf = make_pdf(1, pad=10, typed=True)
+        self.paused = True
+        def latest(url, kwargs): # 304 once the client has the etag
+            if kwargs['headers'].get('If-None-Match') == '"1"':
+                return Response(status_code=304)
+            return Response(listing(1, 2, 3, extension='pdf'), headers={'ETag': '"1"'})
+        def filing_2(url, kwargs):
+            if self.paused:
+                return CircuitOpenError('www1.hkexnews.hk/*.pdf', time.monotonic() + 30)
+            return self.pdf
+        self.session = StubSession({'http://host/latest.json': latest,
+            'https://www1.hkexnews.hk/listedco/1.pdf': self.pdf,
+            'https://www1.hkexnews.hk/listedco/2.pdf': filing_2})
+        # 3.pdf is a 404, which won't get better
+        self.scraper = self.make_scraper(session=self.session,
+            config=config(max_deferrals=0))
+        self.scraper.latest_filings_url = 'http://host/latest.json'
+
+    def test_skipped_filings_come_back(self):
+        filings = []
+        self.assertEqual(self.scraper.watch(on_filing=filings.append, max_polls=1), 1)
+        self.assertEqual([filing['news_id'] for filing in filings], ['1'])
+        self.assertEqual([row[1] for row in self.scraper.store.quarantined()], ['3'])
+        # the paused endpoint only delayed filing 2
+        self.paused = False
+        self.assertEqual(self.scraper.watch(on_filing=filings.append, max_polls=1), 1)
+        self.assertEqual([filing['news_id'] for filing in filings], ['1', '2'])
+        # everything handed over or quarantined, the listing is committed
+        self.assertEqual(self.scraper.watch(on_filing=filings.append, max_polls=1), 0)
+        self.assertEqual(self.session.requests[-1], 'http://host/latest.json')
+        self.assertEqual(self.scraper._latest.etag, '"1"')
+
+    def test_a_failed_delivery_does_not_end_the_watch(self):
+        def fail(filing):
+            raise ValueError("consumer down")
+        self.paused = False
+        self.assertEqual(self.scraper.watch(on_filing=fail, max_polls=2, min_interval=0.01), 0)
+        filings = []
+        self.assertEqual(self.scraper.watch(on_filing=filings.append, max_polls=1), 2)
+
+
+class TestSeenFilings(unittest.TestCase):
+    def test_new_survives_a_restart(self):
+        conn = sqlite3.connect(':memory:')
+        seen = SeenFilings(conn, 'hkexnews')
+        self.assertEqual(seen.new(['1', '2', '1']), ['1', '2'])
+        seen.add(['1'])
+        self.assertEqual(SeenFilings(conn, 'hkexnews').new(['2', '1']), ['2'])
+        self.assertEqual(SeenFilings(conn, 'cninfo').new(['1']), ['1'])
+
+
+class TestAdaptiveInterval(unittest.TestCase):
+    def test_backs_off_while_quiet(self):
+        interval = AdaptiveInterval(2, 5, backoff=2)
+        self.assertEqual([interval.update(False) for _ in range(3)], [4, 5, 5])
+        self.assertEqual(interval.update(True), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
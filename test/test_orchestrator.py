@@ -0,0 +1,112 @@
+import datetime as dt
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from .. import orchestrator
+from ..cninfo.cninfo import CNInfo
+from ..hkex.hkexnews import HKEXNews
+
+
+class TestRunJobsFile(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        with open(os.path.join(self.dir, 'hkstocklist.txt'), 'w') as f:
+            f.write("00005\n\n00700\n")
+        self.jobs_path = os.path.join(self.dir, 'jobs.json')
+        with open(self.jobs_path, 'w') as f:
+            json.dump({"convert_workers": 2, "jobs": [
+                {"exchange": "hkexnews", "stocks_path": os.path.join(self.dir, 'hkstocklist.txt'),
+                 "doctype": "annual_report", "start_date": "20190101", "end_date": "2019-12-31",
+                 "max_workers": 3, "requests_per_second": 5, "bytes_per_second": 4000000,
+                 "convert_to_text": True, "db_path": "hk.db"},
+                {"exchange": "cninfo", "stock_list": ["000001", 600000],
+                 "max_workers": 2, "requests_per_second": 2, "circuit_breaker": False}]}, f)
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def stub(self, exchange):
+        """a batch_download recording its arguments, converting on the pool"""
+        def batch_download(stock_list, **kwargs):
+            pool = kwargs['convert_pool']
+            with self.lock:
+                self.calls[exchange] = dict(kwargs, stock_list=stock_list,
+                    pid=pool.submit(os.getpid).result())
+            return dict(done=len(stock_list))
+        return batch_download
+
+    def run_jobs_file(self, **kwargs):
+        with mock.patch.object(HKEXNews, 'batch_download', side_effect=self.stub('hkexnews')), \
+            mock.patch.object(CNInfo, 'batch_download', side_effect=self.stub('cninfo')):
+            return orchestrator.run_jobs_file(self.jobs_path, **kwargs)
+
+    def test_jobs(self):
+        summaries = self.run_jobs_file()
+        self.assertEqual(summaries['hkexnews']['result'], dict(done=2))
+        self.assertEqual(summaries['cninfo']['result'], dict(done=2))
+        hk, cn = self.calls['hkexnews'], self.calls['cninfo']
+        self.assertEqual(hk['stock_list'], ['00005', '00700'])
+        self.assertEqual(cn['stock_list'], ['000001', '600000'])
+        self.assertEqual((hk['start_date'], hk['end_date']),
+            (dt.date(2019, 1, 1), dt.date(2019, 12, 31)))
+        self.assertEqual((hk['doctype'], hk['max_workers'], hk['db_path']),
+            ('annual_report', 3, 'hk.db'))
+        self.assertTrue(hk['convert_to_text'] and hk['schedule'])
+        # defaults
+        self.assertEqual((cn['doctype'], cn['start_date'], cn['end_date']),
+            ('all', dt.date(2015, 12, 31), dt.date.today()))
+        self.assertNotIn('db_path', cn)
+
+    def test_budgets_are_per_job(self):
+        self.run_jobs_file()
+        hk, cn = self.calls['hkexnews']['session'], self.calls['cninfo']['session']
+        self.assertIsNot(hk, cn)
+        hk, cn = hk.get_adapter('https://'), cn.get_adapter('https://')
+        self.assertEqual((hk.request_bucket.rate, hk.byte_bucket.rate), (5, 4000000))
+        self.assertEqual(cn.request_bucket.rate, 2)
+        self.assertIsNone(cn.byte_bucket)
+        # breakers are on unless a job turns them off
+        self.assertIsNotNone(hk.endpoints)
+        self.assertIsNone(cn.endpoints)
+        self.assertEqual(hk.poolmanager.connection_pool_kw['maxsize'], 3)
+
+    def test_one_spawned_pool_shared_by_the_jobs(self):
+        self.run_jobs_file()
+        pool = self.calls['hkexnews']['convert_pool']
+        self.assertIs(self.calls['cninfo']['convert_pool'], pool)
+        self.assertEqual(pool._mp_context.get_start_method(), 'spawn')
+        self.assertNotEqual(self.calls['hkexnews']['pid'], os.getpid())
+        with self.assertRaises(RuntimeError): # shut down after the run
+            pool.submit(os.getpid)
+
+    def test_convert_workers_override(self):
+        with mock.patch.object(orchestrator, 'ProcessPoolExecutor') as pool:
+            pool.return_value.submit.return_value.result.return_value = 0
+            self.run_jobs_file(convert_workers=1)
+        self.assertEqual(pool.call_args[0][0], 1)
+
+    def test_a_failing_job_does_not_stop_the_other(self):
+        with open(self.jobs_path) as f:
+            spec = json.load(f)
+        spec['jobs'][0]['stocks_path'] = os.path.join(self.dir, 'missing.txt')
+        spec['convert_workers'] = 0
+        with open(self.jobs_path, 'w') as f:
+            json.dump(spec, f)
+        with mock.patch.object(CNInfo, 'batch_download', return_value=dict(done=2)):
+            summaries = orchestrator.run_jobs_file(self.jobs_path)
+        self.assertIn('FileNotFoundError', summaries['hkexnews']['error'])
+        self.assertEqual(summaries['cninfo']['result'], dict(done=2))
+
+    def test_job_names(self):
+        with self.assertRaises(ValueError):
+            orchestrator.run_jobs([dict(exchange='cninfo'), dict(exchange='cninfo')])
+        with self.assertRaises(ValueError):
+            orchestrator.run_job(dict(exchange='nyse'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import re
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from .._Abstract_scraper import AbstractScraper
+from .._ranged import RangeFile
+from .._validation import InvalidDocumentError
+from .fixtures import make_pdf
+
+
+class PdfServer(ThreadingHTTPServer):
+    """serves self.body, honouring Range headers if self.ranges"""
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), RangeHandler)
+        self.body = b""
+        self.ranges = True
+        self.content_type = 'application/pdf'
+        self.requests = []
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def url(self, path='/report.pdf'):
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = self.server.body
+        byte_range = self.headers.get('Range')
+        self.server.requests.append(byte_range)
+        match = re.match(r"bytes=(\d*)-(\d*)$", byte_range or '')
+        if match and self.server.ranges:
+            start, end = match.groups()
+            if not start: # suffix range, the last bytes
+                start, end = max(len(body) - int(end), 0), len(body) - 1
+            else:
+                start, end = int(start), min(int(end or len(body) - 1), len(body) - 1)
+            body = body[start:end + 1]
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{end}/{len(self.server.body)}")
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', self.server.content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestRangeFile(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pdf = make_pdf(40)
+
+    def setUp(self):
+        self.server = PdfServer()
+        self.server.body = self.pdf
+        self.session = requests.Session()
+
+    def tearDown(self):
+        self.session.close()
+        self.server.close()
+
+    def test_reads_like_the_file(self):
+        file = RangeFile(self.session, self.server.url(), block_size=4096)
+        self.assertTrue(file.ranged)
+        self.assertEqual(file.size, len(self.pdf))
+        for offset, length in ((0, 10), (5000, 10000), (len(self.pdf) - 100, 1000)):
+            file.seek(offset)
+            self.assertEqual(file.read(length), self.pdf[offset:offset + length])
+        file.seek(-10, 2)
+        self.assertEqual(file.read(), self.pdf[-10:])
+
+    def test_first_pages_fetch_little(self):
+        text = AbstractScraper.get_pdf_pages_text(self.server.url(), max_pages=6,
+            session=self.session, block_size=4096)
+        for i in range(6):
+            self.assertIn(f"Page {i} text", text)
+        self.assertNotIn("Page 6 text", text)
+        self.assertTrue(all(self.server.requests))
+        # the padding between the pages read is skipped over
+        fetched = sum(int(end) - int(start or 0) for start, end in
+            (re.match(r"bytes=(\d*)-(\d*)", r).groups() for r in self.server.requests))
+        self.assertLess(fetched, len(self.pdf) / 10)
+
+    def test_without_range_support(self):
+        self.server.ranges = False
+        file = RangeFile(self.session, self.server.url())
+        self.assertFalse(file.ranged)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(file.read(), self.pdf)
+        text = AbstractScraper.get_pdf_pages_text(self.server.url(), max_pages=2,
+            session=self.session)
+        self.assertIn("Page 1 text", text)
+
+    def test_validation(self):
+        self.server.body = b"<html>" + self.pdf[6:]
+        with self.assertRaises(InvalidDocumentError) as cm:
+            RangeFile(self.session, self.server.url(), block_size=4096)
+        self.assertEqual(cm.exception.reason, "html page instead of a pdf")
+        RangeFile(self.session, self.server.url(), block_size=4096, validate=False)
+        self.server.body = self.pdf[:-1000]
+        with self.assertRaises(InvalidDocumentError) as cm:
+            RangeFile(self.session, self.server.url(), block_size=4096)
+        self.assertTrue(cm.exception.retryable)
+        self.server.body, self.server.content_type = self.pdf, 'text/html'
+        with self.assertRaises(InvalidDocumentError):
+            RangeFile(self.session, self.server.url(), block_size=4096)
+        with self.assertRaises(AssertionError):
+            AbstractScraper.get_pdf_pages_text(self.server.url('/report.htm'),
+                session=self.session)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import datetime as dt
+import sqlite3
+import time
+import unittest
+from .._breaker import CircuitOpenError
+from .._scheduler import Task, estimate_costs, filing_cost, run_largest_first, \
+    request_cost, default_filing_size, default_filing_count
+from .._store import FilingStore
+
+
+class TestCosts(unittest.TestCase):
+    def test_filing_cost_of_unknown_sizes(self):
+        self.assertEqual(filing_cost(1000), 1000 + request_cost)
+        for size in (None, float('nan'), 0):
+            self.assertEqual(filing_cost(size, 500), 500 + request_cost)
+
+    def test_estimate_costs(self):
+        store = FilingStore(sqlite3.connect(':memory:'))
+        store.insert_filings([
+            ('x', '1', 'A', None, None, '2020-03-01', None, None, 1000),
+            ('x', '2', 'A', None, None, '2020-04-01', None, None, 3000),
+            ('x', '3', 'B', None, None, '2020-04-01', None, None, 2000),
+            ('x', '4', 'A', None, None, '2019-04-01', None, None, 5000)])
+        store.insert_labels([('x', '1', 'annual_report')])
+        store.insert_content('x', '2', b'downloaded')
+        start, end = dt.date(2020, 1, 1), dt.date(2020, 12, 31)
+        costs = estimate_costs(store, 'x', ['A', 'B', 'C'], start, end)
+        self.assertEqual(costs['A'], 1000 + request_cost)
+        self.assertEqual(costs['B'], 2000 + request_cost)
+        # never listed, taken at the typical size of the exchange's filings
+        self.assertEqual(costs['C'], default_filing_count * filing_cost(2750))
+        # B has no filing labelled annual_report, as if never listed for it
+        costs = estimate_costs(store, 'x', ['A', 'B'], start, end, 'annual_report')
+        self.assertEqual(costs, dict(A=1000 + request_cost,
+            B=default_filing_count * filing_cost(2750)))
+
+    def test_estimate_costs_of_an_empty_store(self):
+        store = FilingStore(sqlite3.connect(':memory:'))
+        costs = estimate_costs(store, 'x', ['A'], dt.date(2020, 1, 1), dt.date(2020, 12, 31))
+        self.assertEqual(costs, dict(A=default_filing_count * filing_cost(default_filing_size)))
+
+
+class TestRunLargestFirst(unittest.TestCase):
+    def test_largest_first_with_follow_ups(self):
+        order = []
+        def handle(task):
+            order.append(task.key)
+            if task.key == 'b': # listed, its filings join the queue
+                return [Task(5, 'b1'), Task(1, 'b2')]
+        stats = run_largest_first([Task(1, 'a'), Task(10, 'b'), Task(3, 'c')], handle)
+        self.assertEqual(order, ['b', 'b1', 'c', 'a', 'b2'])
+        self.assertEqual((stats['done'], stats['failed'], stats['deferred']), (5, 0, 0))
+
+    def test_errors(self):
+        def handle(task):
+            if task.key == 'bad':
+                raise ValueError(task.key)
+        stats = run_largest_first([Task(2, 'bad'), Task(1, 'ok')], handle,
+            max_workers=2, ignore_errors=True)
+        self.assertEqual((stats['done'], stats['failed']), (1, 1))
+        self.assertEqual(len(stats['busy']), 2)
+        with self.assertRaises(ValueError):
+            run_largest_first([Task(2, 'bad'), Task(1, 'ok')], handle)
+
+    def test_paused_endpoint_defers_the_task(self):
+        order, calls = [], {}
+        def handle(task):
+            calls[task.key] = calls.get(task.key, 0) + 1
+            if task.key == 'paused' and calls[task.key] == 1:
+                raise CircuitOpenError('host/path', time.monotonic() + 0.05)
+            order.append((task.key, time.monotonic()))
+        start = time.monotonic()
+        stats = run_largest_first([Task(10, 'paused'), Task(1, 'a'), Task(2, 'b')], handle)
+        # the other tasks go ahead, the paused one runs once its endpoint reopens
+        self.assertEqual([key for key, _ in order], ['b', 'a', 'paused'])
+        self.assertGreaterEqual(order[-1][1] - start, 0.05)
+        self.assertEqual((stats['done'], stats['failed'], stats['deferred']), (3, 0, 1))
+
+    def test_deferrals_run_out(self):
+        def handle(task):
+            raise CircuitOpenError('host/path', time.monotonic())
+        stats = run_largest_first([Task(1, 'a')], handle, ignore_errors=True,
+            max_deferrals=2)
+        self.assertEqual((stats['done'], stats['failed'], stats['deferred']), (0, 1, 2))
+        with self.assertRaises(CircuitOpenError):
+            run_largest_first([Task(1, 'a')], handle, max_deferrals=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
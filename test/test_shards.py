@@ -0,0 +1,155 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import zlib
+from unittest import mock
+from .. import _shards
+from .._shards import ShardRouter, ShardedFilingStore
+from .._store import FilingStore
+
+filings = [
+    ('hkexnews', '1', '00005', None, None, '2019-03-01 00:00:00', None, None, 1),
+    ('hkexnews', '2', '00005', None, None, '2020-03-01 00:00:00', None, None, 1),
+    ('cninfo', '3', '000001', None, None, '2020-04-01 00:00:00', None, None, 1)]
+
+
+class TestShardRouter(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_exchange_year(self):
+        router = ShardRouter(self.dir)
+        self.assertEqual(router.shard('hkexnews', '00005', '2020-03-01 00:00:00'), 'hkexnews_2020')
+        self.assertEqual(router.shard('hkexnews', '00005', None), 'hkexnews_unknown')
+        self.assertEqual(router.path('hkexnews_2020'),
+            os.path.join(self.dir, 'content_hkexnews_2020.db'))
+
+    def test_ticker_hash_is_stable(self):
+        router = ShardRouter(self.dir, scheme='ticker_hash', n_buckets=4)
+        shards = {router.shard('cninfo', str(ticker), None) for ticker in range(100)}
+        self.assertEqual(shards, {f'cninfo_{i:02d}' for i in range(4)})
+        # crc32, the same in every process
+        self.assertEqual(router.shard('cninfo', '000001', None),
+            f"cninfo_{zlib.crc32(b'000001') % 4:02d}")
+        self.assertEqual(router.shard('cninfo', None, None), 'cninfo_unknown')
+
+    def test_unknown_scheme(self):
+        with self.assertRaises(ValueError):
+            ShardRouter(self.dir, scheme='by_month')
+
+    def test_shards_and_fan_out(self):
+        router = ShardRouter(self.dir)
+        self.assertEqual(router.shards(), [])
+        self.assertEqual(router.fan_out("SELECT 1"), [])
+        for shard, n in (('a_2020', 1), ('b_2021', 2)):
+            conn = sqlite3.connect(router.path(shard))
+            conn.execute("CREATE TABLE t (x)")
+            conn.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(n)])
+            conn.commit()
+            conn.close()
+        open(os.path.join(self.dir, 'other.db'), 'w').close()
+        self.assertEqual(router.shards(), ['a_2020', 'b_2021'])
+        self.assertEqual(sorted(router.fan_out("SELECT x FROM t WHERE x >= ?", (0,))),
+            [(0,), (0,), (1,)])
+
+
+class TestShardedFilingStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db = os.path.join(self.dir, 'catalog.db')
+        self.conn = sqlite3.connect(self.db)
+        self.router = ShardRouter(os.path.join(self.dir, 'shards'))
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.dir)
+
+    def store(self):
+        store = ShardedFilingStore(self.conn, self.router)
+        store.insert_filings(filings)
+        self.addCleanup(store.close)
+        return store
+
+    def flags(self, store):
+        return sorted(self.conn.execute(f"""SELECT exchange, filing_id, has_content,
+            has_text FROM {store.content_relation()}""").fetchall())
+
+    def test_content_goes_to_its_shard(self):
+        store = self.store()
+        store.insert_content('hkexnews', '1', b'pdf 1')
+        store.insert_content('hkexnews', '2', b'pdf 2', 'text 2')
+        store.insert_content('cninfo', '3', text='text 3')
+        self.assertEqual(self.router.shards(), ['cninfo_2020', 'hkexnews_2019', 'hkexnews_2020'])
+        self.assertEqual(store.get_content('hkexnews', '2'), (b'pdf 2', 'text 2'))
+        self.assertIsNone(store.get_content('hkexnews', '9'))
+        # the catalog only has the metadata
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM main.filing_content").fetchone()[0], 0)
+        shard = sqlite3.connect(self.router.path('hkexnews_2019'))
+        self.assertEqual(shard.execute("SELECT filing_id, content FROM filing_content").fetchall(),
+            [('1', b'pdf 1')])
+        shard.close()
+        self.assertEqual(store.content_conn('cninfo', '3').execute("""SELECT text
+            FROM filing_content WHERE filing_id = '3'""").fetchone(), ('text 3',))
+        self.assertEqual(self.flags(store), [('cninfo', '3', 0, 1),
+            ('hkexnews', '1', 1, 0), ('hkexnews', '2', 1, 1)])
+
+    def test_content_saved_before_sharding(self):
+        plain = FilingStore(self.conn)
+        plain.insert_filings(filings)
+        plain.insert_content('hkexnews', '1', b'old pdf')
+        store = self.store()
+        self.assertEqual(store.get_content('hkexnews', '1'), (b'old pdf', None))
+        self.assertIs(store.content_conn('hkexnews', '1'), self.conn)
+        self.assertEqual(self.flags(store), [('hkexnews', '1', 1, 0)])
+        # saving it again moves it to its shard
+        store.insert_content('hkexnews', '1', b'old pdf', 'text')
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM main.filing_content").fetchone()[0], 0)
+        self.assertEqual(store.get_content('hkexnews', '1'), (b'old pdf', 'text'))
+        self.assertIsNot(store.content_conn('hkexnews', '1'), self.conn)
+
+    def test_more_shards_than_can_be_attached(self):
+        store = self.store()
+        for exchange, filing_id, *_ in filings:
+            store.insert_content(exchange, filing_id, b'pdf')
+        attached = self.flags(store)
+        with mock.patch.object(_shards, 'max_attached', 1):
+            self.assertEqual(store.content_relation(), 'filing_content_flags')
+            self.assertEqual(self.flags(store), attached)
+
+    def test_fan_out_is_kept_between_calls(self):
+        store = self.store()
+        for exchange, filing_id, *_ in filings:
+            store.insert_content(exchange, filing_id, b'pdf')
+        with mock.patch.object(_shards, 'max_attached', 1), \
+            mock.patch.object(self.router, 'fan_out', wraps=self.router.fan_out) as fan_out:
+            self.flags(store)
+            self.assertEqual(fan_out.call_count, 1)
+            self.flags(store)
+            # our own writes update the table in place
+            store.insert_content('hkexnews', '2', b'pdf', 'text')
+            self.assertIn(('hkexnews', '2', 1, 1), self.flags(store))
+            self.assertEqual(fan_out.call_count, 1)
+            # another connection's write refreshes only its shard
+            other = FilingStore(sqlite3.connect(self.router.path('hkexnews_2019')))
+            other.insert_content('hkexnews', '1', b'pdf', 'text')
+            other.sql_conn.close()
+            self.assertIn(('hkexnews', '1', 1, 1), self.flags(store))
+            self.assertEqual(fan_out.call_args[1]['shards'], ['hkexnews_2019'])
+            self.assertEqual(len(self.flags(store)), 3)
+
+    def test_shard_sizes_and_vacuum(self):
+        store = self.store()
+        store.insert_content('hkexnews', '1', b'x' * 100000)
+        store.insert_content('hkexnews', '1', b'pdf')
+        before = store.shard_sizes()['hkexnews_2019']
+        store.vacuum()
+        self.assertLess(store.shard_sizes()['hkexnews_2019'], before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from .._transport import BudgetedAdapter, Endpoints, TokenBucket
+
+body = bytes(range(256)) * 400
+
+
+class BodyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        if self.path == '/chunked': # no Content-Length
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for start in range(0, len(body), 10000):
+                chunk = body[start:start + 10000]
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if self.path == '/slow':
+                try:
+                    for start in range(0, len(body), 10000):
+                        self.wfile.write(body[start:start + 10000])
+                        self.wfile.flush()
+                        time.sleep(0.02)
+                except OSError: # cut by the client
+                    pass
+            else:
+                self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Recorder:
+    def __init__(self):
+        self.taken = []
+
+    def take(self, amount=1):
+        self.taken.append(amount)
+        return 0.
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_waits_for_tokens(self):
+        bucket = TokenBucket(100, capacity=10)
+        self.assertEqual(bucket.take(10), 0.)
+        self.assertAlmostEqual(bucket.take(5), 0.05, delta=0.02)
+
+    def test_large_amounts_go_into_debt(self):
+        bucket = TokenBucket(1000, capacity=10)
+        start = time.monotonic()
+        bucket.take(10)
+        self.assertAlmostEqual(bucket.take(50), 0.05, delta=0.02)
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+
+
+class TestBudgetedAdapter(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), BodyHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.adapter = BudgetedAdapter(bytes_per_second=1 << 30)
+        self.adapter.byte_bucket = Recorder()
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_bytes_are_charged_as_read(self):
+        for path in ('/sized', '/chunked'):
+            self.adapter.byte_bucket.taken.clear()
+            self.assertEqual(self.session.get(self.url + path).content, body)
+            self.assertEqual(sum(self.adapter.byte_bucket.taken), len(body), path)
+            self.assertGreater(len(self.adapter.byte_bucket.taken), 1, path)
+
+    def test_streamed_bodies(self):
+        res = self.session.get(self.url + '/chunked', stream=True)
+        self.assertEqual(self.adapter.byte_bucket.taken, [])
+        self.assertEqual(b"".join(res.iter_content(4096)), body)
+        self.assertEqual(sum(self.adapter.byte_bucket.taken), len(body))
+
+    def test_request_rate(self):
+        adapter = BudgetedAdapter(requests_per_second=20)
+        adapter.request_bucket.tokens = 0
+        self.session.mount('http://', adapter)
+        start = time.monotonic()
+        for _ in range(2):
+            self.session.get(self.url + '/sized').content
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_transfer_rates_are_recorded(self):
+        self.adapter.endpoints = Endpoints()
+        endpoint = self.adapter.endpoints.get(self.url + '/sized')
+        self.session.get(self.url + '/chunked').content # size unknown
+        self.assertEqual(len(endpoint.rates), 0)
+        self.assertEqual(self.session.get(self.url + '/sized').content, body)
+        self.assertEqual(len(endpoint.rates), 1)
+        self.assertEqual(sum(self.adapter.byte_bucket.taken), 2 * len(body))
+
+    def test_slow_bodies_miss_their_deadline(self):
+        self.adapter.endpoints = Endpoints(min_samples=1, min_timeout=0.05)
+        endpoint = self.adapter.endpoints.get(self.url + '/slow')
+        endpoint.record_transfer(len(body), 0.001)
+        with self.assertRaises(requests.ConnectionError):
+            self.session.get(self.url + '/slow')
+        self.assertEqual(endpoint.failures, 1)
+        # the slower rate is counted, the next deadline is longer
+        self.assertEqual(len(endpoint.rates), 2)
+        self.assertGreater(endpoint.deadline(len(body)), 0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import copy
+import pickle
+import sys
+import threading
+import unittest
+from ..utils import LazyModule
+
+
+class TestLazyModule(unittest.TestCase):
+    def setUp(self):
+        self.module = LazyModule('json')
+
+    def test_loads_on_first_attribute(self):
+        self.assertIsNone(self.module._module)
+        self.assertIn('not loaded', repr(self.module))
+        self.assertEqual(self.module.dumps([1]), '[1]')
+        self.assertIs(self.module._module, sys.modules['json'])
+        self.assertIn("'json' (loaded)", repr(self.module))
+        with self.assertRaises(AttributeError):
+            self.module.no_such_function
+
+    def test_forwards_the_module_dunders(self):
+        import json
+        self.assertEqual(self.module.__version__, json.__version__)
+        self.assertEqual(self.module.__file__, json.__file__)
+        self.assertEqual(self.module.__all__, json.__all__)
+
+    def test_probing_doesnt_load(self):
+        self.assertFalse(hasattr(self.module, '__path__'))
+        self.assertFalse(hasattr(self.module, '__wrapped__'))
+        self.assertEqual(self.module.__name__, 'json')
+        # like any module, without importing it to find out
+        with self.assertRaises(TypeError):
+            copy.copy(self.module)
+        with self.assertRaises(TypeError):
+            pickle.dumps(self.module)
+        self.assertIsNone(self.module._module)
+
+    def test_one_import_across_threads(self):
+        module = LazyModule('colorsys')
+        loaded = []
+        def load():
+            loaded.append(module._load())
+        threads = [threading.Thread(target=load) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len({id(m) for m in loaded}), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
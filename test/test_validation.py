@@ -0,0 +1,73 @@
+import unittest
+from types import SimpleNamespace
+from .._validation import InvalidDocumentError, check_pdf, check_response, is_valid_pdf
+
+pdf = b"%PDF-1.4\n" + b"x" * 5000 + b"\n%%EOF\n"
+
+
+def response(content=pdf, status_code=200, **headers):
+    headers = {k.replace('_', '-'): v for k, v in headers.items()}
+    return SimpleNamespace(content=content, status_code=status_code, headers=headers)
+
+
+class TestCheckPdf(unittest.TestCase):
+    def assertInvalid(self, content, retryable):
+        with self.assertRaises(InvalidDocumentError) as cm:
+            check_pdf(content)
+        self.assertEqual(cm.exception.retryable, retryable)
+        self.assertFalse(is_valid_pdf(content))
+        return cm.exception
+
+    def test_valid(self):
+        check_pdf(pdf)
+        self.assertTrue(is_valid_pdf(pdf))
+        self.assertTrue(is_valid_pdf(bytearray(pdf)))
+
+    def test_empty(self):
+        self.assertInvalid(None, True)
+        self.assertInvalid(b"", True)
+
+    def test_html_interstitial_is_retryable(self):
+        error = self.assertInvalid(b"  <!DOCTYPE html><html>Too many requests</html>", True)
+        self.assertEqual(error.reason, "html page instead of a pdf")
+
+    def test_not_a_pdf(self):
+        self.assertInvalid(b"PK\x03\x04 a zip file", False)
+
+    def test_truncated(self):
+        error = self.assertInvalid(pdf[:-10] + b"x" * 4000, True)
+        self.assertIn("truncated", error.reason)
+        self.assertIsNotNone(error.content)
+
+
+class TestCheckResponse(unittest.TestCase):
+    def test_valid(self):
+        self.assertEqual(check_response(response(Content_Type='application/pdf',
+            Content_Length=str(len(pdf)))), pdf)
+        self.assertEqual(check_response(response()), pdf)
+
+    def test_status(self):
+        for status, retryable in ((503, True), (429, True), (404, False)):
+            with self.assertRaises(InvalidDocumentError) as cm:
+                check_response(response(status_code=status))
+            self.assertEqual(cm.exception.retryable, retryable)
+
+    def test_content_type(self):
+        with self.assertRaises(InvalidDocumentError) as cm:
+            check_response(response(Content_Type='text/html; charset=utf-8'))
+        self.assertTrue(cm.exception.retryable)
+        with self.assertRaises(InvalidDocumentError) as cm:
+            check_response(response(Content_Type='image/png'))
+        self.assertFalse(cm.exception.retryable)
+
+    def test_content_length(self):
+        with self.assertRaises(InvalidDocumentError) as cm:
+            check_response(response(Content_Length=str(len(pdf) + 100)))
+        self.assertTrue(cm.exception.retryable)
+        # with an encoding the header counts the compressed bytes
+        self.assertEqual(check_response(response(Content_Length='100',
+            Content_Encoding='gzip')), pdf)
+
+
+if __name__ == '__main__':
+    unittest.main()
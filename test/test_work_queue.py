@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from .._work_queue import SQLiteWorkQueue, run_worker
+
+
+class TestSQLiteWorkQueue(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'queue.db')
+        self.queue = SQLiteWorkQueue(self.path, lease_seconds=60, max_attempts=2)
+
+    def tearDown(self):
+        self.queue.sql_conn.close()
+        shutil.rmtree(self.dir)
+
+    def test_put_skips_queued_items(self):
+        self.assertEqual(self.queue.put(['1', '2', ' '], dict(doctype='a')), 2)
+        self.assertEqual(self.queue.put(['2', '3'], dict(doctype='a')), 1)
+        # the same item for another job is a new item
+        self.assertEqual(self.queue.put(['1'], dict(doctype='b')), 1)
+        self.assertEqual(self.queue.counts(), dict(pending=4))
+
+    def test_lease_is_exclusive_and_by_priority(self):
+        self.queue.put(['low'])
+        self.queue.put(['high'], priority=1)
+        # a second connection to the file, like another process
+        other = SQLiteWorkQueue(self.path, lease_seconds=60)
+        try:
+            first = self.queue.lease('w1')
+            second = other.lease('w2')
+            self.assertEqual((first.item, second.item), ('high', 'low'))
+            self.assertIsNone(self.queue.lease('w3'))
+        finally:
+            other.sql_conn.close()
+        self.assertEqual(self.queue.counts(), dict(leased=2))
+
+    def test_expired_lease_goes_to_another_worker(self):
+        self.queue.put(['1'], dict(doctype='a'))
+        self.queue.lease_seconds = 0.05
+        lost = self.queue.lease('w1')
+        time.sleep(0.1)
+        self.queue.lease_seconds = 60
+        taken = self.queue.lease('w2')
+        self.assertEqual((taken.item, taken.payload, taken.attempts),
+            ('1', dict(doctype='a'), 2))
+        # the first worker's lease is gone, it can't extend or complete it
+        self.assertFalse(self.queue.heartbeat(lost))
+        self.queue.complete(lost)
+        self.assertEqual(self.queue.counts(), dict(leased=1))
+        self.assertTrue(self.queue.heartbeat(taken))
+        self.queue.complete(taken)
+        self.assertEqual(self.queue.counts(), dict(done=1))
+
+    def test_failed_items_are_retried_until_out_of_attempts(self):
+        self.queue.put(['1'])
+        self.queue.fail(self.queue.lease('w1'), 'boom')
+        self.assertEqual(self.queue.counts(), dict(pending=1))
+        self.queue.fail(self.queue.lease('w1'), 'boom')
+        self.assertEqual(self.queue.counts(), dict(failed=1))
+        self.assertIsNone(self.queue.lease('w1'))
+
+    def test_expired_lease_out_of_attempts_fails(self):
+        self.queue.put(['1'])
+        self.queue.fail(self.queue.lease('w1'), 'boom')
+        self.queue.lease_seconds = 0.05
+        self.queue.lease('w1')
+        time.sleep(0.1)
+        self.assertIsNone(self.queue.lease('w2'))
+        self.assertEqual(self.queue.counts(), dict(failed=1))
+
+
+class TestRunWorker(unittest.TestCase):
+    def test_handles_every_item_and_retries_failures(self):
+        with tempfile.TemporaryDirectory() as folder:
+            queue = SQLiteWorkQueue(os.path.join(folder, 'queue.db'), max_attempts=2)
+            try:
+                queue.put(['a', 'b', 'c'], dict(doctype='x'))
+                seen = []
+                def handle(item, payload):
+                    seen.append((item, payload['doctype']))
+                    if item == 'b' and seen.count(('b', 'x')) == 1:
+                        raise RuntimeError("first try fails")
+                self.assertEqual(run_worker(queue, handle, worker_id='w'), 3)
+                self.assertEqual(sorted(seen), [('a', 'x'), ('b', 'x'), ('b', 'x'), ('c', 'x')])
+                self.assertEqual(queue.counts(), dict(done=3))
+            finally:
+                queue.sql_conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,10 +2,12 @@
 """Utilities class"""
 
 from typing import Union, Optional, List, Dict, Any
-from types import SimpleNamespace
+from types import SimpleNamespace, ModuleType
+import importlib
 import itertools
+import threading
 
-__all__ = ['has_method', 'config']
+__all__ = ['has_method', 'config', 'LazyModule']
 
 
 def has_method(obj: Any, method: str, default: Any):
@@ -32,6 +34,41 @@ def iter_by_chunk(iterable: Any, chunk_size: int):
             break
         yield chunk
 
+_unloaded_dunders = frozenset(('__path__', '__wrapped__', '__mro_entries__',
+    '__class_getitem__', '__fspath__', '__copy__', '__deepcopy__', '__reduce__',
+    '__reduce_ex__', '__getstate__', '__setstate__', '__getnewargs__',
+    '__getnewargs_ex__', '__getinitargs__'))
+
+class LazyModule(ModuleType):
+    """Stand-in for a module that is only imported on first attribute access.
+    Use it for heavy dependencies that only some code paths need, e.g.
+    `pd = LazyModule('pandas')` at the top of a module. Thread safe, so it can
+    be shared by the download threads."""
+    _lock = threading.Lock()
+
+    def __init__(self, name: str):
+        super(LazyModule, self).__init__(name)
+        self._module = None
+
+    def _load(self) -> ModuleType:
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self.__name__)
+        return self._module
+
+    def __getattr__(self, attr: str):
+        # looked up by the import machinery, copy, pickle and inspect on
+        # anything they're handed: answering them shouldn't import the module.
+        # Other dunders (__version__, __file__, __all__) are the module's own
+        if attr in _unloaded_dunders:
+            raise AttributeError(attr)
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module '{self.__name__}' ({state})>"
+
 class config(SimpleNamespace):
     def __init__(self, *args, **kwargs):
         super(config, self).__init__(*args, **kwargs)